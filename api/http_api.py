@@ -0,0 +1,267 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import time
+from urllib.parse import urlparse, parse_qsl
+from business import FUZZY_FIELDS, DEFAULT_LIMIT
+from exceptions import BusinessLogicException
+from logging_config import get_logger, query_context
+import metrics
+
+"""
+This module contains a small local http/json front end for the AirportSearchService, so other programs can search the
+airport data without the gui. Every request is handled on its own thread, and all of them search the same loaded
+dataset.
+
+Endpoints:
+----------
+    GET /search?<param>=<value>&...:
+        searches with the same parameters as AirportSearchBuilder, e.g. /search?iata_code=FRA or
+        /search?latitude=50&longitude=8&nearest=5 or /search?min_elevation=5000&max_elevation=6000
+    GET /suggest?q=<text>[&limit=<n>][&field=airport_name|city_name]:
+        fuzzy, accent-insensitive name search, the closest matches first with the number of edits each one took
+    GET /routes?from=<airport>[&to=<airport>][&hops=<n>]:
+        route queries, airports given by IATA code, ICAO code or id: the direct destinations from an airport (with the
+        airlines that fly there), the way to another airport with the fewest flights (in at most `hops` flights), or
+        with just `hops` every airport that can be reached in that many flights
+    GET /status:
+        whether the data is loaded, how many airports there are and the search result cache's counters
+    GET /metrics:
+        the application's metrics (stage timings, rows scanned and matched, cache hits) in the Prometheus text format
+    GET /metrics.json:
+        the same metrics as a json snapshot, with the cache hit ratios worked out
+    GET /profile?<param>=<value>&...:
+        runs one search under cProfile and returns the profile report as text
+    POST /refresh:
+        revalidates the data (downloading it again if it has changed)
+
+Methods:
+--------
+    create_server(search_service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        creates an http server that answers requests from the given search service
+    serve(search_service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        loads the data and serves requests until interrupted
+
+Classes:
+--------
+    AirportRequestHandler:
+        turns http requests into calls on the search service and its results into json
+
+Constants:
+----------
+    DEFAULT_HOST: the address the server listens on (local only)
+    DEFAULT_PORT: the port the server listens on
+"""
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+logger = get_logger(__name__)
+
+
+class AirportRequestHandler(BaseHTTPRequestHandler):
+    search_service = None
+    started = None
+
+    def handle_one_request(self):
+        # every record logged while a request is answered carries its query id
+        with query_context():
+            self.started = time.perf_counter()
+            super().handle_one_request()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/search':
+            self.search(dict(parse_qsl(url.query)))
+        elif url.path == '/suggest':
+            self.suggest(dict(parse_qsl(url.query)))
+        elif url.path == '/routes':
+            self.routes(dict(parse_qsl(url.query)))
+        elif url.path == '/metrics':
+            self.send_text(200, metrics.prometheus_text(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif url.path == '/metrics.json':
+            self.send_json(200, metrics.snapshot())
+        elif url.path == '/profile':
+            self.profile(dict(parse_qsl(url.query)))
+        elif url.path == '/status':
+            service = self.search_service
+            self.send_json(200, {'loaded': service.is_loaded(), 'airports': len(service),
+                                 'result_cache': service.cache_stats()})
+        else:
+            self.send_json(404, {'error': f'Unknown path: {url.path}'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/refresh':
+            self.send_json(404, {'error': f'Unknown path: {url.path}'})
+            return
+        try:
+            dataset = self.search_service.load(refresh=True)
+        except BusinessLogicException as e:
+            self.send_json(503, {'error': str(e)})
+            return
+        self.send_json(200, {'loaded': True, 'airports': len(dataset)})
+
+    def search(self, params):
+        """
+        answers a search request
+        :param params: dict of search parameters from the query string
+        :return: n/a
+        """
+        if not params:
+            self.send_json(400, {'error': 'You must use at least 1 parameter'})
+            return
+        try:
+            self.search_service.ensure_loaded()
+            results = self.search_service.search_ranked(params)
+        except BusinessLogicException as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        with metrics.span('render', view='http'):
+            records = []
+            for distance, airport in results:
+                record = airport.as_dict()
+                if distance is not None:
+                    record['distance_km'] = round(distance, 3)
+                records.append(record)
+            self.send_json(200, {'count': len(records), 'results': records})
+        metrics.increment('rows_rendered_total', len(records), view='http')
+
+    def suggest(self, params):
+        """
+        answers a fuzzy name search
+        :param params: dict of 'q' and optionally 'limit' and 'field' from the query string
+        :return: n/a
+        """
+        if not params.get('q'):
+            self.send_json(400, {'error': 'A suggestion needs some text to match'})
+            return
+        try:
+            limit = int(params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            self.send_json(400, {'error': f"Invalid limit: {params['limit']}"})
+            return
+        fields = (params['field'],) if 'field' in params else tuple(FUZZY_FIELDS)
+        try:
+            self.search_service.ensure_loaded()
+            results = self.search_service.fuzzy_search(params['q'], limit, fields)
+        except BusinessLogicException as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        records = [dict(airport.as_dict(), edits=distance) for distance, airport in results]
+        self.send_json(200, {'count': len(records), 'results': records})
+
+    def routes(self, params):
+        """
+        answers a route query
+        :param params: dict of 'from' and optionally 'to' and 'hops' from the query string
+        :return: n/a
+        """
+        if 'from' not in params:
+            self.send_json(400, {'error': 'A route query needs an airport to start from'})
+            return
+        try:
+            max_hops = int(params['hops']) if 'hops' in params else None
+        except ValueError:
+            self.send_json(400, {'error': f"Invalid number of hops: {params['hops']}"})
+            return
+        source = params['from']
+        service = self.search_service
+        try:
+            if 'to' in params:
+                records = [airport.as_dict() for airport in service.route(source, params['to'], max_hops)]
+            elif max_hops is not None:
+                records = [dict(airport.as_dict(), hops=hops) for hops, airport in service.reachable(source, max_hops)]
+            else:
+                origin = service.find_airport(source).airport_id
+                records = [dict(airport.as_dict(), airlines=[{'code': code, 'name': name} for code, name in
+                                                             service.airlines(origin, airport.airport_id)])
+                           for airport in service.destinations(source)]
+        except BusinessLogicException as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        body = {'count': len(records), 'results': records}
+        if 'to' in params:
+            body['flights'] = max(0, len(records) - 1)
+        self.send_json(200, body)
+
+    def profile(self, params):
+        """
+        runs one search under cProfile and answers with the report
+        :param params: dict of search parameters from the query string
+        :return: n/a
+        """
+        if not params:
+            self.send_json(400, {'error': 'You must use at least 1 parameter'})
+            return
+        try:
+            results, report = self.search_service.profile_search(params)
+        except BusinessLogicException as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_text(200, f'{len(results)} results\n\n{report}')
+
+    def send_json(self, status, body):
+        """
+        writes a json response
+        :param status: http status code
+        :param body: object to send as json
+        :return: n/a
+        """
+        content = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_text(self, status, text, content_type='text/plain; charset=utf-8'):
+        """
+        writes a plain text response
+        :param status: http status code
+        :param text: the body
+        :param content_type: the Content-Type of the body
+        :return: n/a
+        """
+        content = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        extra = {'duration_ms': round((time.perf_counter() - self.started) * 1000, 3)} if self.started else None
+        logger.info(f'{self.address_string()} - {format % args}', extra=extra)
+
+
+def create_server(search_service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    creates an http server that answers requests from the given search service
+    :param search_service: the AirportSearchService to search
+    :param host: address to listen on
+    :param port: port to listen on (0 for any free port)
+    :return: a ThreadingHTTPServer, call serve_forever() on it to start answering requests
+    """
+    handler = type('BoundAirportRequestHandler', (AirportRequestHandler,), {'search_service': search_service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(search_service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    loads the data and serves requests until interrupted
+    :param search_service: the AirportSearchService to search
+    :param host: address to listen on
+    :param port: port to listen on
+    :return: n/a
+    """
+    search_service.ensure_loaded()
+    server = create_server(search_service, host, port)
+    logger.info(f'Serving airport searches on http://{host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        search_service.shutdown()
@@ -0,0 +1,52 @@
+import argparse
+import json
+import sys
+from business import AirportSearchService, read_queries
+from exceptions import BusinessLogicException
+from logging_config import query_context
+
+"""
+Command line entry point for batch searches, e.g. resolving every airport code and city on a flight manifest. The
+searches are read from a file (json lines, csv with a header row of parameter names, or one code or city per line) and
+evaluated together against the cached airport data, and one json line of results is written per search, in order.
+
+usage: python batch.py queries.jsonl [--field iata_code] [--limit 1] [--output results.jsonl]
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate many airport searches in one pass')
+    parser.add_argument('queries', help='file of searches: .jsonl/.json, .csv, or one value per line')
+    parser.add_argument('--field', help='search parameter of the values in a one value per line file (guessed from '
+                                        'each value if not given: IATA code, ICAO code or city name)')
+    parser.add_argument('--limit', type=int, help='the most results to write per search')
+    parser.add_argument('--output', help='file to write the json lines to (stdout if not given)')
+    args = parser.parse_args(argv)
+    service = AirportSearchService()
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    searches = errors = 0
+    try:
+        with query_context():
+            for params, results, error in service.search_batch(read_queries(args.queries, args.field)):
+                searches += 1
+                line = {'query': params, 'count': len(results)}
+                if error is not None:
+                    errors += 1
+                    line['error'] = error
+                line['results'] = [dict(airport.as_dict(),
+                                        distance_km=None if distance is None else round(distance, 3))
+                                   for distance, airport in results[:args.limit]]
+                output.write(json.dumps(line, ensure_ascii=False) + '\n')
+    except BusinessLogicException as e:
+        print(f'Batch failed: {e}', file=sys.stderr)
+        return 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        service.shutdown()
+    print(f'{searches} searches, {errors} errors', file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+import sys
+import timeit
+from business import parse_line, parse_airport_data, to_float, to_int
+from models import Airport
+from benchmarks.fixtures import load_airports_dat, AWKWARD_AIRPORTS
+
+"""
+Micro-benchmark comparing the old per-line parser (a StringIO and csv.reader per line) with the bulk parser in
+business.parsing on the full airports.dat. The per-line path is timed twice, once leaving every field as a string like
+it used to, and once with the same numeric conversions the bulk parser does. The bulk parser is also timed on the same
+data ending with AWKWARD_AIRPORTS, which it can only parse by falling back to converting field by field.
+
+usage: python -m benchmarks.bench_parse [path/to/airports.dat]
+"""
+
+REPEATS = 5
+
+
+def per_line(data):
+    airport_list = []
+    for line in data.splitlines():
+        tokens = parse_line(line)
+        airport_list.append(Airport(tokens[0], tokens[1], tokens[2], tokens[3], tokens[4], tokens[5], tokens[6],
+                                    tokens[7], tokens[8], tokens[9], tokens[10]))
+    return airport_list
+
+
+def per_line_typed(data):
+    airport_list = []
+    for line in data.splitlines():
+        tokens = parse_line(line)
+        airport_list.append(Airport(to_int(tokens[0]), tokens[1], tokens[2], tokens[3], tokens[4], tokens[5],
+                                    to_float(tokens[6]), to_float(tokens[7]), to_int(tokens[8]), to_float(tokens[9]),
+                                    tokens[10]))
+    return airport_list
+
+
+def bulk(data):
+    return [Airport(*row) for row in parse_airport_data(data)]
+
+
+def main(path=None):
+    data = load_airports_dat(path)
+    print(f"{len(data.splitlines())} rows, {len(data)} bytes")
+    new = min(timeit.repeat(lambda: bulk(data), number=1, repeat=REPEATS))
+    for label, function in (('per-line parse (strings)', per_line), ('per-line parse (typed)', per_line_typed)):
+        old = min(timeit.repeat(lambda: function(data), number=1, repeat=REPEATS))
+        print(f"{label:26} {old * 1000:8.2f} ms  (bulk is {old / new:.1f}x faster)")
+    print(f"{'bulk parse (typed)':26} {new * 1000:8.2f} ms")
+    awkward = data.rstrip(b'\n') + b'\n' + '\n'.join(AWKWARD_AIRPORTS).encode('utf-8') + b'\n'
+    rows = parse_airport_data(awkward)
+    assert [row[1] for row in rows[-2:]] == ['Null Island,\\N Field', 'Quoted Numbers Airport']
+    assert rows[-1][6:10] == (44.5, -123.25, 210, -8.0)
+    fallback = min(timeit.repeat(lambda: bulk(awkward), number=1, repeat=REPEATS))
+    print(f"{'bulk parse (fallback)':26} {fallback * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,58 @@
+import sys
+import timeit
+from business import parse_airport_data, compile_query, AirportDataset
+from models import Airport, AirportTable
+from benchmarks.fixtures import load_airports_dat
+
+"""
+Benchmark comparing the old search path (Airport.check_for_match on every object in a list) with queries compiled once
+per search by business.query and run over an AirportTable, and with the same queries answered through the hash indexes
+of an AirportDataset, using multi-field queries.
+
+usage: python -m benchmarks.bench_query [path/to/airports.dat]
+"""
+
+REPEATS = 5
+QUERIES = [
+    {'country_name': 'United States', 'dst_area': 'US/Canada'},
+    {'airport_name': 'airport', 'country_name': 'Germany'},
+    {'utc_offset': '1', 'elevation': '500', 'dst_area': 'European'},
+    {'city_name': 'port', 'elevation': '1000', 'country_name': 'ALL'},
+    {'iata_code': 'gka', 'icao_code': 'ayga'},
+    {'iata_code': 'fra'},
+    {'airport_name': 'seaplane'},
+    {'city_name': 'reykjav'},
+    {'icao_code': 'eddf', 'country_name': 'Germany'},
+    {'airport_name': 'international', 'city_name': 'o', 'utc_offset': '-5', 'dst_area': 'US/Canada'},
+]
+
+
+def scan_objects(airport_list, params):
+    return [airport for airport in airport_list if airport.check_for_match(params)]
+
+
+def compiled(table, params):
+    return compile_query(params).select(table)
+
+
+def main(path=None):
+    rows = parse_airport_data(load_airports_dat(path))
+    airport_list = [Airport(*row) for row in rows]
+    table = AirportTable.from_rows(rows)
+    # build the uppercased columns before timing, they are kept for as long as the table doesn't change
+    compiled(table, {'airport_name': 'A', 'city_name': 'A', 'iata_code': 'A', 'icao_code': 'A'})
+    dataset = AirportDataset(table)
+    totals = [0, 0, 0]
+    print(f"{'matches':>7}  {'objects':>9}  {'compiled':>9}  {'indexed':>9}")
+    for params in QUERIES:
+        timings = [min(timeit.repeat(function, number=1, repeat=REPEATS)) for function in
+                   (lambda: scan_objects(airport_list, params), lambda: compiled(table, params),
+                    lambda: dataset.search(params))]
+        totals = [total + timing for total, timing in zip(totals, timings)]
+        matches = len(dataset.search(params))
+        print(f"{matches:7}  " + '  '.join(f"{timing * 1000:6.3f} ms" for timing in timings) + f"  {params}")
+    print(f"{'total':>7}  " + '  '.join(f"{total * 1000:6.3f} ms" for total in totals))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,52 @@
+import random
+import sys
+import time
+from business import RouteGraph, parse_routes_data
+from benchmarks.fixtures import load_routes_dat
+
+"""
+Benchmark of the route graph: parsing routes.dat, building the compressed sparse row arrays, and the three kinds of
+route query (direct destinations, fewest hops between two airports and reachability within a number of flights) from
+random airports, reported as p50/p99 latencies.
+
+usage: python -m benchmarks.bench_routes [path/to/routes.dat]
+"""
+
+QUERY_COUNT = 200
+REACHABLE_HOPS = (1, 2, 3)
+
+
+def _latencies(function, arguments):
+    samples = []
+    for args in arguments:
+        start = time.perf_counter()
+        function(*args)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000, samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000
+
+
+def main(path=None):
+    data = load_routes_dat(path)
+    start = time.perf_counter()
+    routes = parse_routes_data(data)
+    parsed = time.perf_counter()
+    graph = RouteGraph(routes)
+    built = time.perf_counter()
+    print(f"{len(routes)} routes: parse {(parsed - start) * 1000:.1f} ms, build {(built - parsed) * 1000:.1f} ms, "
+          f"{len(graph)} airports, {graph.route_count} distinct routes")
+    rand = random.Random(0)
+    airports = list(graph.airport_ids)
+    pairs = [(rand.choice(airports), rand.choice(airports)) for _ in range(QUERY_COUNT)]
+    print(f"{'query':28} {'p50':>10} {'p99':>10}")
+    timings = [('destinations', graph.destinations, [(source,) for source, _ in pairs]),
+               ('shortest_path', graph.shortest_path, pairs)]
+    timings += [(f'reachable ({hops} hops)', graph.reachable, [(source, hops) for source, _ in pairs])
+                for hops in REACHABLE_HOPS]
+    for name, function, arguments in timings:
+        p50, p99 = _latencies(function, arguments)
+        print(f"{name:28} {p50:7.3f} ms {p99:7.3f} ms")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
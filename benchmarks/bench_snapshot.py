@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import timeit
+from business import AirportDataset, parse_airport_data, save_snapshot, load_snapshot
+from models import AirportTable
+from benchmarks.fixtures import load_airports_dat
+from benchmarks.bench_query import QUERIES
+
+"""
+Benchmark comparing a cold start from airports.dat (parse, build the table, build the indexes) with loading the same
+dataset from a binary snapshot, and checking that both answer the benchmark queries the same way.
+
+usage: python -m benchmarks.bench_snapshot [path/to/airports.dat]
+"""
+
+REPEATS = 5
+SOURCE = {'size': 0, 'crc32': 0}
+
+
+def from_csv(data):
+    return AirportDataset(AirportTable.from_rows(parse_airport_data(data)))
+
+
+def main(path=None):
+    data = load_airports_dat(path)
+    dataset = from_csv(data)
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, 'airports.dat.snapshot')
+        write = min(timeit.repeat(lambda: save_snapshot(dataset, snapshot_path, SOURCE), number=1, repeat=REPEATS))
+        restored = load_snapshot(snapshot_path, SOURCE)
+        for params in QUERIES + [{'latitude': '50', 'longitude': '8', 'nearest': '10'}]:
+            assert restored.search(params) == dataset.search(params), params
+        csv = min(timeit.repeat(lambda: from_csv(data), number=1, repeat=REPEATS))
+        snapshot = min(timeit.repeat(lambda: load_snapshot(snapshot_path, SOURCE), number=1, repeat=REPEATS))
+        size = os.path.getsize(snapshot_path)
+    print(f"{len(dataset)} rows, {len(data)} byte csv, {size} byte snapshot")
+    print(f"{'cold start from csv':24} {csv * 1000:8.2f} ms")
+    print(f"{'cold start from snapshot':24} {snapshot * 1000:8.2f} ms  ({csv / snapshot:.1f}x faster)")
+    print(f"{'write snapshot':24} {write * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
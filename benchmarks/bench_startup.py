@@ -0,0 +1,92 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+"""
+Benchmark of application startup, measured in a fresh interpreter each run (so nothing is already imported) from the
+moment the process is started: how long until the application's modules are imported, until the window is first
+painted, and until the data is searchable. The data comes from a dataset cache in a temporary directory, both cold
+(only the cached airports.dat, which is parsed) and warm (with the snapshot the first start writes). Without a display
+the window can't be drawn, and the data is restored the way the window would restore it, headless.
+
+It also lists which of the modules that are slow to import (and only needed once the network is used or something is
+profiled) were imported at startup anyway.
+
+usage: python -m benchmarks.bench_startup [path/to/airports.dat]
+"""
+
+RUNS = 5
+# imported by the application only when it needs them
+DEFERRED_MODULES = ('requests', 'asyncio', 'pstats', 'cProfile')
+MILESTONES = ('import', 'first paint', 'searchable')
+
+
+def child(start):
+    # runs in the fresh interpreter, in the temporary directory: prints the milestones in ms since the process started
+    timings = {}
+    import gui
+    timings['import'] = _since(start)
+    try:
+        app = gui.AirportForm()
+    except gui.tk.TclError:
+        import business
+        service = business.AirportSearchService()
+        service.restore()
+        timings['searchable'] = _since(start)
+        service.shutdown()
+    else:
+        app.update()
+        timings['first paint'] = _since(start)
+        while not app.search_service.is_loaded():
+            app.update()
+            time.sleep(0.001)
+        timings['searchable'] = _since(start)
+        app.on_close()
+    timings['deferred imported'] = [name for name in DEFERRED_MODULES if name in sys.modules]
+    print(json.dumps(timings))
+
+
+def _since(start):
+    return (time.time() - start) * 1000
+
+
+def _start(directory):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (os.getcwd(), os.environ.get('PYTHONPATH')))))
+    start = time.time()
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_startup', '--child', str(start)], cwd=directory,
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main(path=None):
+    import dal
+    from business import URL
+    from benchmarks.fixtures import load_airports_dat
+    data = load_airports_dat(path)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = dal.DatasetCache(os.path.join(directory, dal.CACHE_DIR))
+        cache.store(URL, data, {})
+        snapshot = cache.snapshot_path(URL)
+        print(f"{'start':8} " + ' '.join(f"{milestone:>13}" for milestone in MILESTONES) + '  deferred modules imported')
+        for name in ('cold', 'warm'):
+            runs = []
+            for _ in range(RUNS):
+                if name == 'cold' and os.path.exists(snapshot):
+                    os.remove(snapshot)
+                runs.append(_start(directory))
+            cells = []
+            for milestone in MILESTONES:
+                samples = sorted(run[milestone] for run in runs if milestone in run)
+                cells.append(f"{samples[len(samples) // 2]:10.1f} ms" if samples else f"{'n/a':>13}")
+            imported = sorted({module for run in runs for module in run['deferred imported']})
+            print(f"{name:8} " + ' '.join(cells) + f"  {', '.join(imported) or 'none'}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        child(float(sys.argv[2]))
+    else:
+        main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,125 @@
+import os
+import random
+
+"""
+This module provides airport data for the benchmarks. If a cached copy of airports.dat is available it is used as is,
+otherwise a synthetic file in the same format (quoted commas, accented names, null markers included) is generated so
+the benchmarks can run offline.
+
+Methods:
+--------
+    load_airports_dat(path=None):
+        returns the bytes of airports.dat from the given path, the dataset cache, or a synthetic copy
+    synthetic_airports_dat(row_count=AIRPORTS_DAT_ROWS, seed=0, awkward=False):
+        generates airports.dat-formatted bytes with the given number of rows
+    load_routes_dat(path=None):
+        returns the bytes of routes.dat from the given path, the dataset cache, or a synthetic copy
+    synthetic_routes_dat(route_count=ROUTES_DAT_ROWS, airport_count=AIRPORTS_DAT_ROWS, seed=0):
+        generates routes.dat-formatted bytes between the airports of synthetic_airports_dat()
+
+Constants:
+----------
+    AIRPORTS_DAT_ROWS: roughly the number of rows in the real airports.dat
+    AWKWARD_AIRPORTS: rows the bulk parser can't convert in its single csv pass (a null marker inside a quoted name,
+                      quoted numbers), so it has to fall back to converting field by field
+    CACHED_AIRPORTS_DAT: where the dataset cache keeps airports.dat
+    ROUTES_DAT_ROWS: roughly the number of rows in the real routes.dat
+    CACHED_ROUTES_DAT: where the dataset cache keeps routes.dat
+"""
+
+AIRPORTS_DAT_ROWS = 7698
+CACHED_AIRPORTS_DAT = os.path.join('cache', 'airports.dat')
+ROUTES_DAT_ROWS = 67663
+AWKWARD_AIRPORTS = ('1000001,"Null Island,\\N Field","Null Island","Nowhere","NUL","NULL",0.5,-0.5,12,0,"U","Etc/UTC",'
+                    '"airport","OurAirports"',
+                    '1000002,"Quoted Numbers Airport","Springfield","United States",\\N,"KQNA","44.5","-123.25",'
+                    '"210","-8","A","America/Los_Angeles","airport","OurAirports"')
+CACHED_ROUTES_DAT = os.path.join('cache', 'routes.dat')
+
+_NAMES = ['Goroka', 'Madang', 'Mount Hagen', 'Düsseldorf', 'Frankfurt am Main', 'Erfurt', 'São Paulo', 'Zürich',
+          'Nadzab', 'Port Moresby', 'Reykjavík', 'Springfield', 'Portland', 'Bielefeld', 'Allendorf/Eder']
+_SUFFIXES = ['Airport', 'International Airport', 'Regional Airport', 'Heliport', 'Seaplane Base', 'Air Base',
+             '"Kiwi" Airfield', 'Airport, North Field']
+_COUNTRIES = ['United States', 'Germany', 'Canada', 'Papua New Guinea', 'Brazil', 'Australia', 'Iceland', 'France',
+              'Switzerland', 'Bonaire, Saint Eustatius and Saba', "Cote d'Ivoire", 'New Zealand']
+_DST = ['E', 'A', 'S', 'O', 'Z', 'N', 'U']
+_UTC = ['-10', '-8', '-5', '-3.5', '0', '1', '2', '5.5', '8', '10', '12']
+_LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def _quote(value):
+    return '"' + value.replace('"', '""') + '"'
+
+
+def synthetic_airports_dat(row_count=AIRPORTS_DAT_ROWS, seed=0, awkward=False):
+    """
+    generates airports.dat-formatted bytes with the given number of rows
+    :param row_count: number of rows to generate
+    :param seed: seed for the random generator, so the same data is produced every run
+    :param awkward: true to end the file with AWKWARD_AIRPORTS (which aren't counted in row_count)
+    :return: the generated file as bytes
+    """
+    rand = random.Random(seed)
+    lines = []
+    for airport_id in range(1, row_count + 1):
+        name = f"{rand.choice(_NAMES)} {rand.choice(_SUFFIXES)}"
+        city = rand.choice(_NAMES)
+        iata = '\\N' if rand.random() < 0.2 else _quote(''.join(rand.choice(_LETTERS) for _ in range(3)))
+        icao = _quote(''.join(rand.choice(_LETTERS) for _ in range(4)))
+        utc = '\\N' if rand.random() < 0.05 else rand.choice(_UTC)
+        dst = '\\N' if utc == '\\N' else _quote(rand.choice(_DST))
+        lines.append(','.join([str(airport_id), _quote(name), _quote(city), _quote(rand.choice(_COUNTRIES)), iata,
+                               icao, repr(rand.uniform(-90, 90)), repr(rand.uniform(-180, 180)),
+                               str(rand.randint(-50, 12000)), utc, dst, '"Etc/UTC"', '"airport"', '"OurAirports"']))
+    if awkward:
+        lines.extend(AWKWARD_AIRPORTS)
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def load_airports_dat(path=None):
+    """
+    returns the bytes of airports.dat from the given path, the dataset cache, or a synthetic copy
+    :param path: optional path to an airports.dat file
+    :return: the file as bytes
+    """
+    path = path or (CACHED_AIRPORTS_DAT if os.path.exists(CACHED_AIRPORTS_DAT) else None)
+    if path is None:
+        return synthetic_airports_dat()
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def synthetic_routes_dat(route_count=ROUTES_DAT_ROWS, airport_count=AIRPORTS_DAT_ROWS, seed=0):
+    """
+    generates routes.dat-formatted bytes between the airports of synthetic_airports_dat(). Like the real network, most
+    routes touch a few hundred hub airports, and some have only airport codes and the null marker for the ids.
+    :param route_count: number of routes to generate
+    :param airport_count: number of airports to pick the ends of the routes from
+    :param seed: seed for the random generator, so the same data is produced every run
+    :return: the generated file as bytes
+    """
+    rand = random.Random(seed)
+    hubs = rand.sample(range(1, airport_count + 1), min(airport_count, 300))
+    airlines = [''.join(rand.choice(_LETTERS) for _ in range(2)) for _ in range(500)]
+    lines = []
+    for _ in range(route_count):
+        source = rand.choice(hubs) if rand.random() < 0.7 else rand.randint(1, airport_count)
+        destination = rand.choice(hubs) if rand.random() < 0.7 else rand.randint(1, airport_count)
+        airline = rand.randrange(len(airlines))
+        source_id = '\\N' if rand.random() < 0.01 else str(source)
+        lines.append(','.join([airlines[airline], str(airline + 1), 'XXX', source_id, 'YYY', str(destination), '',
+                               '0', '320 738']))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def load_routes_dat(path=None):
+    """
+    returns the bytes of routes.dat from the given path, the dataset cache, or a synthetic copy
+    :param path: optional path to a routes.dat file
+    :return: the file as bytes
+    """
+    path = path or (CACHED_ROUTES_DAT if os.path.exists(CACHED_ROUTES_DAT) else None)
+    if path is None:
+        return synthetic_routes_dat()
+    with open(path, 'rb') as file:
+        return file.read()
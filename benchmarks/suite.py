@@ -0,0 +1,280 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from business import (AirportDataset, AirportSearchService, QueryResultCache, compile_query, export_rows,
+                      parse_airport_data, parse_line, save_snapshot, load_snapshot)
+from models import Airport, AirportTable
+from benchmarks.fixtures import load_airports_dat, synthetic_airports_dat, AIRPORTS_DAT_ROWS
+from benchmarks.bench_query import QUERIES
+
+"""
+Benchmark suite that times each stage of the application on its own: parsing airports.dat, building the table and the
+indexes, a representative mix of searches (the old object scan, compiled, indexed, cached and fuzzy), formatting
+results the way the gui shows them, exporting and snapshotting. It runs offline: scale 1 is the fixture from benchmarks.fixtures
+(the cached airports.dat, or the seeded synthetic copy, which is the same bytes on every run) and the other scales are
+synthetic datasets with that many times as many rows.
+
+Every stage reports its p50 and p99 latency, its throughput (rows or searches per second) and its peak memory, which is
+measured by tracemalloc in a separate run so it doesn't slow down the timed ones. Results can be saved as a baseline and
+later runs compared against it, and the suite exits with status 1 if any stage has got slower than the threshold.
+
+usage: python -m benchmarks.suite [--scale 1 10 100] [--stage parse ...] [--save baseline.json]
+                                  [--compare baseline.json] [--threshold 1.25] [--path path/to/airports.dat]
+
+Methods:
+--------
+    percentile(samples, fraction):
+        the nearest-rank percentile of a list of timings
+    measure(function, repeats, items):
+        times a function and measures its peak memory
+    run_suite(scales, stages=None, path=None):
+        runs the benchmarks at each scale
+    compare(results, baseline, threshold):
+        compares results with a baseline, returns the stages that got slower
+    main(argv=None):
+        runs the suite from the command line
+
+Constants:
+----------
+    STAGES: the stages in the order they are run
+    LEGACY_MAX_SCALE: the largest scale the old per-line parser and object scan are run at (they are very slow)
+    TARGET_SECONDS: roughly how long each stage is timed for
+    MAX_REPEATS: the most times a stage is run
+    DEFAULT_THRESHOLD: how much slower than the baseline (p50) a stage can get before it counts as a regression
+    GEO_QUERIES: the distance searches added to the query mix
+    RANGE_QUERIES: the elevation, utc offset and bounding box range searches added to the query mix
+    FUZZY_QUERIES: what is typed into the fuzzy name search, with typos and without accents
+"""
+
+STAGES = ('parse', 'parse_line (legacy)', 'table build', 'index build', 'query: check_for_match (legacy)',
+          'query: compiled scan', 'query: indexed', 'query: cached', 'query: fuzzy', 'format results', 'export csv', 'export jsonl',
+          'export columnar', 'snapshot save', 'snapshot load')
+LEGACY_MAX_SCALE = 10
+TARGET_SECONDS = 1.0
+MAX_REPEATS = 50
+DEFAULT_THRESHOLD = 1.25
+GEO_QUERIES = [{'latitude': '50.03', 'longitude': '8.57', 'radius_km': '200'},
+               {'latitude': '-6.08', 'longitude': '145.39', 'nearest': '10'}]
+RANGE_QUERIES = [{'min_elevation': '5000', 'max_elevation': '6000'},
+                 {'min_utc_offset': '1', 'max_utc_offset': '2', 'dst_area': 'European'},
+                 {'min_latitude': '40', 'max_latitude': '60', 'min_longitude': '0', 'max_longitude': '20'}]
+FUZZY_QUERIES = ['dusseldorf', 'frankfrt am main', 'reykjavik', 'zurich', 'internatonal', 'sea', 'g', 'port moresby']
+SOURCE = {'size': 0, 'crc32': 0}
+
+
+def percentile(samples, fraction):
+    """
+    the nearest-rank percentile of a list of timings
+    :param samples: list of timings
+    :param fraction: e.g. 0.99 for p99
+    :return: the timing
+    """
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def measure(function, repeats, items):
+    """
+    times a function and measures its peak memory. It is run once to warm up, once under tracemalloc for the peak
+    memory, then `repeats` more times for the timings.
+    :param function: function to call with no arguments, returning anything
+    :param repeats: how many timed runs, or None to pick enough to take about TARGET_SECONDS
+    :param items: how many rows (or searches) each run handles, for the throughput
+    :return: dict of the stage's results
+    """
+    start = time.perf_counter()
+    function()
+    warmup = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if repeats is None:
+        repeats = max(3, min(MAX_REPEATS, int(TARGET_SECONDS / max(warmup, 1e-6))))
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return {'p50_ms': percentile(samples, 0.5) * 1000, 'p99_ms': percentile(samples, 0.99) * 1000,
+            'mean_ms': sum(samples) / len(samples) * 1000, 'throughput': items / (sum(samples) / len(samples)),
+            'peak_mb': peak / 2 ** 20, 'runs': len(samples)}
+
+
+def _measure_queries(search, queries, repeats):
+    # every search is timed on its own so the percentiles are per search, not per mix
+    for params in queries:
+        search(params)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for params in queries:
+            search(params)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    samples = []
+    for _ in range(repeats):
+        for params in queries:
+            start = time.perf_counter()
+            search(params)
+            samples.append(time.perf_counter() - start)
+    return {'p50_ms': percentile(samples, 0.5) * 1000, 'p99_ms': percentile(samples, 0.99) * 1000,
+            'mean_ms': sum(samples) / len(samples) * 1000, 'throughput': len(samples) / sum(samples),
+            'peak_mb': peak / 2 ** 20, 'runs': len(samples)}
+
+
+def _per_line(data):
+    return [Airport(*parse_line(line)[:11]) for line in data.splitlines()]
+
+
+def _format_results(dataset):
+    # the summary line and the Treeview values the results view builds for each row
+    lines = []
+    for airport in dataset.table:
+        lines.append(f"{airport}\n")
+        lines.append((airport.airport_name, airport.iata_code, airport.icao_code, airport.city_name,
+                      airport.country_name, ''))
+    return lines
+
+
+def run_suite(scales, stages=None, path=None):
+    """
+    runs the benchmarks at each scale
+    :param scales: list of scales, 1 is the fixture and n is a synthetic dataset with n times as many rows
+    :param stages: optional list of the names of the stages to run (see STAGES), all of them if None
+    :param path: optional path to an airports.dat to use at scale 1
+    :return: dict of '<stage> @ <scale>x' to the stage's results
+    """
+    wanted = set(stages or STAGES)
+    results = {}
+    queries = QUERIES + GEO_QUERIES + RANGE_QUERIES
+    for scale in scales:
+        data = load_airports_dat(path) if scale == 1 else synthetic_airports_dat(AIRPORTS_DAT_ROWS * scale)
+        rows = parse_airport_data(data)
+        table = AirportTable.from_rows(rows)
+        dataset = AirportDataset(table)
+        count = len(table)
+        print(f"scale {scale}x: {count} rows, {len(data)} bytes", file=sys.stderr)
+
+        def record(stage, function, items, repeats=None):
+            if stage not in wanted:
+                return
+            results[f'{stage} @ {scale}x'] = dict(measure(function, repeats, items), rows=count)
+            _print_result(f'{stage} @ {scale}x', results[f'{stage} @ {scale}x'])
+
+        def record_queries(stage, search, repeats, mix=queries):
+            if stage not in wanted:
+                return
+            results[f'{stage} @ {scale}x'] = dict(_measure_queries(search, mix, repeats), rows=count)
+            _print_result(f'{stage} @ {scale}x', results[f'{stage} @ {scale}x'])
+
+        record('parse', lambda: parse_airport_data(data), count)
+        if scale <= LEGACY_MAX_SCALE:
+            record('parse_line (legacy)', lambda: _per_line(data), count, repeats=3)
+        record('table build', lambda: AirportTable.from_rows(rows), count)
+        record('index build', lambda: AirportDataset(AirportTable.from_rows(rows)), count)
+        if scale <= LEGACY_MAX_SCALE:
+            airport_list = [Airport(*row) for row in rows]
+            # the old search had no distance searches
+            record_queries('query: check_for_match (legacy)',
+                           lambda params: [airport for airport in airport_list if airport.check_for_match(params)], 3,
+                           QUERIES)
+        record_queries('query: compiled scan', lambda params: compile_query(params).select(table), 5)
+        # both through the service, so both include turning the row numbers into rows
+        uncached = AirportSearchService()
+        uncached.result_cache = QueryResultCache(max_entries=0)
+        service = AirportSearchService()
+        try:
+            uncached.dataset = dataset
+            service.dataset = dataset
+            record_queries('query: indexed', uncached.search, max(5, 50 // scale))
+            record_queries('query: cached', service.search, max(5, 50 // scale))
+        finally:
+            uncached.shutdown(wait=False)
+            service.shutdown(wait=False)
+        dataset.fuzzy_index('airport_name')
+        dataset.fuzzy_index('city_name')
+        record_queries('query: fuzzy', dataset.fuzzy_search, max(5, 50 // scale), FUZZY_QUERIES)
+        record('format results', lambda: _format_results(dataset), count)
+        with tempfile.TemporaryDirectory() as directory:
+            for file_format, extension in (('csv', 'csv'), ('jsonl', 'jsonl'), ('columnar', 'col')):
+                export_path = os.path.join(directory, f'export.{extension}')
+                record(f'export {file_format}', lambda: export_rows(iter(table), export_path), count)
+            snapshot_path = os.path.join(directory, 'airports.dat.snapshot')
+            record('snapshot save', lambda: save_snapshot(dataset, snapshot_path, SOURCE), count)
+            if 'snapshot load' in wanted and not os.path.exists(snapshot_path):
+                save_snapshot(dataset, snapshot_path, SOURCE)
+            record('snapshot load', lambda: load_snapshot(snapshot_path, SOURCE), count)
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    compares results with a baseline and prints how each stage has changed
+    :param results: results from run_suite()
+    :param baseline: results from an earlier run_suite()
+    :param threshold: how many times slower (at p50) a stage can get before it counts as a regression
+    :return: list of the stages that got slower than the threshold
+    """
+    regressions = []
+    print(f"\n{'stage':42} {'baseline p50':>13} {'p50':>10} {'change':>8}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else 1.0
+        flag = '  REGRESSION' if ratio > threshold else ''
+        print(f"{name:42} {before['p50_ms']:10.3f} ms {result['p50_ms']:7.3f} ms {ratio:7.2f}x{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def _print_result(name, result):
+    print(f"{name:42} p50 {result['p50_ms']:10.3f} ms  p99 {result['p99_ms']:10.3f} ms  "
+          f"{result['throughput']:12,.0f}/s  peak {result['peak_mb']:8.2f} MB  ({result['runs']} runs)")
+
+
+def main(argv=None):
+    """
+    runs the suite from the command line
+    :param argv: command line arguments, sys.argv if None
+    :return: the exit status, 1 if a stage regressed against the baseline
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the load, parse, search, render and export paths')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10], help='dataset scales to run (default 1 10)')
+    parser.add_argument('--stage', nargs='+', choices=STAGES, help='only run these stages')
+    parser.add_argument('--path', help='airports.dat to use at scale 1 instead of the fixture')
+    parser.add_argument('--save', help='save the results as a baseline to this json file')
+    parser.add_argument('--compare', help='compare the results with the baseline in this json file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'slowdown (p50) that counts as a regression (default {DEFAULT_THRESHOLD})')
+    args = parser.parse_args(argv)
+    results = run_suite(args.scale, args.stage, args.path)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump({'python': platform.python_version(), 'platform': platform.platform(), 'results': results}, file,
+                      indent=2)
+        print(f"saved baseline to {args.save}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,14 @@
 from .airport_service import *
+from .parsing import *
+from .query import *
+from .indexes import *
+from .fuzzy import *
+from .parallel import *
+from .dataset import *
+from .geo import *
+from .refresh import *
+from .result_cache import *
+from .routes import *
+from .batch import *
+from .search_service import *
+from .snapshot import *
@@ -1,25 +1,39 @@
 import dal
+from models import FIELD_NAMES, FIELD_TYPES, NULL_MARKER
 from exceptions import DalException, BusinessLogicException
-from logging_config import get_logger
-from models import Airport
+from logging_config import get_logger, query_context
 from io import StringIO
 import csv
+import time
 
 
 """
-This module contains logic to parse airport data from a website into Airport objects. It also contains a class to build
-a dict of search parameters so that the user may search through the Airport objects.
+This module contains the glue between the gui and the AirportSearchService, which loads and searches the airport data.
+It also contains a class to build a dict of search parameters so that the user may search through the airport data.
 
 Methods:
 --------
-    process_response(response, tk_instance, show_all=False):
-        callback function for the AirportAdapter, processes response from the url into airport objects
-    retrieve_airport_data(tk_instance, show_all=False):
-        constructs an adapter and executor class from the DAL, and calls on them to retrieve data.
-    write_results_to_txt(results):
-        passes along a request from the gui to the dal to export the current results to results_export.dat
+    process_response(future, tk_instance):
+        callback for a background load of the airport data, schedules the gui to show every airport (or the error)
+    retrieve_airport_data(tk_instance, refresh=False):
+        shows every airport already in memory, or has the search service load them in the background first
+    stream_airport_results(tk_instance, params, cancelled):
+        streams the results of a search to the gui in batches, loading the data at the same time if it needs it
+    live_airport_results(tk_instance, params, generation):
+        searches the data already in memory in the background as the user types, for the gui to show if it is still
+        the newest search
+    route_airport_results(tk_instance, generation, source, destination=None, max_hops=None):
+        answers a route query from the gui in the background and hands the airports to the gui to show, if nothing
+        newer has been searched for since
+    export_airport_results(tk_instance, airports, path):
+        exports airport rows from the gui to a file in the background, in the format the file name asks for
+    export_rows(rows, path, file_format=None, compress=None):
+        streams every field of some airport rows to a file in one of the export formats (see dal.export)
+    write_results_to_txt(results, path='results_export.dat'):
+        passes along a request from the gui to the dal to export a summary of the current results to a text file
     parse_line(line):
-        uses csv-reader to handle commas that are within double quotes within the lines of the results 
+        uses csv-reader to handle commas that are within double quotes within the lines of the results (the bulk
+        parser in parsing.py is used to load the data, this is kept for parsing single lines)
         
 Classes:
 --------
@@ -29,68 +43,225 @@ Classes:
 Constants:
 ----------
     URL: the url that contains the airport data. 
-    GOOD_STATUS_CODE: the status code I want from the URL request (200)
+    AIRLINES_URL: the url that contains the airline data (from the same place as the airport data)
+    ROUTES_URL: the url that contains the route data (from the same place as the airport data)
 """
 
 URL = 'https://raw.githubusercontent.com/jpatokal/openflights/master/data/airports.dat'
-GOOD_STATUS_CODE = 200
+AIRLINES_URL = 'https://raw.githubusercontent.com/jpatokal/openflights/master/data/airlines.dat'
+ROUTES_URL = 'https://raw.githubusercontent.com/jpatokal/openflights/master/data/routes.dat'
 logger = get_logger(__name__)
 
 
-def process_response(response, tk_instance, show_all=False):
+def process_response(future, tk_instance):
     """
-    callback function for the AirportAdapter, processes response from the url into airport objects
-    :param response: response from the url
+    callback for a background load of the airport data, schedules the gui to show every airport (or the error)
+    :param future: the future from AirportSearchService.load_async()
     :param tk_instance: tk instance that is calling this and other functions
-    :param show_all: true if the gui is calling to show all airports, false if not
-    :return: returns a list of airport objects to the gui layer
+    :return: n/a
     """
-    if response.status_code == GOOD_STATUS_CODE:
-        airport_list = []
-        for line in response.iter_lines():
+    error = future.exception()
+    if error is not None:
+        logger.error(f'Failed to load airport data: {error}')
+        tk_instance.after(0, tk_instance.display_error, f"Some error occurred: {error}")
+        return
+    logger.info('airport data loaded')
+    tk_instance.after(0, tk_instance.update_all)
+
+
+def retrieve_airport_data(tk_instance, refresh=False):
+    """
+    shows every airport already in memory, or has the gui's search service load them in the background first. The
+    network is only touched on an explicit refresh or when the cached copy has expired.
+    :param tk_instance: the tkinter instance that is calling this function
+    :param refresh: true to revalidate the data even if the cached copy is still fresh
+    :return: nothing directly, calls process_response as a callback.
+    """
+    service = tk_instance.search_service
+    if not service.needs_load(refresh):
+        logger.info('showing airport data already in memory')
+        tk_instance.after(0, tk_instance.update_all)
+        return
+    try:
+        future = service.load_async(refresh)
+    except RuntimeError:
+        logger.error("Failed to execute")
+        raise BusinessLogicException
+    future.add_done_callback(lambda done: process_response(done, tk_instance))
+
+
+def stream_airport_results(tk_instance, params, cancelled):
+    """
+    streams the results of a search to the gui in batches on the search service's thread pool, loading the data at the
+    same time if it needs it. Each batch is handed to tk_instance.add_results as it is found, then
+    tk_instance.finish_results is called (or tk_instance.display_error if the search failed).
+    :param tk_instance: the tkinter instance that is calling this function
+    :param params: dict of search parameters from AirportSearchBuilder.build()
+    :param cancelled: threading.Event that the gui sets to stop the search
+    :return: a future for the search
+    """
+    def run():
+        with query_context():
+            start = time.perf_counter()
+            count = 0
+            try:
+                for batch in tk_instance.search_service.stream_search(params, cancelled=cancelled):
+                    if cancelled.is_set():
+                        return
+                    count += len(batch)
+                    tk_instance.after(0, tk_instance.add_results, cancelled, batch)
+            except BusinessLogicException as e:
+                logger.error(f'Search failed: {e}')
+                tk_instance.after(0, tk_instance.display_error, f"Some error occurred: {e}")
+            else:
+                logger.info(f'Search found {count} airports',
+                            extra={'duration_ms': round((time.perf_counter() - start) * 1000, 3), 'results': count})
+            tk_instance.after(0, tk_instance.finish_results, cancelled)
+
+    try:
+        return tk_instance.search_service.executor.submit(run)
+    except RuntimeError:
+        logger.error("Failed to execute")
+        raise BusinessLogicException
+
+
+def live_airport_results(tk_instance, params, generation):
+    """
+    searches the data already in memory on the search service's thread pool, for a search-as-you-type. Nothing is
+    loaded: until the data is, there is nothing to search. tk_instance.show_live_results is called with the generation
+    and the results, so the gui can drop them if the user has typed something else in the meantime (errors are only
+    logged, the user is still typing).
+    :param tk_instance: the tkinter instance that is calling this function
+    :param params: dict of search parameters from AirportSearchBuilder.build()
+    :param generation: number the gui gave this search, handed back with its results
+    :return: a future for the search, cancel it if a newer search supersedes it before it starts
+    """
+    def run():
+        service = tk_instance.search_service
+        if generation != tk_instance.live_generation or not service.is_loaded():
+            # superseded while it was waiting for a thread
+            return
+        with query_context():
             try:
-                tokens = parse_line(line)
-                airport = Airport(tokens[0], tokens[1], tokens[2], tokens[3], tokens[4], tokens[5], tokens[6],
-                                  tokens[7], tokens[8], tokens[9], tokens[10])
-                airport_list.append(airport)
-            except BusinessLogicException:
-                raise
-        logger.info('returning list of airport objects')
-        tk_instance.after(0, tk_instance.set_airport_list, airport_list)
-        if show_all:
-            tk_instance.after(0, tk_instance.update_all)
-        else:
-            tk_instance.after(0, tk_instance.update_results)
-    else:
-        logger.error("Bad Response")
+                results = service.search_ranked(params)
+            except BusinessLogicException as e:
+                logger.info(f'Live search failed: {e}')
+                return
+        tk_instance.after(0, tk_instance.show_live_results, generation, results)
+
+    try:
+        return tk_instance.search_service.executor.submit(run)
+    except RuntimeError:
+        logger.error("Failed to execute")
         raise BusinessLogicException
 
 
-def retrieve_airport_data(tk_instance, show_all=False):
+def route_airport_results(tk_instance, generation, source, destination=None, max_hops=None):
     """
-    constructs an adapter and executor class from the DAL, and calls on them to retrieve data.
+    answers a route query on the search service's thread pool, loading the route data first if it needs it. With a
+    destination it finds the way there with the fewest flights (in at most max_hops flights, if given), with just
+    max_hops every airport that can be reached in that many flights, and otherwise the direct destinations.
+    tk_instance.show_routes is called with the results (or tk_instance.show_route_error if the query failed), which
+    only shows them if tk_instance.live_generation is still the generation of the query. A query that has already
+    been superseded when a thread picks it up isn't run.
     :param tk_instance: the tkinter instance that is calling this function
-    :param show_all: true if the gui is calling to show all airports, false if not
-    :return: nothing directly, calls process_response as a callback.
+    :param generation: the number of the query, the gui's live_generation when it was started
+    :param source: IATA code, ICAO code or airport id of the airport to start at
+    :param destination: optional IATA code, ICAO code or airport id of the airport to get to
+    :param max_hops: optional number of flights
+    :return: a future for the query
     """
+    def run():
+        if generation != tk_instance.live_generation:
+            return
+        with query_context():
+            route(tk_instance.search_service)
+
+    def route(service):
+        try:
+            if destination:
+                airports = service.route(source, destination, max_hops)
+                description = (f'{len(airports) - 1} flights from {source} to {destination}' if airports else
+                               f'No route from {source} to {destination}')
+                results = [(None, airport) for airport in airports]
+            elif max_hops:
+                results = [(None, airport) for _, airport in service.reachable(source, max_hops)]
+                description = f'{len(results)} airports within {max_hops} flights of {source}'
+            else:
+                results = [(None, airport) for airport in service.destinations(source)]
+                description = f'{len(results)} direct destinations from {source}'
+        except BusinessLogicException as e:
+            logger.error(f'Route query failed: {e}')
+            tk_instance.after(0, tk_instance.show_route_error, generation, f"Some error occurred: {e}")
+            return
+        tk_instance.after(0, tk_instance.show_routes, generation, results, description)
+
     try:
-        adapter = dal.AirportAdapter(tk_instance, process_response, show_all)
-        executor = dal.APIExecutor(adapter)
-        executor.execute(URL)
-    except DalException:
+        return tk_instance.search_service.executor.submit(run)
+    except RuntimeError:
         logger.error("Failed to execute")
         raise BusinessLogicException
 
 
-def write_results_to_txt(results):
+def export_airport_results(tk_instance, airports, path):
+    """
+    exports airport rows from the gui to a file on the search service's thread pool. A .csv, .jsonl or .col file (each
+    optionally .gz) gets every field of every airport, anything else gets the one-line summaries that the results view
+    shows. tk_instance.finish_export is called with the path and the number of airports written once it is done (after
+    tk_instance.display_error, and with None, if it failed).
+    :param tk_instance: the tkinter instance that is calling this function
+    :param airports: list of (distance in km or None, AirportRow), in the order they should be written
+    :param path: path of the file to write
+    :return: a future for the export
     """
-    calls the dal.write_results_to_txt method to write results from the gui to results_export.dat
-    :param results: the results from the gui results_text field.
+    def run():
+        try:
+            if dal.export_format(path)[0] is None:
+                write_results_to_txt((f"{airport}\n" if distance is None else f"{airport} - {distance:.1f} km\n"
+                                      for distance, airport in airports), path)
+            else:
+                export_rows((airport for _, airport in airports), path)
+        except BusinessLogicException as e:
+            logger.error(f'Export failed: {e}')
+            tk_instance.after(0, tk_instance.display_error, f"Unable to export data: {e}")
+            tk_instance.after(0, tk_instance.finish_export, path, None)
+            return
+        tk_instance.after(0, tk_instance.finish_export, path, len(airports))
+
+    try:
+        return tk_instance.search_service.executor.submit(run)
+    except RuntimeError:
+        logger.error("Failed to execute")
+        raise BusinessLogicException
+
+
+def export_rows(rows, path, file_format=None, compress=None):
+    """
+    streams every field of some airport rows to a file in one of the export formats, a row at a time through a write
+    buffer, so exporting every airport takes no more memory than exporting a few
+    :param rows: iterable of AirportRow
+    :param path: path of the file to write
+    :param file_format: one of dal.EXPORT_FORMATS, worked out from the path if None
+    :param compress: true to gzip the file, worked out from the path (a .gz extension) if None
+    :return: the number of airports exported
+    """
+    try:
+        return dal.export_records((row.record() for row in rows), path, FIELD_NAMES, FIELD_TYPES, file_format, compress,
+                                  NULL_MARKER)
+    except DalException as e:
+        raise BusinessLogicException(f'Unable to export airports: {e}')
+
+
+def write_results_to_txt(results, path='results_export.dat'):
+    """
+    calls the dal.write_results_to_txt method to write results from the gui to a text file
+    :param results: the lines of the results from the gui results view.
+    :param path: path of the file to write
     :return: really nothing, calls a method from the dal to write data to a text file...
     """
     try:
-        logger.info('Writing results to results_export.dat')
-        return dal.write_results_to_txt(results)
+        logger.info(f'Writing results to {path}')
+        return dal.write_results_to_txt(results, path)
     except DalException:
         raise BusinessLogicException
 
@@ -129,6 +300,65 @@ class AirportSearchBuilder:
         self._params[param_name] = param_value
         return self
 
+    def within_km(self, latitude, longitude, radius_km):
+        """
+        searches for airports within a radius of a point, nearest first
+        :param latitude: latitude of the center
+        :param longitude: longitude of the center
+        :param radius_km: radius in km
+        :return: self
+        """
+        return self.with_param('latitude', latitude).with_param('longitude', longitude).with_param('radius_km',
+                                                                                                   radius_km)
+
+    def nearest(self, latitude, longitude, count):
+        """
+        searches for the airports nearest to a point, nearest first (combine with within_km to limit how far away)
+        :param latitude: latitude of the center
+        :param longitude: longitude of the center
+        :param count: how many airports to find
+        :return: self
+        """
+        return self.with_param('latitude', latitude).with_param('longitude', longitude).with_param('nearest', count)
+
+    def elevation_between(self, low=None, high=None):
+        """
+        searches for airports with an elevation in a range, both ends included
+        :param low: lowest elevation in feet, None for no lower bound
+        :param high: highest elevation in feet, None for no upper bound
+        :return: self
+        """
+        return self._with_range('elevation', low, high)
+
+    def utc_offset_between(self, low=None, high=None):
+        """
+        searches for airports in a band of time zones, both ends included
+        :param low: lowest offset from UTC in hours, None for no lower bound
+        :param high: highest offset from UTC in hours, None for no upper bound
+        :return: self
+        """
+        return self._with_range('utc_offset', low, high)
+
+    def within_box(self, min_latitude, min_longitude, max_latitude, max_longitude):
+        """
+        searches for airports inside a latitude/longitude bounding box, edges included (a box that crosses the
+        antimeridian has to be searched as two boxes)
+        :param min_latitude: southern edge
+        :param min_longitude: western edge
+        :param max_latitude: northern edge
+        :param max_longitude: eastern edge
+        :return: self
+        """
+        return self._with_range('latitude', min_latitude, max_latitude)._with_range('longitude', min_longitude,
+                                                                                    max_longitude)
+
+    def _with_range(self, field, low, high):
+        if low is not None:
+            self.with_param(f'min_{field}', low)
+        if high is not None:
+            self.with_param(f'max_{field}', high)
+        return self
+
     def build(self):
         """
         returns self._params
@@ -0,0 +1,152 @@
+import csv
+import json
+import time
+from exceptions import BusinessLogicException
+from logging_config import get_logger
+import metrics
+from .query import canonical_key
+
+"""
+This module evaluates many searches in one go, e.g. every IATA/ICAO code and city name on a flight manifest. The
+searches share one loaded dataset and are answered from its indexes: a plain code lookup is a dict probe or two and
+skips compiling a query at all, anything else goes through AirportDataset.search_ranked. Manifests repeat themselves,
+so each distinct search (by canonical_key, so 'fra' and 'FRA' are the same search) is only evaluated once per batch.
+The results are streamed back one set per search, in the order the searches came in, so a batch of any size takes no
+more memory than its distinct results.
+
+Methods:
+--------
+    run_batch(dataset, queries, convert=None):
+        evaluates a stream of searches against a dataset, one result set per search
+    read_queries(path, field=None):
+        reads searches from a file: json lines, csv with a header row of parameter names, or one value per line
+    guess_param(value):
+        works out which search parameter a bare value from a manifest is
+
+Constants:
+----------
+    CODE_PARAMS: the parameters a search can have and still be answered by a dict probe
+    MAX_MEMO: how many distinct searches a batch remembers the results of before it starts again
+"""
+
+CODE_PARAMS = frozenset({'iata_code', 'icao_code'})
+MAX_MEMO = 65536
+logger = get_logger(__name__)
+
+
+def run_batch(dataset, queries, convert=None):
+    """
+    evaluates a stream of searches against a dataset. A search that is invalid doesn't stop the batch, its error is
+    returned in place of its results, and so is a line of a query file that isn't a search at all.
+    :param dataset: the AirportDataset to search
+    :param queries: iterable of dicts of search parameters, as from AirportSearchBuilder.build(), or the
+                    BusinessLogicException that read_queries() gives for a line it couldn't read
+    :param convert: optional function that turns the tuple of results of a search into what is returned for it, it is
+                    only called once for each distinct search
+    :return: generator of (params (None for a line that couldn't be read), tuple of (distance in km or None, row
+             index) or what convert returned, error message or None), one per search, in order
+    """
+    memo = {}
+    count = 0
+    start = time.perf_counter()
+    try:
+        for params in queries:
+            count += 1
+            if isinstance(params, BusinessLogicException):
+                yield None, () if convert is None else convert(()), str(params)
+                continue
+            if not params:
+                yield params, () if convert is None else convert(()), 'You must use at least 1 parameter'
+                continue
+            try:
+                key = canonical_key(params)
+                results = memo.get(key)
+                if results is None:
+                    results = _lookup(dataset, key)
+                    if results is None:
+                        results = tuple(dataset.search_ranked(params))
+                    if convert is not None:
+                        results = convert(results)
+                    if len(memo) >= MAX_MEMO:
+                        memo.clear()
+                    memo[key] = results
+            except BusinessLogicException as e:
+                yield params, () if convert is None else convert(()), str(e)
+                continue
+            yield params, results, None
+    finally:
+        metrics.increment('batch_queries_total', count)
+        metrics.increment('batch_distinct_queries_total', len(memo))
+        logger.info(f'Batch of {count} searches evaluated',
+                    extra={'count': count, 'distinct': len(memo),
+                           'duration_ms': round((time.perf_counter() - start) * 1000, 3)})
+
+
+def read_queries(path, field=None):
+    """
+    reads searches from a file, a line at a time. A .jsonl/.json file has a json object of search parameters on each
+    line and a .csv file has a header row of parameter names. Anything else has a single value on each line, for the
+    given field or, without one, whatever guess_param() makes of it. A line that can't be read as a search doesn't end
+    the file: a BusinessLogicException saying what is wrong with it is given in its place (run_batch() reports it as
+    that search's error).
+    :param path: path of the file
+    :param field: the search parameter of the values in a one value per line file, guessed if None
+    :return: generator of dicts of search parameters (or BusinessLogicException for a line that isn't one)
+    """
+    try:
+        with open(path, encoding='utf-8', newline='') as file:
+            lower = path.lower()
+            if lower.endswith(('.jsonl', '.json')):
+                for number, line in enumerate(file, 1):
+                    if line.strip():
+                        yield _json_query(line, number)
+            elif lower.endswith('.csv'):
+                for row in csv.DictReader(file):
+                    yield {name: value for name, value in row.items() if name and value not in (None, '')}
+            else:
+                for line in file:
+                    value = line.strip()
+                    if value:
+                        yield {field or guess_param(value): value}
+    except OSError as e:
+        logger.error(f'Unable to read queries from {path}: {e}')
+        raise BusinessLogicException(f'Unable to read queries from {path}: {e}')
+
+
+def guess_param(value):
+    """
+    works out which search parameter a bare value from a manifest is: three capitals (or digits) are an IATA code, four
+    an ICAO code, and anything else a city name
+    :param value: the value, e.g. 'FRA', 'EDDF' or 'Frankfurt'
+    :return: the name of the search parameter
+    """
+    if value.isupper() and value.isalnum():
+        if len(value) == 3:
+            return 'iata_code'
+        if len(value) == 4:
+            return 'icao_code'
+    return 'city_name'
+
+
+def _lookup(dataset, key):
+    # answers a search for nothing but codes straight from the hash indexes, None for any other search
+    if not key or any(name not in CODE_PARAMS for name, _ in key):
+        return None
+    rows = None
+    for name, value in key:
+        index = dataset.indexes.by_iata if name == 'iata_code' else dataset.indexes.by_icao
+        matches = index.get(value, ())
+        rows = matches if rows is None else sorted(set(rows).intersection(matches))
+    return tuple((None, row) for row in rows)
+
+
+def _json_query(line, number):
+    try:
+        params = json.loads(line)
+    except ValueError as e:
+        logger.error(f'Invalid query on line {number}: {e}')
+        return BusinessLogicException(f'Invalid query on line {number}: {e}')
+    if not isinstance(params, dict):
+        logger.error(f'Invalid query on line {number}: not an object')
+        return BusinessLogicException(f'Invalid query on line {number}: not an object')
+    return params
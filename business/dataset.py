@@ -0,0 +1,218 @@
+from concurrent.futures.process import BrokenProcessPool
+import threading
+from exceptions import BusinessLogicException
+from logging_config import get_logger
+import metrics
+from .fuzzy import FuzzyIndex, FUZZY_FIELDS, DEFAULT_LIMIT
+from .geo import GeoGrid, MAX_DISTANCE_KM
+from .indexes import AirportIndexes
+from .parallel import ParallelScanner, use_parallel
+from .query import compile_query
+
+"""
+This module contains the AirportDataset, which keeps a loaded AirportTable together with the indexes built over it
+(including the GeoGrid for distance searches) and answers searches against them. A search the indexes can't narrow down
+scans the whole table, which a large dataset does in parallel (see parallel.py). The fuzzy name indexes are only built
+the first time a fuzzy search needs them.
+
+Classes:
+--------
+    AirportDataset:
+        a loaded AirportTable and its indexes
+"""
+
+logger = get_logger(__name__)
+
+
+class AirportDataset:
+    def __init__(self, table, indexes=None, grid=None, parallel=None):
+        self.table = table
+        if indexes is None:
+            with metrics.span('index_build'):
+                indexes = AirportIndexes(table)
+        if grid is None:
+            with metrics.span('grid_build'):
+                grid = GeoGrid(table)
+        self.indexes = indexes
+        self.grid = grid
+        # the worker processes only start when the first full scan needs them
+        self.scanner = ParallelScanner(table) if use_parallel(len(table), parallel) else None
+        # how many parallel scans are running, so a retired dataset only stops the workers once they are done
+        self._scans = 0
+        self._retired = False
+        self._scan_lock = threading.Lock()
+        self._rows_by_id = None
+        self._fuzzy = {}
+        self._fuzzy_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.table)
+
+    def search(self, params):
+        """
+        searches the dataset. The hash indexes narrow the rows down first (a code lookup is a single dict probe), then
+        the rest of the compiled query only has to check the candidates that are left.
+        :param params: dict of search parameters from AirportSearchBuilder.build()
+        :return: a list of the indices of the matching rows, in table order (nearest first for a distance search)
+        """
+        with metrics.span('filter'):
+            query = compile_query(params)
+            if query.geo is not None:
+                return [index for _, index in self._rank(query)]
+            return self._select(query)
+
+    def search_ranked(self, params):
+        """
+        searches the dataset like search() does, and also returns how far each row is from the center of a distance
+        search
+        :param params: dict of search parameters from AirportSearchBuilder.build()
+        :return: a list of (distance in km, or None if this isn't a distance search, row index)
+        """
+        with metrics.span('filter'):
+            query = compile_query(params)
+            if query.geo is not None:
+                return self._rank(query)
+            return [(None, index) for index in self._select(query)]
+
+    def fuzzy_search(self, text, fields=tuple(FUZZY_FIELDS), limit=DEFAULT_LIMIT):
+        """
+        finds the rows whose name is closest to the text, tolerating typos and missing accents (see fuzzy.py)
+        :param text: what the user typed
+        :param fields: the fields to search, from FUZZY_FIELDS ('airport_name', 'city_name')
+        :param limit: the most rows to return
+        :return: list of (edits, row index), best match first. A row that matches in more than one field is listed once,
+                 for its best match.
+        """
+        ranked = []
+        for position, field in enumerate(fields):
+            index = self.fuzzy_index(field)
+            ranked.extend((distance, rank, position, row) for rank, (distance, row) in
+                          enumerate(index.search(text, limit)))
+        ranked.sort()
+        seen = set()
+        results = []
+        for distance, _, _, row in ranked:
+            if row not in seen:
+                seen.add(row)
+                results.append((distance, row))
+        return results[:limit]
+
+    def fuzzy_index(self, field):
+        """
+        returns the fuzzy index of a field, building it the first time it is asked for
+        :param field: one of FUZZY_FIELDS
+        :return: the FuzzyIndex
+        """
+        index = self._fuzzy.get(field)
+        if index is None:
+            if field not in FUZZY_FIELDS:
+                logger.error(f'Unknown fuzzy search field: {field}')
+                raise BusinessLogicException(f'Unknown fuzzy search field: {field}')
+            with self._fuzzy_lock:
+                index = self._fuzzy.get(field)
+                if index is None:
+                    index = self._fuzzy[field] = FuzzyIndex(getattr(self.table, FUZZY_FIELDS[field]))
+        return index
+
+    def _select(self, query):
+        if query.matches_nothing:
+            return _counted(0, [])
+        candidates, answered = self.indexes.candidates(query.params)
+        return _counted(len(self.table) if candidates is None else len(candidates),
+                        self._scan(query, candidates, answered))
+
+    def _rank(self, query):
+        # the rest of the query is run first, so the grid only has to measure the rows that are left
+        if query.matches_nothing:
+            return _counted(0, [])
+        geo = query.geo
+        rows = None
+        candidates, answered = self.indexes.candidates(query.params)
+        # the grid only measures the rows the rest of the query left, or every row in the cells it looks at
+        scanned = len(self.table) if candidates is None else len(candidates)
+        if candidates is not None or any(name not in answered for name, _ in query.filters):
+            rows = set(self._scan(query, candidates, answered))
+            if not rows:
+                return _counted(scanned, [])
+        radius_km = MAX_DISTANCE_KM if geo.radius_km is None else geo.radius_km
+        if geo.nearest is not None:
+            return _counted(scanned, self.grid.nearest(geo.latitude, geo.longitude, geo.nearest, rows, radius_km))
+        return _counted(scanned, self.grid.within(geo.latitude, geo.longitude, radius_km, rows))
+
+    def _scan(self, query, candidates, answered):
+        scanner = self._start_scan() if candidates is None else None
+        if scanner is not None:
+            try:
+                return scanner.select(query.params, answered)
+            except BrokenProcessPool as e:
+                # a worker died (or couldn't start), searches carry on in this process
+                logger.error(f'Parallel scan failed, scanning serially from now on: {e}')
+                scanner.close()
+                self.scanner = None
+            finally:
+                self._end_scan()
+        return query.select(self.table, candidates, skip=answered)
+
+    def _start_scan(self):
+        # a retired dataset scans serially, its workers are (about to be) stopped
+        with self._scan_lock:
+            if self.scanner is None or self._retired:
+                return None
+            self._scans += 1
+            return self.scanner
+
+    def _end_scan(self):
+        with self._scan_lock:
+            self._scans -= 1
+            close = self._retired and not self._scans
+        if close:
+            self.close()
+
+    def close(self):
+        """
+        stops the worker processes of a parallel scan, if they were started
+        :return: n/a
+        """
+        if self.scanner is not None:
+            self.scanner.close()
+
+    def retire(self):
+        """
+        closes a dataset that has been replaced, as soon as the parallel scans still running on it have finished.
+        Searches that still hold it carry on against it, scanning serially.
+        :return: n/a
+        """
+        with self._scan_lock:
+            self._retired = True
+            close = not self._scans
+        if close:
+            self.close()
+
+    def index_of(self, airport_id):
+        """
+        finds the row of an airport by its id, e.g. for the airports a route graph returns
+        :param airport_id: the airport id
+        :return: the row index, or None if there is no such airport
+        """
+        if self._rows_by_id is None:
+            self._rows_by_id = {airport_id: index for index, airport_id in enumerate(self.table.airport_ids)}
+        return self._rows_by_id.get(airport_id)
+
+    def rows(self, indices):
+        """
+        returns row views for a list of row indices
+        :param indices: list of row indices
+        :return: list of AirportRow
+        """
+        table = self.table
+        return [table[index] for index in indices]
+
+
+def _counted(scanned, matches):
+    # records how many rows a search had to check against how many it matched
+    metrics.increment('queries_total')
+    metrics.increment('query_rows_scanned_total', scanned)
+    metrics.increment('query_rows_matched_total', len(matches))
+    metrics.observe('query_rows_scanned', scanned, metrics.ROW_BUCKETS)
+    metrics.observe('query_rows_matched', len(matches), metrics.ROW_BUCKETS)
+    return matches
@@ -0,0 +1,204 @@
+from array import array
+from collections import Counter
+import heapq
+import unicodedata
+from logging_config import get_logger
+import metrics
+
+"""
+This module contains a fuzzy, accent-insensitive search over a text column, for looking up airports and cities by a
+name that may be misspelled or typed without its accents ("dusseldorf" finds Düsseldorf, "frankfrt" finds Frankfurt).
+
+Every row gets a normalized key once, when the index is built: accents are folded away, the case is folded and
+punctuation becomes spaces. A search folds the text the same way, and the rows that share enough of its trigrams
+(each word is padded with a space, so the start of a word counts as well) are the candidates, or for a single
+character the rows with a word that starts with it. Every edit spoils at
+most three trigrams, so a row within the allowed number of edits can't share fewer than that. The candidates are then
+scored by how many edits it takes to turn the text into part of their key (Myers' bit-parallel algorithm, one pass
+over the key with a few integer operations per character), and the best are returned, fewest edits first, then rows
+where the text starts the key or one of its words, then shorter keys.
+
+Classes:
+--------
+    FuzzyIndex:
+        the normalized keys of a text column and a trigram index over them, answers ranked fuzzy searches
+
+Methods:
+--------
+    fold(value):
+        normalizes text for fuzzy matching: accents and case are folded and punctuation becomes spaces
+    substring_distance(needle, text):
+        the fewest edits that turn the needle into some part of the text
+    max_edits(length):
+        how many edits a search of a given length tolerates
+
+Constants:
+----------
+    FUZZY_FIELDS: the search parameters that can be searched fuzzily, and the columns of AirportTable they search
+    DEFAULT_LIMIT: how many matches a search returns unless asked for another number
+    MAX_CANDIDATES: the most candidates that are scored for a search, the ones sharing the most trigrams are kept
+    FOLDED_LETTERS: letters that unicode doesn't decompose into a base letter and an accent, and what they fold to
+"""
+
+FUZZY_FIELDS = {'airport_name': 'airport_names', 'city_name': 'city_names'}
+DEFAULT_LIMIT = 10
+MAX_CANDIDATES = 500
+FOLDED_LETTERS = str.maketrans({'Ø': 'O', 'ø': 'o', 'Æ': 'AE', 'æ': 'ae', 'Œ': 'OE', 'œ': 'oe', 'Ł': 'L', 'ł': 'l',
+                                'Đ': 'D', 'đ': 'd', 'Ð': 'D', 'ð': 'd', 'Þ': 'TH', 'þ': 'th', 'ı': 'i', 'ß': 'ss'})
+logger = get_logger(__name__)
+
+
+def fold(value):
+    """
+    normalizes text for fuzzy matching: accents and case are folded and anything that isn't a letter or a digit becomes
+    a space, e.g. 'Düsseldorf-Weeze' becomes 'DUSSELDORF WEEZE'
+    :param value: the text
+    :return: the folded text, words separated by single spaces
+    """
+    if value.isascii():
+        decomposed = value
+    else:
+        decomposed = unicodedata.normalize('NFKD', value.translate(FOLDED_LETTERS))
+        decomposed = ''.join(character for character in decomposed if not unicodedata.combining(character))
+    return ' '.join(''.join(character if character.isalnum() else ' ' for character in decomposed.upper()).split())
+
+
+def max_edits(length):
+    """
+    how many edits a search of a given length tolerates: none for one or two characters (they would match almost
+    anything), one up to five characters and two beyond that
+    :param length: length of the folded search text
+    :return: the number of edits
+    """
+    if length <= 2:
+        return 0
+    return 1 if length <= 5 else 2
+
+
+def substring_distance(needle, text):
+    """
+    the fewest edits (insertions, deletions, substitutions) that turn the needle into some part of the text, using
+    Myers' bit-parallel algorithm with one bit per character of the needle
+    :param needle: the text to look for
+    :param text: the text to look in
+    :return: the number of edits, 0 if the needle is in the text
+    """
+    length = len(needle)
+    if not length:
+        return 0
+    masks = {}
+    for position, character in enumerate(needle):
+        masks[character] = masks.get(character, 0) | 1 << position
+    everything = (1 << length) - 1
+    last = 1 << (length - 1)
+    positive = everything
+    negative = 0
+    score = best = length
+    for character in text:
+        equal = masks.get(character, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        horizontal_positive = negative | (everything & ~(horizontal | positive))
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last:
+            score += 1
+        elif horizontal_negative & last:
+            score -= 1
+            if score < best:
+                best = score
+                if not best:
+                    return 0
+        # nothing is shifted in at the bottom, a match may start anywhere in the text
+        horizontal_positive = (horizontal_positive << 1) & everything
+        horizontal_negative = (horizontal_negative << 1) & everything
+        positive = horizontal_negative | (everything & ~(vertical | horizontal_positive))
+        negative = horizontal_positive & vertical
+    return best
+
+
+class FuzzyIndex:
+    def __init__(self, column):
+        self.keys = []
+        self.postings = {}
+        self.build(column)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def build(self, column):
+        """
+        folds every value of a text column into its key and indexes the trigrams of the keys
+        :param column: list of strings, e.g. AirportTable.airport_names
+        :return: n/a
+        """
+        with metrics.span('index_build', index='fuzzy'):
+            keys = [fold(value) for value in column]
+            postings = {}
+            for index, key in enumerate(keys):
+                # the first letter of each word as well, for what the user has typed after one letter
+                for trigram in _trigrams(key) | {f' {word[0]}' for word in key.split()}:
+                    rows = postings.get(trigram)
+                    if rows is None:
+                        postings[trigram] = [index]
+                    elif rows[-1] != index:
+                        rows.append(index)
+            self.keys = keys
+            self.postings = {trigram: array('i', rows) for trigram, rows in postings.items()}
+        logger.info(f'Built fuzzy index of {len(keys)} keys and {len(postings)} trigrams')
+
+    def search(self, text, limit=DEFAULT_LIMIT, edits=None):
+        """
+        finds the rows whose key is closest to the text
+        :param text: what the user typed
+        :param limit: the most matches to return
+        :param edits: how many edits to tolerate, max_edits() of the folded text if None
+        :return: list of (edits, row index), best match first
+        """
+        needle = fold(text)
+        if not needle:
+            return []
+        if edits is None:
+            edits = max_edits(len(needle))
+        keys = self.keys
+        with metrics.span('fuzzy_search'):
+            needle_trigrams = _trigrams(needle, end=False)
+            if not needle_trigrams:
+                # a single character, only the keys with a word that starts with it
+                candidates = self.postings.get(f' {needle}', ())
+            else:
+                counts = Counter()
+                for trigram in needle_trigrams:
+                    counts.update(self.postings.get(trigram, ()))
+                required = max(1, len(needle_trigrams) - 3 * edits)
+                candidates = [index for index, count in counts.items() if count >= required]
+                if len(candidates) > MAX_CANDIDATES:
+                    candidates = heapq.nlargest(MAX_CANDIDATES, candidates, key=counts.__getitem__)
+            ranked = []
+            # many rows share a key (the same city, or a common name), each key is only measured once
+            distances = {}
+            for index in candidates:
+                key = keys[index]
+                distance = distances.get(key)
+                if distance is None:
+                    distance = distances[key] = 0 if needle in key else substring_distance(needle, key)
+                if distance > edits:
+                    continue
+                start = _word_start(key, needle)
+                ranked.append((distance, 0 if start == 0 else 1 if start > 0 else 2, len(key), index))
+            best = heapq.nsmallest(limit, ranked)
+        metrics.increment('fuzzy_candidates_total', len(candidates))
+        return [(distance, index) for distance, _, _, index in best]
+
+
+def _trigrams(key, end=True):
+    # each word padded with a space in front (and behind, unless it is what the user is still typing), so the start
+    # of a word is a trigram of its own and a short word still has one
+    padded = f' {key} ' if end else f' {key}'
+    return {padded[start:start + 3] for start in range(len(padded) - 2)}
+
+
+def _word_start(key, needle):
+    # where the key (or one of its words) starts with the needle: 0 for the key itself, 1 for a later word, -1 for none
+    if key.startswith(needle):
+        return 0
+    return 1 if f' {needle}' in key else -1
@@ -0,0 +1,215 @@
+from array import array
+import math
+from logging_config import get_logger
+from .indexes import patch_postings
+
+"""
+This module contains the geo search for the airport data: a grid index over the parsed coordinates, and haversine
+distances measured over just the rows in the grid cells a search touches.
+
+Methods:
+--------
+    haversine_km(lat1, lon1, lat2, lon2):
+        great-circle distance in km between two points
+    distances_km(lat, lon, latitudes, longitudes, rows):
+        great-circle distances in km from one point to many rows of the table
+
+Classes:
+--------
+    GeoGrid:
+        buckets the rows of an AirportTable into cells of latitude/longitude so a radius or nearest search only looks
+        at the cells the circle overlaps
+
+Constants:
+----------
+    EARTH_RADIUS_KM: mean radius of the earth
+    MAX_DISTANCE_KM: the furthest apart two points on the earth can be
+    CELL_DEGREES: size of a grid cell in degrees
+    NEAREST_START_KM: radius of the first circle a nearest search looks in
+"""
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+CELL_DEGREES = 1.0
+NEAREST_START_KM = 100.0
+logger = get_logger(__name__)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    great-circle distance in km between two points
+    :param lat1: latitude of the first point in degrees
+    :param lon1: longitude of the first point in degrees
+    :param lat2: latitude of the second point in degrees
+    :param lon2: longitude of the second point in degrees
+    :return: distance in km
+    """
+    return distances_km(lat1, lon1, [lat2], [lon2], [0])[0]
+
+
+def distances_km(lat, lon, latitudes, longitudes, rows):
+    """
+    great-circle distances in km from one point to many rows of the table. The terms that only depend on the search
+    point are worked out once, then each row is measured in a plain loop: there is no numpy dependency to vectorize it
+    with, so the grid keeps it quick by only handing it the rows near the point.
+    :param lat: latitude of the search point in degrees
+    :param lon: longitude of the search point in degrees
+    :param latitudes: latitude column in degrees
+    :param longitudes: longitude column in degrees
+    :param rows: the rows to measure
+    :return: list of distances, in the same order as rows
+    """
+    radians = math.radians
+    sin = math.sin
+    cos = math.cos
+    lat_r = radians(lat)
+    cos_lat = cos(lat_r)
+    diameter = 2 * EARTH_RADIUS_KM
+    distances = []
+    append = distances.append
+    for index in rows:
+        row_lat = radians(latitudes[index])
+        half_dlat = sin((row_lat - lat_r) / 2)
+        half_dlon = sin(radians(longitudes[index] - lon) / 2)
+        a = half_dlat * half_dlat + cos_lat * cos(row_lat) * half_dlon * half_dlon
+        append(diameter * math.asin(math.sqrt(min(1.0, a))))
+    return distances
+
+
+class GeoGrid:
+    def __init__(self, table, cell_degrees=CELL_DEGREES, cells=None):
+        self.table = table
+        self.cell_degrees = cell_degrees
+        self.lon_cells = int(math.ceil(360 / cell_degrees))
+        self.cells = {}
+        if cells is None:
+            self.build(table)
+        else:
+            self.cells = cells
+
+    def build(self, table):
+        """
+        buckets every row with coordinates into its grid cell
+        :param table: the AirportTable to index
+        :return: n/a
+        """
+        cells = {}
+        for index, (lat, lon) in enumerate(zip(table.latitudes, table.longitudes)):
+            if math.isnan(lat) or math.isnan(lon):
+                continue
+            key = self.cell(lat, lon)
+            rows = cells.get(key)
+            if rows is None:
+                cells[key] = [index]
+            else:
+                rows.append(index)
+        self.table = table
+        self.cells = {key: array('i', rows) for key, rows in cells.items()}
+
+    def updated(self, old_table, table, rows):
+        """
+        builds the grid of a changed copy of the table from this one, only moving the rows that changed. This grid is
+        left as it is, so searches that are still using it aren't affected.
+        :param old_table: the table this grid was built over
+        :param table: the changed copy of it
+        :param rows: indices of the rows that were changed, added or removed
+        :return: a new GeoGrid
+        """
+        cells = patch_postings(self.cells, rows, self._cell_keys(old_table), self._cell_keys(table),
+                               lambda cell_rows: array('i', cell_rows))
+        return GeoGrid(table, self.cell_degrees, cells)
+
+    def _cell_keys(self, table):
+        def keys(index):
+            if index >= len(table):
+                return set()
+            lat = table.latitudes[index]
+            lon = table.longitudes[index]
+            if math.isnan(lat) or math.isnan(lon):
+                return set()
+            return {self.cell(lat, lon)}
+        return keys
+
+    def cell(self, lat, lon):
+        """
+        finds the grid cell a point falls in
+        :param lat: latitude in degrees
+        :param lon: longitude in degrees
+        :return: (latitude cell, longitude cell)
+        """
+        return (math.floor(lat / self.cell_degrees),
+                math.floor((lon + 180) / self.cell_degrees) % self.lon_cells)
+
+    def candidate_rows(self, lat, lon, radius_km):
+        """
+        finds the rows in every cell that a circle around the point overlaps
+        :param lat: latitude of the center in degrees
+        :param lon: longitude of the center in degrees
+        :param radius_km: radius of the circle in km
+        :return: list of row indices (some may be outside the circle)
+        """
+        if radius_km >= MAX_DISTANCE_KM:
+            return [index for rows in self.cells.values() for index in rows]
+        angle = math.degrees(radius_km / EARTH_RADIUS_KM)
+        low_lat = lat - angle
+        high_lat = lat + angle
+        cos_lat = math.cos(math.radians(lat))
+        sin_angle = math.sin(math.radians(angle))
+        if low_lat <= -90 or high_lat >= 90 or sin_angle >= cos_lat:
+            # the circle goes over a pole, so it covers every longitude
+            lon_cells = range(self.lon_cells)
+        else:
+            lon_span = math.degrees(math.asin(sin_angle / cos_lat))
+            first = math.floor((lon - lon_span + 180) / self.cell_degrees)
+            last = math.floor((lon + lon_span + 180) / self.cell_degrees)
+            if last - first + 1 >= self.lon_cells:
+                lon_cells = range(self.lon_cells)
+            else:
+                lon_cells = [cell % self.lon_cells for cell in range(first, last + 1)]
+        first_lat = math.floor(max(low_lat, -90) / self.cell_degrees)
+        last_lat = math.floor(min(high_lat, 90) / self.cell_degrees)
+        rows = []
+        cells = self.cells
+        for lat_cell in range(first_lat, last_lat + 1):
+            for lon_cell in lon_cells:
+                bucket = cells.get((lat_cell, lon_cell))
+                if bucket is not None:
+                    rows.extend(bucket)
+        return rows
+
+    def within(self, lat, lon, radius_km, rows=None):
+        """
+        finds the rows within a radius of a point, ranked by distance
+        :param lat: latitude of the center in degrees
+        :param lon: longitude of the center in degrees
+        :param radius_km: radius in km
+        :param rows: optional collection of rows to restrict the search to
+        :return: list of (distance in km, row index), nearest first
+        """
+        candidates = self.candidate_rows(lat, lon, radius_km)
+        if rows is not None:
+            candidates = [index for index in candidates if index in rows]
+        distances = distances_km(lat, lon, self.table.latitudes, self.table.longitudes, candidates)
+        ranked = [(distance, index) for distance, index in zip(distances, candidates) if distance <= radius_km]
+        ranked.sort()
+        return ranked
+
+    def nearest(self, lat, lon, count, rows=None, radius_km=MAX_DISTANCE_KM):
+        """
+        finds the rows nearest to a point, ranked by distance. The search starts with a small circle and doubles it until
+        it holds enough rows, everything inside a circle has been measured so its nearest rows are the true nearest.
+        :param lat: latitude of the center in degrees
+        :param lon: longitude of the center in degrees
+        :param count: how many rows to return
+        :param rows: optional collection of rows to restrict the search to
+        :param radius_km: optional limit on how far away a row can be
+        :return: list of (distance in km, row index), nearest first, at most count long
+        """
+        if count <= 0:
+            return []
+        search_km = min(radius_km, NEAREST_START_KM)
+        while True:
+            ranked = self.within(lat, lon, search_km, rows)
+            if len(ranked) >= count or search_km >= radius_km:
+                return ranked[:count]
+            search_km = min(radius_km, search_km * 2)
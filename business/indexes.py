@@ -0,0 +1,355 @@
+from array import array
+from bisect import bisect_left, bisect_right
+import threading
+from logging_config import get_logger
+import metrics
+from models import NULL_ELEVATION
+from .query import value_ranges, RANGE_COLUMNS
+
+"""
+This module contains the secondary indexes that are built over an AirportTable when the data loads, so that searches
+don't have to scan every row.
+
+Methods:
+--------
+    patch_postings(postings, rows, old_keys, new_keys, container):
+        copies a dict of key to rows, moving the given rows from the keys they had to the keys they have now
+    trigrams(value):
+        splits a string into the set of its three character substrings
+
+Classes:
+--------
+    AirportIndexes:
+        hash indexes for the exact-match search parameters (iata, icao, country and dst), trigram indexes for the
+        contains-search parameters (airport and city name) and range indexes for the numeric ones (elevation, utc
+        offset, latitude and longitude), which are only built the first time a search needs them
+    RangeIndex:
+        the rows of a numeric column sorted by value, so the rows in a range of values are found by binary search
+    TrigramIndex:
+        maps every three character substring of a text column to the rows that contain it
+
+Constants:
+----------
+    HASH_INDEXED_PARAMS: the search parameters that can be answered from the hash indexes
+    TRIGRAM_INDEXED_PARAMS: the search parameters that can be answered from the trigram indexes
+    TRIGRAM_LENGTH: the length of the substrings in a trigram index
+    MAX_RANGE_FRACTION: the largest share of the table a range can cover and still be answered from its index when no
+                        other index applies, a scan is as quick as collecting that many rows
+"""
+
+HASH_INDEXED_PARAMS = ('iata_code', 'icao_code', 'country_name', 'dst_area')
+TRIGRAM_INDEXED_PARAMS = ('airport_name', 'city_name')
+TRIGRAM_LENGTH = 3
+MAX_RANGE_FRACTION = 0.5
+logger = get_logger(__name__)
+
+
+class AirportIndexes:
+    def __init__(self, table, prebuilt=None):
+        self.by_iata = {}
+        self.by_icao = {}
+        self.by_country = {}
+        self.by_dst = {}
+        self.airport_names = None
+        self.city_names = None
+        self.table = table
+        self._ranges = {}
+        self._ranges_lock = threading.Lock()
+        self.build(table, prebuilt)
+
+    def build(self, table, prebuilt=None):
+        """
+        builds the indexes from the table
+        :param table: the AirportTable to index
+        :param prebuilt: optional dict of index name (e.g. 'by_iata') to an index that was already built, e.g. loaded
+                         from a snapshot. Prebuilt hash indexes can map to any sequence of rows.
+        :return: n/a
+        """
+        prebuilt = prebuilt or {}
+        # codes map to a tuple of rows since a handful of them aren't unique (and '\N' is shared by thousands)
+        self.by_iata = prebuilt.get('by_iata') or _group(table.upper_column('iata_codes'), tuple)
+        self.by_icao = prebuilt.get('by_icao') or _group(table.upper_column('icao_codes'), tuple)
+        self.by_country = prebuilt.get('by_country')
+        if self.by_country is None:
+            self.by_country = {}
+            for code, rows in _group(table.country_codes, frozenset).items():
+                key = table.country_values[code].upper().strip('"')
+                self.by_country[key] = self.by_country.get(key, frozenset()) | rows
+        self.by_dst = prebuilt.get('by_dst')
+        if self.by_dst is None:
+            self.by_dst = {table.dst_values[code]: rows for code, rows in _group(table.dst_codes, frozenset).items()}
+        self.airport_names = prebuilt.get('airport_names') or TrigramIndex(table.upper_column('airport_names'))
+        self.city_names = prebuilt.get('city_names') or TrigramIndex(table.upper_column('city_names'))
+        logger.info(f'Indexed {len(table)} rows: {len(self.by_iata)} iata, {len(self.by_icao)} icao, '
+                    f'{len(self.by_country)} countries, {len(self.by_dst)} dst areas')
+
+    def updated(self, old_table, table, rows):
+        """
+        builds the indexes of a changed copy of the table from these ones, only redoing the entries of the rows that
+        changed. These indexes are left as they are, so searches that are still using them aren't affected.
+        :param old_table: the table these indexes were built over
+        :param table: the changed copy of it
+        :param rows: indices of the rows that were changed, added or removed
+        :return: a new AirportIndexes, whose range indexes are built again when they are needed
+        """
+        prebuilt = {}
+        for name, column, container in (('by_iata', 'iata_codes', tuple), ('by_icao', 'icao_codes', tuple)):
+            prebuilt[name] = patch_postings(getattr(self, name), rows, _keys(old_table, _upper_key(column)),
+                                            _keys(table, _upper_key(column)), container)
+        prebuilt['by_country'] = patch_postings(self.by_country, rows, _keys(old_table, _country_key),
+                                                _keys(table, _country_key), frozenset)
+        prebuilt['by_dst'] = patch_postings(self.by_dst, rows, _keys(old_table, _dst_key), _keys(table, _dst_key),
+                                            frozenset)
+        for name in ('airport_names', 'city_names'):
+            postings = patch_postings(getattr(self, name).postings, rows, _trigram_keys(old_table, name),
+                                      _trigram_keys(table, name), _row_array)
+            prebuilt[name] = TrigramIndex(table.upper_column(name), postings)
+        return AirportIndexes(table, prebuilt)
+
+    def candidates(self, params):
+        """
+        finds the rows that satisfy every indexed parameter in a normalized query
+        :param params: normalized search parameters (see business.query.normalize_params)
+        :return: a tuple of (sorted list of candidate row indices or None if no index applies,
+                 set of the parameters (and '<field>_range' filters) that the candidates fully answer)
+        """
+        row_sets = []
+        answered = set()
+        if 'iata_code' in params:
+            row_sets.append(self.by_iata.get(params['iata_code'], ()))
+            answered.add('iata_code')
+        if 'icao_code' in params:
+            row_sets.append(self.by_icao.get(params['icao_code'], ()))
+            answered.add('icao_code')
+        if 'country_name' in params and params['country_name'] != 'ALL':
+            row_sets.append(self.by_country.get(params['country_name'], frozenset()))
+            answered.add('country_name')
+        if 'dst_area' in params:
+            row_sets.append(self.by_dst.get(params['dst_area'], frozenset()))
+            answered.add('dst_area')
+        for field, (low, high) in value_ranges(params).items():
+            index = self.range_index(field)
+            start, stop = index.bounds(low, high)
+            if row_sets and min(len(rows) for rows in row_sets) <= stop - start:
+                continue
+            if not row_sets and stop - start > len(self.table) * MAX_RANGE_FRACTION:
+                continue
+            row_sets.append(index.rows[start:stop])
+            answered.add(f'{field}_range')
+        for name, index in (('airport_name', self.airport_names), ('city_name', self.city_names)):
+            if name not in params:
+                continue
+            estimate = index.estimate(params[name])
+            if estimate is None or (row_sets and min(len(rows) for rows in row_sets) <= estimate):
+                # too short to use the index, or the other indexes already left fewer rows to check
+                continue
+            row_sets.append(index.search(params[name]))
+            answered.add(name)
+        if not row_sets:
+            return None, answered
+        row_sets.sort(key=len)
+        rows = set(row_sets[0])
+        for other in row_sets[1:]:
+            if not rows:
+                break
+            rows.intersection_update(other)
+        return sorted(rows), answered
+
+    def range_index(self, field):
+        """
+        returns the range index of a numeric field, building it the first time it is asked for
+        :param field: one of business.query.RANGE_COLUMNS ('elevation', 'utc_offset', 'latitude', 'longitude')
+        :return: the RangeIndex
+        """
+        index = self._ranges.get(field)
+        if index is None:
+            with self._ranges_lock:
+                index = self._ranges.get(field)
+                if index is None:
+                    with metrics.span('index_build', index='range'):
+                        index = self._ranges[field] = RangeIndex(getattr(self.table, RANGE_COLUMNS[field]),
+                                                                 NULL_ELEVATION if field == 'elevation' else None)
+                    logger.info(f'Built range index of {len(index)} {field} values')
+        return index
+
+
+class RangeIndex:
+    def __init__(self, column, null=None):
+        self.rows = array('i')
+        self.values = array(column.typecode)
+        self.build(column, null)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def build(self, column, null=None):
+        """
+        sorts the rows of a numeric column by value, leaving out the rows that have no value
+        :param column: array of numbers, e.g. AirportTable.elevations
+        :param null: the value that stands for no value (a NaN never has one)
+        :return: n/a
+        """
+        rows = [index for index, value in enumerate(column) if value == value and value != null]
+        rows.sort(key=column.__getitem__)
+        self.rows = array('i', rows)
+        self.values = array(column.typecode, [column[index] for index in rows])
+
+    def bounds(self, low=None, high=None):
+        """
+        finds where the rows with values in a range are in the sorted rows
+        :param low: the lowest value, None for no lower bound
+        :param high: the highest value, None for no upper bound
+        :return: (start, stop), the slice of self.rows that is in the range, both ends of it included
+        """
+        values = self.values
+        start = 0 if low is None else bisect_left(values, low)
+        stop = len(values) if high is None else bisect_right(values, high)
+        return start, max(start, stop)
+
+    def search(self, low=None, high=None):
+        """
+        finds the rows with values in a range
+        :param low: the lowest value, None for no lower bound
+        :param high: the highest value, None for no upper bound
+        :return: array of the rows, in the order of their values
+        """
+        start, stop = self.bounds(low, high)
+        return self.rows[start:stop]
+
+
+class TrigramIndex:
+    def __init__(self, column, postings=None):
+        self.column = column
+        self.postings = {}
+        if postings is None:
+            self.build(column)
+        else:
+            self.postings = postings
+
+    def build(self, column):
+        """
+        builds the posting lists for a text column
+        :param column: list of uppercased strings
+        :return: n/a
+        """
+        postings = {}
+        for index, value in enumerate(column):
+            for trigram in trigrams(value):
+                rows = postings.get(trigram)
+                if rows is None:
+                    postings[trigram] = [index]
+                elif rows[-1] != index:
+                    rows.append(index)
+        self.column = column
+        self.postings = {trigram: array('i', rows) for trigram, rows in postings.items()}
+
+    def estimate(self, needle):
+        """
+        estimates how many rows a search for the needle would have to check
+        :param needle: uppercased string to search for
+        :return: the length of the shortest posting list, or None if the needle is too short to use the index
+        """
+        needle_trigrams = trigrams(needle)
+        if not needle_trigrams:
+            return None
+        return min(len(self.postings.get(trigram, ())) for trigram in needle_trigrams)
+
+    def search(self, needle):
+        """
+        finds the rows whose value contains the needle. Only the rows in the shortest posting list of the needle's
+        trigrams are checked, every match has to contain that trigram.
+        :param needle: uppercased string to search for
+        :return: sorted list of matching rows, or None if the needle is too short to use the index
+        """
+        needle_trigrams = trigrams(needle)
+        if not needle_trigrams:
+            return None
+        shortest = None
+        for trigram in needle_trigrams:
+            rows = self.postings.get(trigram)
+            if rows is None:
+                return []
+            if shortest is None or len(rows) < len(shortest):
+                shortest = rows
+        column = self.column
+        if len(needle) == TRIGRAM_LENGTH:
+            return list(shortest)
+        return [index for index in shortest if needle in column[index]]
+
+
+def patch_postings(postings, rows, old_keys, new_keys, container):
+    """
+    copies a dict of key to rows, moving the given rows from the keys they had to the keys they have now. Only the
+    posting lists of those keys are rebuilt, the rest are shared with the original (which isn't changed).
+    :param postings: dict (or read-only mapping) of key to rows
+    :param rows: indices of the rows that changed
+    :param old_keys: function of a row index to the set of keys it had (empty if it didn't exist)
+    :param new_keys: function of a row index to the set of keys it has now (empty if it was removed)
+    :param container: what to make each rebuilt posting list from its sorted rows, e.g. tuple
+    :return: the new dict
+    """
+    removed = {}
+    added = {}
+    for index in rows:
+        old = old_keys(index)
+        new = new_keys(index)
+        for key in old - new:
+            removed.setdefault(key, set()).add(index)
+        for key in new - old:
+            added.setdefault(key, set()).add(index)
+    patched = dict(postings)
+    for key in removed.keys() | added.keys():
+        key_rows = set(patched.get(key, ()))
+        key_rows -= removed.get(key, set())
+        key_rows |= added.get(key, set())
+        if key_rows:
+            patched[key] = container(sorted(key_rows))
+        else:
+            patched.pop(key, None)
+    return patched
+
+
+def trigrams(value):
+    """
+    splits a string into the set of its three character substrings
+    :param value: string to split
+    :return: set of trigrams (empty if the string is shorter than three characters)
+    """
+    return {value[start:start + TRIGRAM_LENGTH] for start in range(len(value) - TRIGRAM_LENGTH + 1)}
+
+
+def _group(column, container):
+    groups = {}
+    for index, value in enumerate(column):
+        rows = groups.get(value)
+        if rows is None:
+            groups[value] = [index]
+        else:
+            rows.append(index)
+    return {value: container(rows) for value, rows in groups.items()}
+
+
+def _row_array(rows):
+    return array('i', rows)
+
+
+def _keys(table, key):
+    count = len(table)
+    return lambda index: {key(table, index)} if index < count else set()
+
+
+def _trigram_keys(table, column_name):
+    column = table.upper_column(column_name)
+    return lambda index: trigrams(column[index]) if index < len(column) else set()
+
+
+def _upper_key(column_name):
+    return lambda table, index: table.upper_column(column_name)[index]
+
+
+def _country_key(table, index):
+    return table.country_values[table.country_codes[index]].upper().strip('"')
+
+
+def _dst_key(table, index):
+    return table.dst_values[table.dst_codes[index]]
@@ -0,0 +1,169 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+import weakref
+from multiprocessing import shared_memory
+from dal import pack_strings, unpack_strings
+from logging_config import get_logger
+import metrics
+from models import AirportTable, NUMERIC_COLUMNS, TEXT_COLUMNS
+from .query import compile_query
+
+"""
+This module contains a parallel scan for large datasets. The columns of an AirportTable (and the uppercased copies the
+text filters check against) are copied once into a block of shared memory, and a pool of worker processes each attach
+to it when they start, so a search only sends its parameters to the workers, never the data. The table is split into
+contiguous shards, each worker runs the compiled query over one shard, and the matches are joined back together in
+shard order, so the result is in table order exactly as a serial scan would give it.
+
+Starting the pool and sending each search to it cost more than scanning a small table, so a parallel scan is only used
+for tables with at least PARALLEL_MIN_ROWS rows, on machines with more than one core (see use_parallel()).
+
+Classes:
+--------
+    ParallelScanner:
+        runs compiled queries over a table in a pool of worker processes
+
+Methods:
+--------
+    use_parallel(row_count, parallel=None):
+        decides whether a table is worth scanning in parallel
+
+Constants:
+----------
+    PARALLEL_MIN_ROWS: the smallest table that is scanned in parallel when it is left to use_parallel()
+    UPPER_COLUMNS: the text columns whose uppercased copies are shared with the workers (the text filters use them)
+    ALIGNMENT: the boundary each column starts on in shared memory
+"""
+
+PARALLEL_MIN_ROWS = 200000
+UPPER_COLUMNS = ('airport_names', 'city_names', 'iata_codes', 'icao_codes')
+ALIGNMENT = 8
+logger = get_logger(__name__)
+
+# the table a worker process attached to, set by _attach when the worker starts
+_worker_table = None
+_worker_memory = None
+
+
+def use_parallel(row_count, parallel=None):
+    """
+    decides whether a table is worth scanning in parallel
+    :param row_count: number of rows in the table
+    :param parallel: True or False to force it either way, None to decide from the size of the table and the cores
+    :return: True to scan in parallel
+    """
+    if parallel is not None:
+        return parallel
+    return row_count >= PARALLEL_MIN_ROWS and (os.cpu_count() or 1) > 1
+
+
+class ParallelScanner:
+    def __init__(self, table, workers=None):
+        self.table = table
+        self.workers = workers or os.cpu_count() or 1
+        self._memory = None
+        self._layout = None
+        self._pool = None
+        self._lock = threading.Lock()
+        self._finalizer = None
+
+    def select(self, params, skip=()):
+        """
+        runs a query over every row of the table in the worker processes
+        :param params: dict of search parameters from AirportSearchBuilder.build()
+        :param skip: names of parameters that don't need checking (as for CompiledQuery.select)
+        :return: a list of the indices of the matching rows, in table order
+        """
+        count = len(self.table)
+        if not count:
+            return []
+        pool = self._start()
+        size = -(-count // self.workers)
+        with metrics.span('parallel_scan'):
+            futures = [pool.submit(_scan_shard, params, tuple(skip), start, min(count, start + size))
+                       for start in range(0, count, size)]
+            matches = []
+            for future in futures:
+                matches.extend(future.result())
+        metrics.increment('parallel_scans_total')
+        return matches
+
+    def close(self):
+        """
+        shuts down the worker processes and frees the shared memory
+        :return: n/a
+        """
+        with self._lock:
+            if self._finalizer is not None:
+                self._finalizer()
+            self._pool = self._memory = self._finalizer = None
+
+    def _start(self):
+        with self._lock:
+            if self._pool is None:
+                with metrics.span('parallel_start'):
+                    self._memory, self._layout = _share_table(self.table)
+                    # spawned rather than forked, the parent has threads running (the loader, the thread pool)
+                    self._pool = ProcessPoolExecutor(self.workers, multiprocessing.get_context('spawn'),
+                                                     initializer=_attach, initargs=(self._memory.name, self._layout))
+                # the workers and the shared memory go away with the scanner even if close() is never called
+                self._finalizer = weakref.finalize(self, _release, self._pool, self._memory)
+                logger.info(f'Started {self.workers} workers to scan {len(self.table)} rows in parallel')
+            return self._pool
+
+
+def _share_table(table):
+    sections = {}
+    counts = {}
+    for name in NUMERIC_COLUMNS:
+        column = getattr(table, name)
+        sections[name] = (memoryview(column).cast('B'), column.typecode if isinstance(column, array) else
+                          memoryview(column).format)
+    for name in TEXT_COLUMNS:
+        sections[name] = (pack_strings(getattr(table, name)), None)
+        counts[name] = len(getattr(table, name))
+    for name in UPPER_COLUMNS:
+        sections[f'{name}.upper'] = (pack_strings(table.upper_column(name)), None)
+        counts[f'{name}.upper'] = counts[name]
+    offset = 0
+    layout = {}
+    for name, (data, typecode) in sections.items():
+        offset += -offset % ALIGNMENT
+        layout[name] = (offset, len(data), typecode, counts.get(name))
+        offset += len(data)
+    memory = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name, (data, _) in sections.items():
+        start, length, _, _ = layout[name]
+        memory.buf[start:start + length] = data
+    return memory, layout
+
+
+def _release(pool, memory):
+    pool.shutdown(wait=True, cancel_futures=True)
+    memory.close()
+    memory.unlink()
+
+
+def _attach(name, layout):
+    # runs once in each worker: maps the shared memory and builds a table over it
+    global _worker_table, _worker_memory
+    _worker_memory = shared_memory.SharedMemory(name=name)
+    view = _worker_memory.buf
+    columns = {}
+    text = {}
+    for section, (start, length, typecode, count) in layout.items():
+        data = view[start:start + length]
+        if typecode is not None:
+            columns[section] = data.cast(typecode)
+        else:
+            text[section] = unpack_strings(data, count)
+    columns.update((name, text[name]) for name in TEXT_COLUMNS)
+    _worker_table = AirportTable.from_columns(columns, {name: text[f'{name}.upper'] for name in UPPER_COLUMNS})
+
+
+def _scan_shard(params, skip, start, stop):
+    # an array pickles far smaller than a list of ints
+    return array('i', compile_query(params).select(_worker_table, range(start, stop), skip))
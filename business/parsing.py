@@ -0,0 +1,140 @@
+from exceptions import BusinessLogicException
+from logging_config import get_logger
+import metrics
+from models import NULL_MARKER
+from io import StringIO
+import codecs
+import csv
+
+"""
+This module contains a bulk parser for the airport data. Rather than building a reader for every line, the whole body is
+decoded once and run through a single csv pass, and the numeric fields are converted to numbers while it parses.
+
+Methods:
+--------
+    parse_airport_data(data):
+        parses the whole body of airports.dat into rows of typed fields
+    iter_airport_rows(chunks):
+        parses airports.dat as it arrives, a batch of rows for every chunk of the body
+    to_float(token):
+        converts a token to a float, or None for the null marker
+    to_int(token):
+        converts a token to an int, or None for the null marker
+"""
+
+logger = get_logger(__name__)
+
+
+def to_float(token):
+    """
+    converts a token to a float, or None for the null marker
+    :param token: token from the csv
+    :return: float value of the token, or None
+    """
+    if token == NULL_MARKER or token == '':
+        return None
+    return float(token)
+
+
+def to_int(token):
+    """
+    converts a token to an int, or None for the null marker
+    :param token: token from the csv
+    :return: int value of the token, or None
+    """
+    if token == NULL_MARKER or token == '':
+        return None
+    try:
+        return int(token)
+    except ValueError:
+        return int(float(token))
+
+
+def parse_airport_data(data):
+    """
+    parses the whole body of airports.dat into rows of typed fields. The airport id and elevation become ints, latitude,
+    longitude and utc offset become floats (None where the data has the null marker), the text fields are left as they
+    are.
+    :param data: the body of airports.dat, as bytes or str
+    :return: a list of 11-item tuples in the same order as the Airport constructor
+    """
+    try:
+        with metrics.span('parse'):
+            text = data.decode('utf-8') if isinstance(data, bytes) else data
+            try:
+                rows = _parse_nonnumeric(text)
+            except (ValueError, TypeError, csv.Error):
+                # an unquoted field that isn't a number, a quoted one that is, or a null marker inside a quoted field:
+                # go through the slower path that converts field by field
+                logger.warning('Falling back to field by field parsing of airport data')
+                rows = _parse_tokens(text)
+        metrics.increment('rows_parsed_total', len(rows))
+        return rows
+    except (UnicodeDecodeError, csv.Error, IndexError, ValueError) as e:
+        logger.error(f'Error parsing airport data: {e}')
+        raise BusinessLogicException
+
+
+def iter_airport_rows(chunks):
+    """
+    parses airports.dat as it arrives. Each chunk is decoded (a character split across two chunks is held back until
+    the rest of it arrives) and the complete lines in it go through parse_airport_data, the rest of the last line waits
+    for the next chunk.
+    :param chunks: iterable of bytes, e.g. from DatasetCache.iter_chunks()
+    :return: generator of lists of 11-item tuples, one list per chunk that finished at least one line
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    try:
+        for chunk in chunks:
+            text = pending + decoder.decode(chunk)
+            end = text.rfind('\n') + 1
+            pending = text[end:]
+            if end:
+                yield parse_airport_data(text[:end])
+        text = pending + decoder.decode(b'', final=True)
+    except UnicodeDecodeError as e:
+        logger.error(f'Error parsing airport data: {e}')
+        raise BusinessLogicException
+    if text.strip():
+        yield parse_airport_data(text)
+
+
+def _parse_nonnumeric(text):
+    # the text fields are all quoted and the numbers are not, so by quoting the null markers the csv module can convert
+    # every numeric field itself while it reads the file. A null marker inside a quoted field would be quoted too,
+    # which breaks the quoting of that field, so the reader is strict and raises csv.Error for it.
+    text = text.replace(',' + NULL_MARKER, ',"' + NULL_MARKER + '"')
+    rows = []
+    append = rows.append
+    for tokens in csv.reader(StringIO(text), quoting=csv.QUOTE_NONNUMERIC, strict=True):
+        if not tokens:
+            continue
+        latitude, longitude, elevation, utc_offset = tokens[6], tokens[7], tokens[8], tokens[9]
+        if str in (type(latitude), type(longitude), type(elevation), type(utc_offset)):
+            latitude, longitude, elevation, utc_offset = map(_null_marker, (latitude, longitude, elevation, utc_offset))
+        append((int(tokens[0]), tokens[1], tokens[2], tokens[3], tokens[4], tokens[5],
+                None if latitude == NULL_MARKER else latitude,
+                None if longitude == NULL_MARKER else longitude,
+                None if elevation == NULL_MARKER else int(elevation),
+                None if utc_offset == NULL_MARKER else utc_offset,
+                tokens[10]))
+    return rows
+
+
+def _null_marker(token):
+    # a quoted numeric field comes back as a string, the only one that is allowed is the null marker
+    if isinstance(token, str) and token != NULL_MARKER:
+        raise ValueError(f'Quoted number: {token!r}')
+    return token
+
+
+def _parse_tokens(text):
+    rows = []
+    append = rows.append
+    for tokens in csv.reader(StringIO(text)):
+        if not tokens:
+            continue
+        append((to_int(tokens[0]), tokens[1], tokens[2], tokens[3], tokens[4], tokens[5], to_float(tokens[6]),
+                to_float(tokens[7]), to_int(tokens[8]), to_float(tokens[9]), tokens[10]))
+    return rows
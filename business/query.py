@@ -0,0 +1,283 @@
+import math
+from exceptions import BusinessLogicException
+from logging_config import get_logger
+from models import DST_CODES, NULL_ELEVATION
+
+"""
+This module compiles the search parameters from an AirportSearchBuilder into a CompiledQuery once per search. All of
+the work that doesn't depend on the row (uppercasing, parsing numbers, mapping dst names, finding which dictionary codes
+a country matches) is done up front, so scanning the table is only the comparisons themselves, one column at a time.
+
+The numeric parameters are ranges over their column: min_/max_elevation, min_/max_utc_offset and a bounding box of
+min_/max_latitude and min_/max_longitude (both ends included), with elevation being a minimum elevation and utc_offset
+a range of a single value. All the bounds on a column are combined into one range, which the indexes can answer with a
+binary search (see indexes.RangeIndex).
+
+Methods:
+--------
+    normalize_params(params):
+        puts search parameters into a canonical form (uppercased text, parsed numbers)
+    canonical_key(params):
+        turns search parameters into a hashable key that is the same for every way of writing the same search
+    value_ranges(params):
+        combines the numeric search parameters into a range of values for each column they search
+    compile_query(params):
+        compiles search parameters into a CompiledQuery
+
+Classes:
+--------
+    CompiledQuery:
+        a list of column filters that narrows the rows of an AirportTable down to the matches
+    GeoQuery:
+        the center, radius and/or number of rows of a distance search, which the dataset answers from its GeoGrid
+
+Constants:
+----------
+    SEARCH_PARAMS: the search parameters the compiler understands
+    GEO_PARAMS: the search parameters that turn latitude/longitude into a distance search
+    RANGE_PARAMS: the search parameters that bound a numeric column, and which column and end(s) of its range they set
+    RANGE_COLUMNS: the columns of AirportTable the ranges search
+    FILTER_ORDER: the order the filters are applied in, the most selective and cheapest first (a range is filtered on
+                  as '<field>_range')
+    COORDINATE_TOLERANCE: how far from the searched latitude a row can be and still round to the same value
+"""
+
+SEARCH_PARAMS = ('airport_name', 'city_name', 'iata_code', 'icao_code', 'country_name', 'utc_offset', 'latitude',
+                 'longitude', 'elevation', 'dst_area', 'radius_km', 'nearest', 'min_elevation', 'max_elevation',
+                 'min_utc_offset', 'max_utc_offset', 'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude')
+GEO_PARAMS = ('radius_km', 'nearest')
+# parameter: (field, sets the low end, sets the high end)
+RANGE_PARAMS = {'elevation': ('elevation', True, False), 'min_elevation': ('elevation', True, False),
+                'max_elevation': ('elevation', False, True), 'utc_offset': ('utc_offset', True, True),
+                'min_utc_offset': ('utc_offset', True, False), 'max_utc_offset': ('utc_offset', False, True),
+                'min_latitude': ('latitude', True, False), 'max_latitude': ('latitude', False, True),
+                'min_longitude': ('longitude', True, False), 'max_longitude': ('longitude', False, True)}
+RANGE_COLUMNS = {'elevation': 'elevations', 'utc_offset': 'utc_offsets', 'latitude': 'latitudes',
+                 'longitude': 'longitudes'}
+FILTER_ORDER = ('iata_code', 'icao_code', 'dst_area', 'country_name', 'utc_offset_range', 'elevation_range',
+                'latitude_range', 'longitude_range', 'latitude', 'city_name', 'airport_name')
+COORDINATE_TOLERANCE = 0.006
+logger = get_logger(__name__)
+
+
+def normalize_params(params):
+    """
+    puts search parameters into a canonical form: text is uppercased, numbers are parsed and the dst name is mapped to
+    the single-letter value from the data
+    :param params: dict of search parameters from AirportSearchBuilder.build()
+    :return: a new dict of normalized search parameters
+    """
+    normalized = {}
+    try:
+        for key, value in params.items():
+            if key in ('airport_name', 'city_name', 'iata_code', 'icao_code'):
+                normalized[key] = str(value).upper()
+            elif key == 'country_name':
+                normalized[key] = str(value).upper().strip('"')
+            elif key in ('utc_offset', 'latitude', 'longitude', 'radius_km', 'min_utc_offset', 'max_utc_offset',
+                         'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude'):
+                normalized[key] = float(value)
+            elif key in ('elevation', 'nearest', 'min_elevation', 'max_elevation'):
+                normalized[key] = int(value)
+            elif key == 'dst_area':
+                normalized[key] = DST_CODES.get(value, value)
+            else:
+                logger.error(f'Unknown search parameter: {key}')
+                raise BusinessLogicException(f'Unknown search parameter: {key}')
+    except ValueError as e:
+        logger.error(f'Invalid search parameter: {e}')
+        raise BusinessLogicException(f'Invalid search parameter: {e}')
+    return normalized
+
+
+def canonical_key(params):
+    """
+    turns search parameters into a hashable key that is the same for every way of writing the same search (any key
+    order, any case, numbers as text or not, and 'ALL' countries or no country at all)
+    :param params: dict of search parameters from AirportSearchBuilder.build()
+    :return: a tuple of (name, normalized value) sorted by name
+    """
+    normalized = normalize_params(params)
+    if normalized.get('country_name') == 'ALL':
+        del normalized['country_name']
+    return tuple(sorted(normalized.items()))
+
+
+def value_ranges(params):
+    """
+    combines the numeric search parameters into a range of values for each column they search, e.g. min_elevation=100
+    and elevation=500 are the range (500, None) of elevation
+    :param params: normalized search parameters (see normalize_params)
+    :return: dict of field ('elevation', 'utc_offset', 'latitude' or 'longitude') to (lowest value or None, highest
+             value or None), both ends included
+    """
+    ranges = {}
+    for key, value in params.items():
+        bound = RANGE_PARAMS.get(key)
+        if bound is None:
+            continue
+        field, sets_low, sets_high = bound
+        low, high = ranges.get(field, (None, None))
+        if sets_low:
+            low = value if low is None else max(low, value)
+        if sets_high:
+            high = value if high is None else min(high, value)
+        ranges[field] = (low, high)
+    return ranges
+
+
+def compile_query(params):
+    """
+    compiles search parameters into a CompiledQuery
+    :param params: dict of search parameters from AirportSearchBuilder.build()
+    :return: a CompiledQuery
+    """
+    normalized = normalize_params(params)
+    if ('latitude' in normalized) != ('longitude' in normalized):
+        # a latitude without a longitude (or the other way around) never matched anything
+        return CompiledQuery(normalized, [], matches_nothing=True)
+    geo = None
+    if any(key in normalized for key in GEO_PARAMS):
+        if 'latitude' not in normalized:
+            logger.error('A distance search needs a latitude and longitude')
+            raise BusinessLogicException('A distance search needs a latitude and longitude')
+        geo = GeoQuery(normalized['latitude'], normalized['longitude'], normalized.get('radius_km'),
+                       normalized.get('nearest'))
+    ranges = value_ranges(normalized)
+    filters = []
+    for key in FILTER_ORDER:
+        if key.endswith('_range'):
+            field = key[:-len('_range')]
+            if field in ranges:
+                filters.append((key, _between(RANGE_COLUMNS[field], *ranges[field])))
+            continue
+        if key not in normalized:
+            continue
+        value = normalized[key]
+        if key == 'airport_name':
+            filters.append((key, _contains('airport_names', value)))
+        elif key == 'city_name':
+            filters.append((key, _contains('city_names', value)))
+        elif key == 'iata_code':
+            filters.append((key, _equals_upper('iata_codes', value)))
+        elif key == 'icao_code':
+            filters.append((key, _equals_upper('icao_codes', value)))
+        elif key == 'country_name':
+            if value != 'ALL':
+                filters.append((key, _in_dictionary('country_codes', 'country_values', _country_matcher(value))))
+        elif key == 'dst_area':
+            filters.append((key, _in_dictionary('dst_codes', 'dst_values', lambda dst, code=value: dst == code)))
+        elif key == 'latitude' and geo is None:
+            filters.append((key, _rounded_coordinates(normalized['latitude'], normalized['longitude'])))
+    return CompiledQuery(normalized, filters, geo=geo)
+
+
+class CompiledQuery:
+    def __init__(self, params, filters, matches_nothing=False, geo=None):
+        self.params = params
+        self.filters = filters
+        self.matches_nothing = matches_nothing
+        self.geo = geo
+
+    def __str__(self):
+        names = [name for name, _ in self.filters]
+        if self.geo is not None:
+            names.append(str(self.geo))
+        return ', '.join(names) or 'all rows'
+
+    def select(self, table, rows=None, skip=()):
+        """
+        runs the filters over the table, each one narrowing down the rows the previous one matched
+        :param table: the AirportTable to search
+        :param rows: optional list of row indices to start from (in table order), all rows if None
+        :param skip: names of parameters that the starting rows already satisfy, e.g. from an index
+        :return: a list of the indices of the matching rows, in table order
+        """
+        if self.matches_nothing:
+            return []
+        if rows is not None and not rows:
+            return []
+        for name, apply in self.filters:
+            if name in skip:
+                continue
+            rows = apply(table, rows)
+            if not rows:
+                return []
+        return list(range(len(table))) if rows is None else list(rows)
+
+
+class GeoQuery:
+    def __init__(self, latitude, longitude, radius_km=None, nearest=None):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius_km = radius_km
+        self.nearest = nearest
+
+    def __str__(self):
+        if self.nearest is not None:
+            return f'nearest {self.nearest}'
+        return f'within {self.radius_km} km'
+
+
+def _country_matcher(value):
+    return lambda country: country.upper().strip('"') == value
+
+
+def _equals_upper(column_name, value):
+    def apply(table, rows):
+        column = table.upper_column(column_name)
+        if rows is None:
+            return [index for index, item in enumerate(column) if item == value]
+        return [index for index in rows if column[index] == value]
+    return apply
+
+
+def _contains(column_name, value):
+    def apply(table, rows):
+        column = table.upper_column(column_name)
+        if rows is None:
+            return [index for index, item in enumerate(column) if value in item]
+        return [index for index in rows if value in column[index]]
+    return apply
+
+
+def _between(column_name, low, high):
+    # a missing number is NaN, which fails every comparison, or the null elevation, which is below the lowest bound
+    low = (NULL_ELEVATION + 1 if column_name == 'elevations' else -math.inf) if low is None else low
+    high = math.inf if high is None else high
+
+    def apply(table, rows):
+        column = getattr(table, column_name)
+        if rows is None:
+            return [index for index, item in enumerate(column) if low <= item <= high]
+        return [index for index in rows if low <= column[index] <= high]
+    return apply
+
+
+def _in_dictionary(codes_name, values_name, matches):
+    # the test only runs once per distinct value, the rows are then matched on their integer code
+    def apply(table, rows):
+        codes = getattr(table, codes_name)
+        wanted = {code for code, item in enumerate(getattr(table, values_name)) if matches(item)}
+        if not wanted:
+            return []
+        if rows is None:
+            return [index for index, code in enumerate(codes) if code in wanted]
+        return [index for index in rows if codes[index] in wanted]
+    return apply
+
+
+def _rounded_coordinates(latitude, longitude):
+    search_lat = round(latitude, 2)
+    search_lon = round(longitude, 2)
+    low_lat, high_lat = search_lat - COORDINATE_TOLERANCE, search_lat + COORDINATE_TOLERANCE
+
+    def apply(table, rows):
+        latitudes = table.latitudes
+        longitudes = table.longitudes
+        if rows is None:
+            rows = range(len(table))
+        # cheap range check first, only the rows that are close get rounded
+        return [index for index in rows if low_lat <= latitudes[index] <= high_lat
+                and round(latitudes[index], 2) == search_lat and round(longitudes[index], 2) == search_lon]
+    return apply
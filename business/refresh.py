@@ -0,0 +1,132 @@
+from logging_config import get_logger
+import metrics
+from .dataset import AirportDataset
+
+"""
+This module refreshes a loaded AirportDataset incrementally. The new feed is diffed against the loaded rows by
+airport_id, and only the inserts, updates and deletes are applied, to a copy of the table. The indexes and the geo grid
+of the copy are patched from the old ones, only redoing the entries of the rows that changed, instead of being built
+from scratch. The old dataset isn't touched, so searches that are still running against it see a consistent snapshot
+until the new one is published (a single assignment, see AirportSearchService).
+
+A deleted row is filled by moving the last row into its place, so no other row changes index. New airports are added at
+the end. After a refresh the rows may therefore not be in exactly the order of the feed, until the next full load.
+
+Classes:
+--------
+    RowDiff:
+        the inserts, updates and deletes that turn the loaded rows into the rows of a new feed
+
+Methods:
+--------
+    diff_rows(table, rows):
+        diffs the rows of a new feed against a loaded table by airport_id
+    apply_diff(dataset, diff):
+        builds a new dataset from a loaded one and the changes to it
+    refresh_dataset(dataset, rows, max_fraction=INCREMENTAL_MAX_FRACTION):
+        refreshes a dataset from the rows of a new feed, incrementally if that is worth it
+
+Constants:
+----------
+    INCREMENTAL_MAX_FRACTION: if more than this fraction of the rows changed, rebuilding from scratch is quicker
+"""
+
+INCREMENTAL_MAX_FRACTION = 0.25
+logger = get_logger(__name__)
+
+
+class RowDiff:
+    def __init__(self, inserts, updates, deletes):
+        self.inserts = inserts
+        self.updates = updates
+        self.deletes = deletes
+
+    def __len__(self):
+        return len(self.inserts) + len(self.updates) + len(self.deletes)
+
+    def __str__(self):
+        return f'{len(self.inserts)} inserts, {len(self.updates)} updates, {len(self.deletes)} deletes'
+
+
+def diff_rows(table, rows):
+    """
+    diffs the rows of a new feed against a loaded table by airport_id
+    :param table: the loaded AirportTable
+    :param rows: iterable of 11-item tuples from the new feed
+    :return: a RowDiff of new rows, (row index, new row) pairs and row indices to delete, or None if the airport ids
+             aren't unique (in either) so the rows can't be matched up
+    """
+    loaded = {airport_id: index for index, airport_id in enumerate(table.airport_ids)}
+    if len(loaded) != len(table):
+        return None
+    inserts = []
+    updates = []
+    seen = set()
+    for row in rows:
+        airport_id = int(row[0])
+        if airport_id in seen:
+            return None
+        seen.add(airport_id)
+        index = loaded.get(airport_id)
+        if index is None:
+            inserts.append(row)
+        elif table.record(index) != tuple(row):
+            updates.append((index, row))
+    deletes = [index for airport_id, index in loaded.items() if airport_id not in seen]
+    return RowDiff(inserts, updates, deletes)
+
+
+def apply_diff(dataset, diff):
+    """
+    builds a new dataset from a loaded one and the changes to it. The loaded dataset isn't changed.
+    :param dataset: the loaded AirportDataset
+    :param diff: RowDiff from diff_rows()
+    :return: a new AirportDataset
+    """
+    old_table = dataset.table
+    table = old_table.copy()
+    touched = set()
+    for index, row in diff.updates:
+        table.replace(index, row)
+        touched.add(index)
+    # highest first, so a row that is moved into a hole is never one that is about to be deleted
+    for index in sorted(diff.deletes, reverse=True):
+        moved = table.remove(index)
+        touched.add(index)
+        if moved is not None:
+            touched.add(moved)
+    for row in diff.inserts:
+        touched.add(table.append(row))
+    with metrics.span('index_patch'):
+        indexes = dataset.indexes.updated(old_table, table, touched)
+        grid = dataset.grid.updated(old_table, table, touched)
+    return AirportDataset(table, indexes, grid)
+
+
+def refresh_dataset(dataset, rows, max_fraction=INCREMENTAL_MAX_FRACTION):
+    """
+    refreshes a dataset from the rows of a new feed, applying only what changed
+    :param dataset: the loaded AirportDataset
+    :param rows: iterable of 11-item tuples from the new feed
+    :param max_fraction: if more than this fraction of the rows changed, None is returned so the caller rebuilds
+    :return: the same dataset if nothing changed, a new one with the changes applied, or None if the caller should
+             build a new dataset from scratch instead
+    """
+    if not len(dataset):
+        return None
+    with metrics.span('refresh_diff'):
+        diff = diff_rows(dataset.table, rows)
+    if diff is None:
+        logger.warning('Airport ids are not unique, rebuilding the dataset from scratch')
+        return None
+    if len(diff) > max_fraction * max(len(dataset), len(dataset) - len(diff.deletes) + len(diff.inserts)):
+        logger.info(f'Refresh changed too much to apply incrementally ({diff})')
+        return None
+    metrics.increment('refresh_inserts_total', len(diff.inserts))
+    metrics.increment('refresh_updates_total', len(diff.updates))
+    metrics.increment('refresh_deletes_total', len(diff.deletes))
+    if not len(diff):
+        logger.info('Refresh found no changes')
+        return dataset
+    logger.info(f'Applying refresh incrementally ({diff})')
+    return apply_diff(dataset, diff)
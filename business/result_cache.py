@@ -0,0 +1,120 @@
+from collections import OrderedDict
+import threading
+import time
+from logging_config import get_logger
+import metrics
+
+"""
+This module contains an LRU cache of search results. Results are keyed on the canonical form of the search parameters
+(see query.canonical_key) and the version of the dataset they were found in. Loading a new dataset bumps the version
+and empties the cache, so a result is never served from data that has since been replaced, even by a search that was
+still running when the new data arrived.
+
+The cache is bounded three ways: by the number of entries, by the total number of result rows held, and by how long an
+entry is kept. It is safe to use from several threads at once.
+
+Classes:
+--------
+    QueryResultCache:
+        an LRU cache of search results with hit/miss counters
+
+Constants:
+----------
+    MAX_ENTRIES: the default number of searches the cache holds
+    MAX_ROWS: the default total number of result rows the cache holds
+    RESULT_TTL: the default number of seconds a result is kept
+"""
+
+MAX_ENTRIES = 256
+MAX_ROWS = 200000
+RESULT_TTL = 300
+logger = get_logger(__name__)
+
+
+class QueryResultCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_rows=MAX_ROWS, ttl=RESULT_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.clock = clock
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, version, key):
+        """
+        looks up the results of a search, and marks them as the most recently used
+        :param version: the dataset version the caller is searching
+        :param key: the canonical key of the search parameters
+        :return: the results, or None if they aren't cached (or have expired)
+        """
+        with self._lock:
+            entry = self._entries.get((version, key))
+            if entry is not None:
+                expires, results = entry
+                if expires > self.clock():
+                    self._entries.move_to_end((version, key))
+                    self.hits += 1
+                    metrics.increment('result_cache_hits_total')
+                    return results
+                self._remove((version, key))
+            self.misses += 1
+            metrics.increment('result_cache_misses_total')
+            return None
+
+    def put(self, version, key, results):
+        """
+        caches the results of a search. They are dropped if the dataset has been replaced since the search started,
+        or if they are too big to cache at all.
+        :param version: the dataset version the results were found in
+        :param key: the canonical key of the search parameters
+        :param results: the results, which must not be changed afterwards (e.g. a tuple)
+        :return: n/a
+        """
+        if len(results) > self.max_rows:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            if (version, key) in self._entries:
+                self._remove((version, key))
+            self._entries[(version, key)] = (self.clock() + self.ttl, results)
+            self._rows += len(results)
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+                metrics.increment('result_cache_evictions_total')
+            metrics.set_gauge('result_cache_entries', len(self._entries))
+
+    def invalidate(self):
+        """
+        empties the cache and moves on to a new dataset version, called whenever the dataset is replaced
+        :return: the new version
+        """
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._rows = 0
+            metrics.set_gauge('result_cache_entries', 0)
+            logger.info(f'Search result cache invalidated (dataset version {self.version})')
+            return self.version
+
+    def stats(self):
+        """
+        returns the cache's counters
+        :return: dict of hits, misses, evictions, entries, rows and the dataset version
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'rows': self._rows, 'version': self.version}
+
+    def _remove(self, entry_key):
+        _, results = self._entries.pop(entry_key)
+        self._rows -= len(results)
@@ -0,0 +1,253 @@
+from array import array
+from collections import deque
+from io import StringIO
+import csv
+from exceptions import BusinessLogicException
+from logging_config import get_logger
+import metrics
+from models import NULL_MARKER
+
+"""
+This module contains the route network from the OpenFlights routes.dat (and the airline names from airlines.dat). The
+routes are kept as a graph in compressed sparse row form: the airports that have routes are numbered in order of their
+airport id, `offsets[node]` to `offsets[node + 1]` is the slice of `targets` holding the nodes that airport flies to
+directly, and the same slice of `edge_airlines` points into `airlines` for the carriers on each of those routes. A
+route flown by several airlines is stored once. Following a route is two array lookups, so a breadth first search over
+the whole network takes milliseconds.
+
+The graph is keyed by airport id (the same ids as airports.dat), the search service turns them back into AirportRow.
+
+Classes:
+--------
+    RouteGraph:
+        the route network, answers direct destination, fewest hops and reachability queries
+
+Methods:
+--------
+    parse_routes_data(data, airport_codes=None):
+        parses the body of routes.dat into (airline code, source airport id, destination airport id)
+    parse_airlines_data(data):
+        parses the body of airlines.dat into a dict of airline code to airline name
+
+Constants:
+----------
+    MAX_HOPS: the most hops a reachability query may ask for
+"""
+
+MAX_HOPS = 6
+logger = get_logger(__name__)
+
+
+def parse_routes_data(data, airport_codes=None):
+    """
+    parses the body of routes.dat. A route whose airport ids are missing (the null marker) is matched to the airport by
+    its IATA/ICAO code instead, if airport_codes is given, and dropped if it can't be.
+    :param data: body of routes.dat, as bytes or str
+    :param airport_codes: optional dict of uppercased IATA/ICAO code to airport id
+    :return: list of (airline code, source airport id, destination airport id)
+    """
+    airport_codes = airport_codes or {}
+    routes = []
+    skipped = 0
+    try:
+        with metrics.span('parse', dataset='routes'):
+            text = data.decode('utf-8') if isinstance(data, bytes) else data
+            for tokens in csv.reader(StringIO(text)):
+                if len(tokens) < 6:
+                    continue
+                source = _airport_id(tokens[3], tokens[2], airport_codes)
+                destination = _airport_id(tokens[5], tokens[4], airport_codes)
+                if source is None or destination is None:
+                    skipped += 1
+                    continue
+                routes.append((tokens[0], source, destination))
+    except (UnicodeDecodeError, csv.Error, ValueError) as e:
+        logger.error(f'Error parsing route data: {e}')
+        raise BusinessLogicException(f'Unable to parse route data: {e}')
+    if skipped:
+        logger.info(f'Skipped {skipped} routes with unknown airports')
+    metrics.increment('rows_parsed_total', len(routes), dataset='routes')
+    return routes
+
+
+def parse_airlines_data(data):
+    """
+    parses the body of airlines.dat into the names of the airlines, keyed by the codes routes.dat uses for them
+    :param data: body of airlines.dat, as bytes or str
+    :return: dict of IATA (or ICAO) airline code to airline name
+    """
+    names = {}
+    try:
+        text = data.decode('utf-8') if isinstance(data, bytes) else data
+        for tokens in csv.reader(StringIO(text)):
+            if len(tokens) < 5:
+                continue
+            active = len(tokens) > 7 and tokens[7] == 'Y'
+            for code in (tokens[4], tokens[3]):
+                # codes are reused once an airline stops flying, so an active airline wins over a defunct one
+                if code and code != NULL_MARKER and code != '-' and (active or code not in names):
+                    names[code] = tokens[1]
+    except (UnicodeDecodeError, csv.Error) as e:
+        logger.error(f'Error parsing airline data: {e}')
+        raise BusinessLogicException(f'Unable to parse airline data: {e}')
+    return names
+
+
+class RouteGraph:
+    def __init__(self, routes=(), airline_names=None):
+        self.airline_names = airline_names or {}
+        self.airport_ids = array('i')
+        self.offsets = array('i', [0])
+        self.targets = array('i')
+        self.edge_airlines = array('i', [0])
+        self.airlines = array('i')
+        self.airline_codes = []
+        self._nodes = {}
+        self.build(routes)
+
+    def __len__(self):
+        return len(self.airport_ids)
+
+    def build(self, routes):
+        """
+        builds the compressed sparse row arrays from a list of routes
+        :param routes: iterable of (airline code, source airport id, destination airport id), e.g. from
+                       parse_routes_data()
+        :return: n/a
+        """
+        with metrics.span('index_build', dataset='routes'):
+            codes = {}
+            edges = {}
+            for airline, source, destination in routes:
+                code = codes.get(airline)
+                if code is None:
+                    code = codes[airline] = len(codes)
+                edges.setdefault((source, destination), set()).add(code)
+            self.airline_codes = list(codes)
+            self.airport_ids = array('i', sorted({airport_id for edge in edges for airport_id in edge}))
+            self._nodes = {airport_id: node for node, airport_id in enumerate(self.airport_ids)}
+            nodes = self._nodes
+            self.offsets = array('i', [0]) * (len(self.airport_ids) + 1)
+            self.targets = array('i')
+            self.edge_airlines = array('i', [0])
+            self.airlines = array('i')
+            # sorting by source airport id is sorting by node, so each node's edges end up in one slice
+            for (source, destination), carriers in sorted(edges.items()):
+                self.offsets[nodes[source] + 1] += 1
+                self.targets.append(nodes[destination])
+                self.airlines.extend(sorted(carriers))
+                self.edge_airlines.append(len(self.airlines))
+            for node in range(len(self.airport_ids)):
+                self.offsets[node + 1] += self.offsets[node]
+        logger.info(f'Built route graph of {len(self.airport_ids)} airports, {len(self.targets)} routes and '
+                    f'{len(self.airline_codes)} airlines')
+
+    @property
+    def route_count(self):
+        return len(self.targets)
+
+    def destinations(self, airport_id):
+        """
+        finds the airports there is a direct flight to
+        :param airport_id: id of the airport to fly from
+        :return: list of airport ids, in id order (empty if the airport has no routes)
+        """
+        node = self._nodes.get(airport_id)
+        if node is None:
+            return []
+        airport_ids = self.airport_ids
+        return [airport_ids[target] for target in self.targets[self.offsets[node]:self.offsets[node + 1]]]
+
+    def airlines_between(self, source_id, destination_id):
+        """
+        finds the airlines that fly a route
+        :param source_id: id of the airport the route starts at
+        :param destination_id: id of the airport it goes to
+        :return: list of (airline code, airline name or None), empty if there is no such route
+        """
+        node = self._nodes.get(source_id)
+        target = self._nodes.get(destination_id)
+        if node is None or target is None:
+            return []
+        for edge in range(self.offsets[node], self.offsets[node + 1]):
+            if self.targets[edge] == target:
+                codes = [self.airline_codes[airline] for airline in
+                         self.airlines[self.edge_airlines[edge]:self.edge_airlines[edge + 1]]]
+                return [(code, self.airline_names.get(code)) for code in codes]
+        return []
+
+    def shortest_path(self, source_id, destination_id, max_hops=None):
+        """
+        finds a route with the fewest hops (flights) between two airports, by breadth first search
+        :param source_id: id of the airport to start at
+        :param destination_id: id of the airport to get to
+        :param max_hops: optional limit on the number of flights
+        :return: list of airport ids from the source to the destination (just the source if they are the same), or None
+                 if the destination can't be reached
+        """
+        start = self._nodes.get(source_id)
+        goal = self._nodes.get(destination_id)
+        if start is None or goal is None:
+            return [source_id] if source_id == destination_id else None
+        with metrics.span('route_search'):
+            parents = array('i', [-1]) * len(self.airport_ids)
+            parents[start] = start
+            frontier = [start]
+            hops = 0
+            offsets, targets = self.offsets, self.targets
+            while frontier and parents[goal] < 0 and (max_hops is None or hops < max_hops):
+                hops += 1
+                following = []
+                for node in frontier:
+                    for target in targets[offsets[node]:offsets[node + 1]]:
+                        if parents[target] < 0:
+                            parents[target] = node
+                            following.append(target)
+                    if parents[goal] >= 0:
+                        break
+                frontier = following
+            if parents[goal] < 0:
+                return None
+            path = deque([goal])
+            while path[0] != start:
+                path.appendleft(parents[path[0]])
+        return [self.airport_ids[node] for node in path]
+
+    def reachable(self, airport_id, max_hops):
+        """
+        finds every airport that can be reached within a number of flights
+        :param airport_id: id of the airport to start at
+        :param max_hops: the most flights to take, up to MAX_HOPS
+        :return: dict of airport id to the fewest hops it takes to get there (not including the starting airport), in
+                 order of hops
+        """
+        if not 0 < max_hops <= MAX_HOPS:
+            logger.error(f'Invalid number of hops: {max_hops}')
+            raise BusinessLogicException(f'The number of hops must be between 1 and {MAX_HOPS}')
+        start = self._nodes.get(airport_id)
+        if start is None:
+            return {}
+        with metrics.span('route_search'):
+            seen = bytearray(len(self.airport_ids))
+            seen[start] = 1
+            frontier = [start]
+            found = {}
+            offsets, targets, airport_ids = self.offsets, self.targets, self.airport_ids
+            for hops in range(1, max_hops + 1):
+                following = []
+                for node in frontier:
+                    for target in targets[offsets[node]:offsets[node + 1]]:
+                        if not seen[target]:
+                            seen[target] = 1
+                            following.append(target)
+                            found[airport_ids[target]] = hops
+                if not following:
+                    break
+                frontier = following
+        return found
+
+
+def _airport_id(token, code, airport_codes):
+    if token and token != NULL_MARKER:
+        return int(token)
+    return airport_codes.get(code.upper())
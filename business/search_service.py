@@ -0,0 +1,514 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+import zlib
+import dal
+from exceptions import DalException, BusinessLogicException
+from logging_config import get_logger, query_context
+import metrics
+from models import AirportRow, AirportTable, NULL_MARKER
+from .airport_service import URL, AIRLINES_URL, ROUTES_URL, export_rows
+from .batch import run_batch
+from .dataset import AirportDataset
+from .fuzzy import FUZZY_FIELDS, DEFAULT_LIMIT
+from .parsing import parse_airport_data, iter_airport_rows
+from .query import canonical_key, compile_query
+from .refresh import refresh_dataset
+from .result_cache import QueryResultCache
+from .routes import RouteGraph, parse_routes_data, parse_airlines_data
+from .snapshot import save_snapshot, load_snapshot
+
+"""
+This module contains a headless search service for the airport data. It owns the loaded dataset (and the indexes built
+over it), the dataset cache, an AsyncLoader and a thread pool, so the search engine can be used without a gui: the tkinter form, the
+local http api and batch jobs are all clients of one AirportSearchService, and any number of them can query the same
+loaded dataset at once. Repeated searches are answered from a QueryResultCache, which is emptied whenever a new dataset
+is loaded. When the data is reloaded over a loaded dataset, only the airports that changed are applied to it (see
+refresh_dataset), and if nothing changed the loaded dataset and the cached results are kept.
+
+The route network (routes.dat and airlines.dat) is only loaded the first time a route query needs it. Its answers are
+turned back into rows of the loaded airport data, so they can be shown and exported like search results.
+
+Classes:
+--------
+    AirportSearchService:
+        loads the airport data and answers searches against it, synchronously or in the background.
+
+Constants:
+----------
+    STREAM_BATCH_SIZE: how many results stream_search() yields at a time when the data is already loaded
+"""
+
+STREAM_BATCH_SIZE = 500
+
+logger = get_logger(__name__)
+
+
+class AirportSearchService:
+    def __init__(self, url=URL, cache=None, max_workers=None):
+        self.url = url
+        self.cache = cache if cache is not None else dal.DatasetCache()
+        self.loader = dal.AsyncLoader(self.cache)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.result_cache = QueryResultCache()
+        # the dataset and the result cache version it is cached under, published together in one assignment
+        self._current = (AirportDataset(AirportTable()), self.result_cache.version)
+        self._load_lock = threading.RLock()
+        self.routes = None
+        self._routes_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.dataset)
+
+    @property
+    def dataset(self):
+        return self._current[0]
+
+    @dataset.setter
+    def dataset(self, dataset):
+        # the cache moves on to a new version before the new dataset is published with it: a search still holding the
+        # old pair misses the emptied cache and can't cache into the new version
+        replaced = self._current[0]
+        self._current = (dataset, self.result_cache.invalidate())
+        if replaced is not dataset:
+            # its worker processes and shared memory go once the searches running on it are done
+            replaced.retire()
+
+    def is_loaded(self):
+        """
+        checks whether any airport data has been loaded
+        :return: True if there is data to search, false if not
+        """
+        return len(self.dataset) > 0
+
+    def restore(self):
+        """
+        loads the dataset from the snapshot of the cached airports.dat, which only takes milliseconds. If the snapshot
+        is missing, stale or corrupt, the cached airports.dat is parsed instead (and a new snapshot written). Nothing is
+        fetched, so the data may still need revalidating if the cached copy has expired.
+        :return: True if there is data to search, false if there is no cached copy to restore from
+        """
+        if self.is_loaded():
+            return True
+        with self._load_lock:
+            if self.is_loaded():
+                return True
+            source = self.cache.fingerprint(self.url)
+            if source is None:
+                return False
+            dataset = load_snapshot(self.cache.snapshot_path(self.url), source)
+            if dataset is not None:
+                self.dataset = dataset
+                return True
+            try:
+                self.set_data(self.cache.read(self.url))
+            except (DalException, BusinessLogicException):
+                logger.error('Unable to restore airport data from the cached copy')
+                return False
+            return True
+
+    def save_snapshot(self, dataset, source=None):
+        """
+        writes a snapshot of a dataset that was just loaded, so the next start can restore it
+        :param dataset: the AirportDataset
+        :param source: fingerprint of the data it was parsed from (see dal.fingerprint), the cached copy if None
+        :return: n/a
+        """
+        source = source or self.cache.fingerprint(self.url)
+        if source is None:
+            return
+        try:
+            save_snapshot(dataset, self.cache.snapshot_path(self.url), source)
+        except DalException:
+            # the next start just parses the data again
+            pass
+
+    def needs_load(self, refresh=False):
+        """
+        checks whether the data has to be (re)loaded before searching
+        :param refresh: true if the caller wants the data revalidated anyway
+        :return: True if there is no data, it has expired or a refresh was asked for
+        """
+        return refresh or not self.is_loaded() or self.cache.is_expired(self.url)
+
+    def load(self, refresh=False):
+        """
+        fetches the airport data (from the dataset cache, or the network if it has expired) and builds a new dataset
+        from it. The new dataset replaces the old one in a single assignment, searches that are already running keep
+        using the one they started with, and the old one is closed once they have finished.
+        :param refresh: true to revalidate the data even if the cached copy is still fresh
+        :return: the loaded AirportDataset
+        """
+        with self._load_lock:
+            try:
+                return dal.AirportAdapter(self.set_data, refresh, self.cache, self.loader).run(self.url)
+            except DalException as e:
+                logger.error(f'Failed to retrieve airport data: {e}')
+                raise BusinessLogicException(f'Unable to retrieve airport data: {e}')
+
+    def set_data(self, data):
+        """
+        parses the body of airports.dat into a new dataset and makes it the one searches run against. If a dataset is
+        already loaded only the changes are applied to (a copy of) it.
+        :param data: body of airports.dat, as bytes or str
+        :return: the new AirportDataset
+        """
+        rows = parse_airport_data(data)
+        dataset = self._publish(rows, lambda: AirportTable.from_rows(rows))
+        self.save_snapshot(dataset, dal.fingerprint(data.encode('utf-8') if isinstance(data, str) else data))
+        return dataset
+
+    def ensure_loaded(self, refresh=False):
+        """
+        loads the data if it hasn't been loaded, has expired, or a refresh was asked for
+        :param refresh: true to revalidate the data even if the cached copy is still fresh
+        :return: the AirportDataset to search
+        """
+        if not refresh:
+            self.restore()
+        if self.needs_load(refresh):
+            with self._load_lock:
+                # another thread may have loaded it while this one waited
+                if self.needs_load(refresh):
+                    return self.load(refresh)
+        return self.dataset
+
+    def load_async(self, refresh=False):
+        """
+        loads the data on the service's thread pool (if it needs loading)
+        :param refresh: true to revalidate the data even if the cached copy is still fresh
+        :return: a concurrent.futures.Future for the loaded AirportDataset
+        """
+        return self.executor.submit(self.ensure_loaded, refresh)
+
+    def fetch_async(self, urls, refresh=False):
+        """
+        fetches several OpenFlights files at once (e.g. URL, AIRLINES_URL and ROUTES_URL) through the loader
+        :param urls: iterable of urls
+        :param refresh: true to revalidate even if the cached copies are still fresh
+        :return: a concurrent.futures.Future for a dict of url to body, which raises DalException if one of them could
+                 not be fetched, and can be cancelled
+        """
+        return self.loader.submit(urls, refresh)
+
+    def search(self, params):
+        """
+        searches the loaded data
+        :param params: dict of search parameters from AirportSearchBuilder.build()
+        :return: list of AirportRow that match, nearest first for a distance search
+        """
+        dataset, results = self._cached_search(params)
+        return dataset.rows([index for _, index in results])
+
+    def search_ranked(self, params):
+        """
+        searches the loaded data, along with how far each row is from the center of a distance search
+        :param params: dict of search parameters from AirportSearchBuilder.build()
+        :return: list of (distance in km or None, AirportRow)
+        """
+        dataset, results = self._cached_search(params)
+        table = dataset.table
+        return [(distance, table[index]) for distance, index in results]
+
+    def search_batch(self, queries):
+        """
+        evaluates many searches against the loaded data (loading it first if it needs it, but only once for the whole
+        batch), answering code lookups straight from the indexes and each distinct search only once (see batch.py)
+        :param queries: iterable of dicts of search parameters from AirportSearchBuilder.build()
+        :return: generator of (params, tuple of (distance in km or None, AirportRow), error message or None), one per
+                 search, in order. Searches that are the same share one tuple of results.
+        """
+        dataset = self.ensure_loaded()
+        table = dataset.table
+        return run_batch(dataset, queries,
+                         lambda results: tuple((distance, AirportRow(table, index)) for distance, index in results))
+
+    def fuzzy_search(self, text, limit=DEFAULT_LIMIT, fields=tuple(FUZZY_FIELDS)):
+        """
+        finds the airports whose name (or city) is closest to the text, tolerating typos and missing accents, e.g. for
+        suggestions while the user types
+        :param text: what the user typed
+        :param limit: the most airports to return
+        :param fields: the fields to search, from FUZZY_FIELDS ('airport_name', 'city_name')
+        :return: list of (edits, AirportRow), best match first
+        """
+        with query_context():
+            start = time.perf_counter()
+            dataset = self.dataset
+            table = dataset.table
+            results = [(distance, table[index]) for distance, index in dataset.fuzzy_search(text, fields, limit)]
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Fuzzy search answered', extra={'duration_ms': _elapsed_ms(start),
+                                                             'results': len(results)})
+        return results
+
+    def stream_search(self, params, refresh=False, cancelled=None):
+        """
+        searches while the data loads, so the first matches are available before the whole file has been downloaded
+        and parsed: chunks of the body are parsed into rows as they arrive, the new rows are added to a table and the
+        compiled query is run over just those rows. Once the whole file is in, the table is indexed and becomes the
+        loaded dataset. If the data is already loaded the results are just yielded in batches.
+        A distance search has to see every row before it can rank them, so its results only come at the end.
+        The load lock is held while the data streams in (like load(), so no other load can interleave with it), which
+        means it is only released once the generator has finished or been closed.
+        :param params: dict of search parameters from AirportSearchBuilder.build()
+        :param refresh: true to revalidate the data even if the cached copy is still fresh
+        :param cancelled: optional threading.Event, when it is set the search stops (and the partial data is dropped)
+        :return: generator of lists of (distance in km or None, AirportRow)
+        """
+        query = compile_query(params)
+        if not refresh:
+            self.restore()
+        if self.needs_load(refresh):
+            with self._load_lock:
+                # another thread may have loaded it while this one waited
+                if self.needs_load(refresh):
+                    yield from self._stream_load(query, params, refresh, cancelled)
+                    return
+        results = self.search_ranked(params)
+        for start in range(0, len(results), STREAM_BATCH_SIZE):
+            if cancelled is not None and cancelled.is_set():
+                return
+            yield results[start:start + STREAM_BATCH_SIZE]
+
+    def export(self, params, path, file_format=None, compress=None):
+        """
+        searches the loaded data (loading it first if it needs it) and streams every field of each match to a file,
+        so only the matching row numbers are held in memory however large the export is
+        :param params: dict of search parameters from AirportSearchBuilder.build(), or None to export every airport
+        :param path: path of the file to write
+        :param file_format: one of dal.EXPORT_FORMATS, worked out from the path if None
+        :param compress: true to gzip the file, worked out from the path if None
+        :return: the number of airports exported
+        """
+        self.ensure_loaded()
+        if params is None:
+            return export_rows(iter(self.dataset.table), path, file_format, compress)
+        dataset, results = self._cached_search(params)
+        return export_rows((dataset.table[index] for _, index in results), path, file_format, compress)
+
+    def all_rows(self):
+        """
+        returns every row of the loaded data
+        :return: the loaded AirportTable (which iterates as AirportRow)
+        """
+        return self.dataset.table
+
+    def submit_search(self, params, ranked=False):
+        """
+        searches on the service's thread pool, loading the data first if it needs it
+        :param params: dict of search parameters from AirportSearchBuilder.build()
+        :param ranked: true to get (distance, row) pairs as from search_ranked()
+        :return: a concurrent.futures.Future for the results
+        """
+        return self.executor.submit(self._load_and_search, params, ranked)
+
+    async def search_async(self, params, ranked=False):
+        """
+        searches on the service's thread pool from asyncio code, loading the data first if it needs it
+        :param params: dict of search parameters from AirportSearchBuilder.build()
+        :param ranked: true to get (distance, row) pairs as from search_ranked()
+        :return: the results
+        """
+        import asyncio
+        return await asyncio.wrap_future(self.submit_search(params, ranked))
+
+    def load_routes(self, refresh=False):
+        """
+        fetches routes.dat and airlines.dat (through the dataset cache, like the airport data) and builds the route
+        graph from them, unless it has already been built and the cached copies are still fresh
+        :param refresh: true to revalidate the data even if the cached copies are still fresh
+        :return: the RouteGraph
+        """
+        dataset = self.ensure_loaded()
+        with self._routes_lock:
+            if self.routes is not None and not refresh and not self.cache.is_expired(ROUTES_URL):
+                return self.routes
+            try:
+                bodies = self.loader.submit([ROUTES_URL, AIRLINES_URL], refresh).result()
+            except DalException as e:
+                logger.error(f'Failed to retrieve route data: {e}')
+                raise BusinessLogicException(f'Unable to retrieve route data: {e}')
+            self.routes = RouteGraph(parse_routes_data(bodies[ROUTES_URL], _airport_codes(dataset)),
+                                     parse_airlines_data(bodies[AIRLINES_URL]))
+            return self.routes
+
+    def find_airport(self, code):
+        """
+        looks up an airport in the loaded data
+        :param code: IATA code, ICAO code or airport id
+        :return: the AirportRow
+        """
+        dataset = self.ensure_loaded()
+        code = str(code).strip().upper()
+        if code.isdigit():
+            index = dataset.index_of(int(code))
+        else:
+            rows = (dataset.indexes.by_icao if len(code) == 4 else dataset.indexes.by_iata).get(code, ())
+            index = rows[0] if rows else None
+        if index is None:
+            logger.error(f'Unknown airport: {code}')
+            raise BusinessLogicException(f'Unknown airport: {code}')
+        return dataset.table[index]
+
+    def destinations(self, code):
+        """
+        finds the airports there is a direct flight to
+        :param code: IATA code, ICAO code or airport id of the airport to fly from
+        :return: list of AirportRow
+        """
+        source = self.find_airport(code)
+        return self._airport_rows(self.load_routes().destinations(source.airport_id))
+
+    def airlines(self, source, destination):
+        """
+        finds the airlines that fly directly between two airports
+        :param source: IATA code, ICAO code or airport id of the airport to fly from
+        :param destination: IATA code, ICAO code or airport id of the airport to fly to
+        :return: list of (airline code, airline name or None)
+        """
+        routes = self.load_routes()
+        return routes.airlines_between(self.find_airport(source).airport_id, self.find_airport(destination).airport_id)
+
+    def route(self, source, destination, max_hops=None):
+        """
+        finds a way to fly between two airports with the fewest changes
+        :param source: IATA code, ICAO code or airport id of the airport to fly from
+        :param destination: IATA code, ICAO code or airport id of the airport to fly to
+        :param max_hops: optional limit on the number of flights
+        :return: list of AirportRow from the source to the destination, empty if there is no way to get there
+        """
+        routes = self.load_routes()
+        path = routes.shortest_path(self.find_airport(source).airport_id, self.find_airport(destination).airport_id,
+                                    max_hops)
+        return self._airport_rows(path or [])
+
+    def reachable(self, code, max_hops):
+        """
+        finds every airport that can be reached within a number of flights
+        :param code: IATA code, ICAO code or airport id of the airport to start at
+        :param max_hops: the most flights to take (up to routes.MAX_HOPS)
+        :return: list of (hops, AirportRow), fewest hops first
+        """
+        source = self.find_airport(code)
+        found = self.load_routes().reachable(source.airport_id, int(max_hops))
+        dataset = self.dataset
+        return [(hops, dataset.table[index]) for hops, index in
+                ((hops, dataset.index_of(airport_id)) for airport_id, hops in found.items()) if index is not None]
+
+    def cache_stats(self):
+        """
+        returns the hit/miss counters of the search result cache
+        :return: dict of hits, misses, evictions, entries, rows and the dataset version
+        """
+        return self.result_cache.stats()
+
+    def profile_search(self, params, ranked=False):
+        """
+        runs one search under cProfile, going straight to the dataset so the profile shows the real work rather than
+        a cache hit
+        :param params: dict of search parameters from AirportSearchBuilder.build()
+        :param ranked: true to profile search_ranked() rather than search()
+        :return: (list of row indices, or of (distance, row index) if ranked, the profile report as text)
+        """
+        dataset = self.ensure_loaded()
+        return metrics.profile_call(dataset.search_ranked if ranked else dataset.search, params)
+
+    def _cached_search(self, params):
+        # the dataset and its version are read together, so cached rows are always resolved against the table they
+        # were found in
+        with query_context():
+            start = time.perf_counter()
+            cache = self.result_cache
+            dataset, version = self._current
+            key = canonical_key(params)
+            results = cache.get(version, key)
+            cached = results is not None
+            if not cached:
+                results = tuple(dataset.search_ranked(params))
+                cache.put(version, key, results)
+            # one record per search, so only at debug level
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Search answered', extra={'duration_ms': _elapsed_ms(start), 'results': len(results),
+                                                       'cached': cached})
+        return dataset, results
+
+    def _stream_load(self, query, params, refresh, cancelled):
+        # the part of stream_search() that loads the data, the caller holds the load lock
+        table = AirportTable()
+        chunks = self.cache.iter_chunks(self.url, refresh, self.loader.session)
+        source = {'size': 0, 'crc32': 0}
+        try:
+            for rows in iter_airport_rows(_fingerprinted(chunks, source)):
+                if cancelled is not None and cancelled.is_set():
+                    logger.info('Search cancelled while loading')
+                    return
+                start = len(table)
+                table.extend(rows)
+                if query.geo is None:
+                    matches = query.select(table, range(start, len(table)))
+                    if matches:
+                        yield [(None, table[index]) for index in matches]
+        except DalException as e:
+            logger.error(f'Failed to retrieve airport data: {e}')
+            raise BusinessLogicException(f'Unable to retrieve airport data: {e}')
+        finally:
+            chunks.close()
+        dataset = self._publish(map(table.record, range(len(table))), lambda: table)
+        self.save_snapshot(dataset, source)
+        if query.geo is not None:
+            results = [(distance, dataset.table[index]) for distance, index in dataset.search_ranked(params)]
+            for start in range(0, len(results), STREAM_BATCH_SIZE):
+                yield results[start:start + STREAM_BATCH_SIZE]
+
+    def _publish(self, rows, build_table):
+        # applies the new rows to the loaded dataset if that is quicker than indexing them from scratch
+        dataset = refresh_dataset(self.dataset, rows) if self.is_loaded() else None
+        if dataset is None:
+            dataset = AirportDataset(build_table())
+            logger.info(f'Loaded {len(dataset)} airports')
+        if dataset is not self.dataset:
+            self.dataset = dataset
+        return dataset
+
+    def _airport_rows(self, airport_ids):
+        # airports the routes know about but airports.dat doesn't are left out
+        dataset = self.dataset
+        indices = (dataset.index_of(airport_id) for airport_id in airport_ids)
+        return [dataset.table[index] for index in indices if index is not None]
+
+    def _load_and_search(self, params, ranked):
+        self.ensure_loaded()
+        return self.search_ranked(params) if ranked else self.search(params)
+
+    def shutdown(self, wait=True):
+        """
+        shuts down the thread pool and the loader
+        :param wait: true to wait for work that is already running
+        :return: n/a
+        """
+        self.executor.shutdown(wait=wait)
+        self.loader.close()
+        self.dataset.close()
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+def _airport_codes(dataset):
+    # routes.dat names the airports it has no id for by their IATA or ICAO code
+    codes = {}
+    airport_ids = dataset.table.airport_ids
+    for index in (dataset.indexes.by_icao, dataset.indexes.by_iata):
+        codes.update((code, airport_ids[rows[0]]) for code, rows in index.items() if code and code != NULL_MARKER)
+    return codes
+
+
+def _fingerprinted(chunks, source):
+    # works out the same fingerprint as dal.fingerprint() as the chunks go by
+    for chunk in chunks:
+        source['size'] += len(chunk)
+        source['crc32'] = zlib.crc32(chunk, source['crc32'])
+        yield chunk
@@ -0,0 +1,187 @@
+from array import array
+from itertools import count
+import sys
+import dal
+from exceptions import DalException
+from logging_config import get_logger
+import metrics
+from models import AirportTable, NUMERIC_COLUMNS, TEXT_COLUMNS
+from .dataset import AirportDataset
+from .geo import GeoGrid
+from .indexes import AirportIndexes, TrigramIndex
+
+"""
+This module saves a loaded AirportDataset to a binary snapshot (see dal.snapshot) and loads it back, so the application
+can start searching within milliseconds instead of parsing airports.dat and building the indexes again. The numeric
+columns, the posting lists of the hash and trigram indexes and the geo grid cells are stored as typed arrays and used
+straight from the memory-mapped file. The text columns (and the keys of the indexes) are stored joined by a separator
+and split once on load.
+
+A snapshot records the size and crc32 of the airports.dat it was made from. If that no longer matches the cached copy,
+or the schema version or checksum doesn't match, it isn't used.
+
+Classes:
+--------
+    SnapshotPostings:
+        a read-only dict of key to rows, whose rows are only sliced out of the snapshot when they are looked up
+
+Methods:
+--------
+    save_snapshot(dataset, path, source):
+        writes a dataset to a snapshot file
+    load_snapshot(path, source):
+        loads a dataset from a snapshot file
+
+Constants:
+----------
+    SNAPSHOT_VERSION: version of the snapshot schema, bump it whenever what is stored (or how) changes
+    UPPER_COLUMNS: the text columns whose uppercased copies are stored too (the trigram indexes check against them)
+    INDEX_NAMES: the indexes of an AirportIndexes that are stored in the snapshot
+"""
+
+SNAPSHOT_VERSION = 1
+UPPER_COLUMNS = ('airport_names', 'city_names')
+INDEX_NAMES = ('by_iata', 'by_icao', 'by_country', 'by_dst', 'airport_names', 'city_names')
+logger = get_logger(__name__)
+
+
+def save_snapshot(dataset, path, source):
+    """
+    writes a dataset to a snapshot file
+    :param dataset: the AirportDataset to save
+    :param path: path of the snapshot file
+    :param source: fingerprint of the airports.dat the dataset was parsed from (see DatasetCache.fingerprint)
+    :return: n/a
+    """
+    with metrics.span('snapshot_save'):
+        _save_snapshot(dataset, path, source)
+
+
+def _save_snapshot(dataset, path, source):
+    table = dataset.table
+    sections = {}
+    # how many strings are in each joined section, an empty list and a list of one empty string join the same way
+    counts = {}
+    for name, typecode in NUMERIC_COLUMNS.items():
+        column = getattr(table, name)
+        sections[name] = column if isinstance(column, array) else array(typecode, column)
+    for name in TEXT_COLUMNS:
+        sections[name] = dal.pack_strings(getattr(table, name))
+        counts[name] = len(getattr(table, name))
+    for name in UPPER_COLUMNS:
+        sections[f'{name}.upper'] = dal.pack_strings(table.upper_column(name))
+    for name in INDEX_NAMES:
+        index = getattr(dataset.indexes, name)
+        postings = index.postings if isinstance(index, TrigramIndex) else index
+        keys = list(postings)
+        sections[f'{name}.keys'] = dal.pack_strings(keys)
+        counts[f'{name}.keys'] = len(keys)
+        sections[f'{name}.offsets'], sections[f'{name}.rows'] = _flatten(_sorted_rows(postings[key]) for key in keys)
+    cells = list(dataset.grid.cells)
+    sections['grid.lat_cells'] = array('i', (lat_cell for lat_cell, _ in cells))
+    sections['grid.lon_cells'] = array('i', (lon_cell for _, lon_cell in cells))
+    sections['grid.offsets'], sections['grid.rows'] = _flatten(dataset.grid.cells[cell] for cell in cells)
+    dal.write_snapshot(path, sections, SNAPSHOT_VERSION, {'source': source, 'counts': counts,
+                                                          'cell_degrees': dataset.grid.cell_degrees})
+
+
+def load_snapshot(path, source):
+    """
+    loads a dataset from a snapshot file
+    :param path: path of the snapshot file
+    :param source: fingerprint of the cached airports.dat (see DatasetCache.fingerprint), the snapshot is only used if
+                   it was made from the same file
+    :return: the AirportDataset, or None if there is no usable snapshot
+    """
+    with metrics.span('snapshot_load'):
+        return _load_snapshot(path, source)
+
+
+def _load_snapshot(path, source):
+    try:
+        snapshot = dal.read_snapshot(path, SNAPSHOT_VERSION)
+    except DalException as e:
+        logger.warning(f'Not using snapshot: {e}')
+        return None
+    if source is None or snapshot.meta.get('source') != source:
+        logger.warning(f'Not using snapshot {path}: it was made from a different copy of the data')
+        snapshot.close()
+        return None
+    try:
+        counts = snapshot.meta['counts']
+        columns = {name: snapshot[name] for name in NUMERIC_COLUMNS}
+        for name in TEXT_COLUMNS:
+            columns[name] = dal.unpack_strings(snapshot[name], counts[name])
+        columns['city_names'] = [sys.intern(value) for value in columns['city_names']]
+        upper_columns = {name: dal.unpack_strings(snapshot[f'{name}.upper'], counts[name]) for name in UPPER_COLUMNS}
+        table = AirportTable.from_columns(columns, upper_columns)
+        prebuilt = {}
+        for name in INDEX_NAMES:
+            keys = dal.unpack_strings(snapshot[f'{name}.keys'], counts[f'{name}.keys'])
+            prebuilt[name] = _unflatten(keys, snapshot[f'{name}.offsets'], snapshot[f'{name}.rows'])
+            if name in ('airport_names', 'city_names'):
+                prebuilt[name] = TrigramIndex(table.upper_column(name), prebuilt[name])
+        cells = zip(snapshot['grid.lat_cells'], snapshot['grid.lon_cells'])
+        grid = GeoGrid(table, snapshot.meta['cell_degrees'],
+                       _unflatten(cells, snapshot['grid.offsets'], snapshot['grid.rows']))
+        indexes = AirportIndexes(table, prebuilt)
+    except (KeyError, ValueError, TypeError) as e:
+        # a snapshot with the right version should never get here, but it isn't worth failing over
+        logger.warning(f'Not using snapshot {path}: {e!r}')
+        snapshot.close()
+        return None
+    logger.info(f'Loaded {len(table)} airports from snapshot {path}')
+    return AirportDataset(table, indexes, grid)
+
+
+class SnapshotPostings:
+    # a read-only dict of key to rows, whose rows are only sliced out of the snapshot when they are looked up
+    def __init__(self, keys, offsets, rows):
+        self._positions = dict(zip(keys, count()))
+        self._offsets = offsets
+        self._rows = rows
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __iter__(self):
+        return iter(self._positions)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def __getitem__(self, key):
+        position = self._positions[key]
+        return self._rows[self._offsets[position]:self._offsets[position + 1]]
+
+    def get(self, key, default=None):
+        position = self._positions.get(key)
+        if position is None:
+            return default
+        return self._rows[self._offsets[position]:self._offsets[position + 1]]
+
+    def keys(self):
+        return self._positions.keys()
+
+    def values(self):
+        return (self[key] for key in self._positions)
+
+    def items(self):
+        return ((key, self[key]) for key in self._positions)
+
+
+def _flatten(posting_lists):
+    offsets = array('i', [0])
+    rows = array('i')
+    for posting_list in posting_lists:
+        rows.extend(posting_list)
+        offsets.append(len(rows))
+    return offsets, rows
+
+
+def _unflatten(keys, offsets, rows):
+    return SnapshotPostings(keys, offsets, rows)
+
+
+def _sorted_rows(rows):
+    return sorted(rows) if isinstance(rows, (set, frozenset)) else rows
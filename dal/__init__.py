@@ -1 +1,5 @@
 from .dal import *
+from .cache import *
+from .loader import *
+from .snapshot import *
+from .export import *
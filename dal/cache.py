@@ -0,0 +1,363 @@
+import json
+import os
+import time
+import zlib
+from urllib.parse import urlparse
+from exceptions import DalException
+from logging_config import get_logger
+import metrics
+
+"""
+This module contains a persistent on-disk cache for the datasets we download, so that the application does not have to
+download the whole file every time the user searches.
+
+Methods:
+--------
+    fingerprint(data):
+        identifies the body of a dataset by its size and crc32
+
+Classes:
+--------
+    DatasetCache:
+        stores a downloaded file next to its ETag/Last-Modified headers and a TTL, revalidates it with a conditional
+        request once the TTL has expired, and falls back to the cached copy if the network is unavailable. The body can
+        be read all at once (fetch) or a chunk at a time as it downloads (iter_chunks).
+
+Constants:
+----------
+    CACHE_DIR: the directory that cached files are written to
+    DEFAULT_TTL: how long (in seconds) a cached file is considered fresh
+    GOOD_STATUS_CODE: the status code for a full response (200)
+    NOT_MODIFIED_STATUS_CODE: the status code for a successful conditional request (304)
+    REQUEST_TIMEOUT: (connect, read) timeout in seconds for the revalidation request
+    CHUNK_SIZE: how many bytes at a time iter_chunks() reads from the response or the cached copy
+"""
+
+CACHE_DIR = 'cache'
+DEFAULT_TTL = 24 * 60 * 60
+GOOD_STATUS_CODE = 200
+NOT_MODIFIED_STATUS_CODE = 304
+REQUEST_TIMEOUT = (5, 30)
+CHUNK_SIZE = 64 * 1024
+logger = get_logger(__name__)
+
+
+def fingerprint(data):
+    """
+    identifies the body of a dataset by its size and crc32
+    :param data: the body as bytes
+    :return: dict with the size and crc32
+    """
+    return {'size': len(data), 'crc32': zlib.crc32(data)}
+
+
+class DatasetCache:
+    def __init__(self, cache_dir=CACHE_DIR, ttl=DEFAULT_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        # url to when its cached copy expires, read from the metadata file once and kept up to date by write_meta()
+        self._expires = {}
+
+    def data_path(self, url):
+        """
+        builds the path that the body of the given url is cached at
+        :param url: url of the dataset
+        :return: path to the cached file
+        """
+        return os.path.join(self.cache_dir, os.path.basename(urlparse(url).path))
+
+    def meta_path(self, url):
+        """
+        builds the path that the headers/fetch time of the given url are cached at
+        :param url: url of the dataset
+        :return: path to the metadata file
+        """
+        return self.data_path(url) + '.meta.json'
+
+    def snapshot_path(self, url):
+        """
+        builds the path that a parsed snapshot of the given url is kept at
+        :param url: url of the dataset
+        :return: path to the snapshot file
+        """
+        return self.data_path(url) + '.snapshot'
+
+    def fingerprint(self, url):
+        """
+        identifies the cached copy of the given url by its size and crc32, so a snapshot made from it can tell whether
+        it is still current
+        :param url: url of the dataset
+        :return: dict with the size and crc32 of the cached copy, or None if there is no copy
+        """
+        try:
+            with open(self.data_path(url), 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+        return fingerprint(data)
+
+    def has_copy(self, url):
+        """
+        checks whether there is a cached copy of the given url on disk
+        :param url: url of the dataset
+        :return: True if a copy exists, false if not
+        """
+        return os.path.exists(self.data_path(url)) and os.path.exists(self.meta_path(url))
+
+    def read_meta(self, url):
+        """
+        reads the metadata stored next to a cached file
+        :param url: url of the dataset
+        :return: dict of metadata, empty if there is none (or it could not be read)
+        """
+        try:
+            with open(self.meta_path(url), 'r', encoding='UTF 8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def is_expired(self, url):
+        """
+        checks whether the cached copy of the given url is older than its TTL. Only the first check of a url reads the
+        metadata from disk, it is called before every search.
+        :param url: url of the dataset
+        :return: True if there is no copy or it is stale, false if it is still fresh
+        """
+        expires = self._expires.get(url)
+        if expires is None:
+            if not self.has_copy(url):
+                return True
+            expires = self._expires[url] = _expiry(self.read_meta(url), self.ttl)
+        return time.time() >= expires
+
+    def read(self, url):
+        """
+        reads the cached copy of the given url
+        :param url: url of the dataset
+        :return: the cached body as bytes
+        """
+        try:
+            with open(self.data_path(url), 'rb') as file:
+                return file.read()
+        except OSError as e:
+            logger.error(f"Unable to read cached copy of {url}: {e}")
+            raise DalException
+
+    def fetch(self, url, refresh=False, session=None):
+        """
+        returns the body of the given url, only touching the network on an explicit refresh or when the TTL has
+        expired. Stale copies are revalidated with If-None-Match/If-Modified-Since, and the cached copy is used if the
+        network cannot be reached.
+        :param url: url of the dataset
+        :param refresh: true to revalidate even if the cached copy is still fresh
+        :param session: optional requests.Session to make the request with (so connections are pooled)
+        :return: the body as bytes
+        """
+        if not refresh and not self.is_expired(url):
+            logger.info(f"Using cached copy of {url}")
+            metrics.increment('dataset_cache_hits_total')
+            return self.read(url)
+        import requests  # only once the network is used, it is slow to import
+        headers = self.validators(url)
+        try:
+            logger.info(f"Revalidating {url}" if headers else f"Downloading {url}")
+            with metrics.span('download'):
+                response = (session or requests).get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            return self.offline_copy(url, f"Request failed: {e}")
+        return self.handle_response(url, response)
+
+    def iter_chunks(self, url, refresh=False, session=None, chunk_size=CHUNK_SIZE):
+        """
+        yields the body of the given url a chunk at a time, the same way fetch() returns it, so the caller can start on
+        the data before the whole file has arrived. A download is written to the cache as it streams, and only replaces
+        the cached copy once it has finished.
+        :param url: url of the dataset
+        :param refresh: true to revalidate even if the cached copy is still fresh
+        :param session: optional requests.Session to make the request with (so connections are pooled)
+        :param chunk_size: how many bytes to read at a time
+        :return: generator of bytes
+        """
+        if not refresh and not self.is_expired(url):
+            logger.info(f"Streaming cached copy of {url}")
+            metrics.increment('dataset_cache_hits_total')
+            yield from self.read_chunks(url, chunk_size)
+            return
+        import requests  # only once the network is used, it is slow to import
+        headers = self.validators(url)
+        try:
+            logger.info(f"Revalidating {url}" if headers else f"Streaming {url}")
+            # only the wait for the response headers, the body is timed by whoever reads the chunks
+            with metrics.span('download'):
+                response = (session or requests).get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
+        except requests.RequestException as e:
+            self.offline_copy(url, f"Request failed: {e}", read=False)
+            yield from self.read_chunks(url, chunk_size)
+            return
+        with response:
+            if response.status_code == GOOD_STATUS_CODE:
+                metrics.increment('dataset_cache_misses_total')
+                yield from self._store_chunks(url, response, chunk_size)
+                return
+            if response.status_code == NOT_MODIFIED_STATUS_CODE and self.has_copy(url):
+                logger.info(f"Cached copy of {url} is still current")
+                metrics.increment('dataset_cache_hits_total')
+                meta = self.read_meta(url)
+                meta['fetched_at'] = time.time()
+                self.write_meta(url, meta)
+            else:
+                self.offline_copy(url, f"Bad response ({response.status_code})", read=False)
+        yield from self.read_chunks(url, chunk_size)
+
+    def read_chunks(self, url, chunk_size=CHUNK_SIZE):
+        """
+        yields the cached copy of the given url a chunk at a time
+        :param url: url of the dataset
+        :param chunk_size: how many bytes to read at a time
+        :return: generator of bytes
+        """
+        try:
+            with open(self.data_path(url), 'rb') as file:
+                while True:
+                    chunk = file.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+        except OSError as e:
+            logger.error(f"Unable to read cached copy of {url}: {e}")
+            raise DalException
+
+    def _store_chunks(self, url, response, chunk_size):
+        import requests
+        temp_path = self.data_path(url) + '.tmp'
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            file = open(temp_path, 'wb')
+        except OSError as e:
+            logger.error(f"Unable to cache {url}: {e}")
+            file = None
+        size = 0
+        finished = False
+        try:
+            for chunk in response.iter_content(chunk_size):
+                if file is not None:
+                    file.write(chunk)
+                size += len(chunk)
+                yield chunk
+            finished = True
+            metrics.increment('download_bytes_total', size)
+        except requests.RequestException as e:
+            logger.error(f"Download of {url} failed part way through: {e}")
+            raise DalException(f"Download of {url} failed part way through: {e}")
+        finally:
+            if file is not None:
+                file.close()
+                try:
+                    if finished:
+                        os.replace(temp_path, self.data_path(url))
+                        self.write_meta(url, {'url': url,
+                                              'etag': response.headers.get('ETag'),
+                                              'last_modified': response.headers.get('Last-Modified'),
+                                              'fetched_at': time.time(),
+                                              'ttl': self.ttl})
+                        logger.info(f"Cached {size} bytes from {url}")
+                    else:
+                        os.remove(temp_path)
+                except OSError as e:
+                    logger.error(f"Unable to cache {url}: {e}")
+
+    def validators(self, url):
+        """
+        builds the conditional request headers for the cached copy of the given url
+        :param url: url of the dataset
+        :return: dict of If-None-Match/If-Modified-Since headers, empty if there is no copy
+        """
+        meta = self.read_meta(url) if self.has_copy(url) else {}
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def handle_response(self, url, response):
+        """
+        turns the response to a (conditional) request into the body of the dataset, updating the cache as needed
+        :param url: url of the dataset
+        :param response: the requests.Response
+        :return: the body as bytes
+        """
+        if response.status_code == NOT_MODIFIED_STATUS_CODE and self.has_copy(url):
+            logger.info(f"Cached copy of {url} is still current")
+            metrics.increment('dataset_cache_hits_total')
+            meta = self.read_meta(url)
+            meta['fetched_at'] = time.time()
+            self.write_meta(url, meta)
+            return self.read(url)
+        if response.status_code == GOOD_STATUS_CODE:
+            metrics.increment('dataset_cache_misses_total')
+            metrics.increment('download_bytes_total', len(response.content))
+            self.store(url, response.content, response.headers)
+            return response.content
+        return self.offline_copy(url, f"Bad response ({response.status_code})")
+
+    def offline_copy(self, url, reason, read=True):
+        """
+        falls back to the cached copy of the given url when the network has failed
+        :param url: url of the dataset
+        :param reason: what went wrong, for the log
+        :param read: false to only check that there is a copy to fall back to
+        :return: the cached body as bytes (None if read is false)
+        """
+        if self.has_copy(url):
+            logger.warning(f"{reason}, working offline from cached copy of {url}")
+            metrics.increment('dataset_cache_offline_total')
+            return self.read(url) if read else None
+        logger.error(f"{reason} and there is no cached copy of {url}")
+        raise DalException(f"{reason} and there is no cached copy of {url}")
+
+    def store(self, url, content, headers):
+        """
+        writes a freshly downloaded body and its validators to the cache
+        :param url: url of the dataset
+        :param content: body of the response
+        :param headers: headers of the response
+        :return: n/a
+        """
+        meta = {'url': url,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+                'ttl': self.ttl}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = self.data_path(url) + '.tmp'
+            with open(temp_path, 'wb') as file:
+                file.write(content)
+            os.replace(temp_path, self.data_path(url))
+            self.write_meta(url, meta)
+            logger.info(f"Cached {len(content)} bytes from {url}")
+        except OSError as e:
+            # not being able to cache shouldn't stop the search, we just download again next time
+            logger.error(f"Unable to cache {url}: {e}")
+
+    def write_meta(self, url, meta):
+        """
+        writes the metadata for a cached file
+        :param url: url of the dataset
+        :param meta: dict of metadata
+        :return: n/a
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = self.meta_path(url) + '.tmp'
+            with open(temp_path, 'w', encoding='UTF 8') as file:
+                json.dump(meta, file)
+            os.replace(temp_path, self.meta_path(url))
+            self._expires[url] = _expiry(meta, self.ttl)
+        except OSError as e:
+            logger.error(f"Unable to write cache metadata for {url}: {e}")
+
+
+def _expiry(meta, ttl):
+    return meta.get('fetched_at', 0) + meta.get('ttl', ttl)
@@ -1,83 +1,71 @@
-import requests
 from exceptions import DalException
+from .cache import DatasetCache
 from logging_config import get_logger
 
 """
 This module contains classes to retrieve and return data from a website, as well as a method to export results from
-the gui to results_export.dat
+the gui to a text file (see export.py for the other export formats)
 
 Methods:
 --------
-    write_results_to_txt(results):
-        writes results from the gui to a text file called results_export.dat
+    write_results_to_txt(results, path='results_export.dat'):
+        writes results from the gui to a text file (results_export.dat unless told otherwise)
         
 Classes:
 --------
-    APIExecutor:
-        used to submit AirportAdapter.run() into a threadpool executor. 
     AirportAdapter:
-        retrieves a response from a provided URL, checks for several errors.        
+        retrieves data from a provided URL through the dataset cache (or an AsyncLoader, which retries), checks for
+        several errors, and hands the data to a callback.
 
 """
 
 logger = get_logger(__name__)
 
 
-class APIExecutor:
-    def __init__(self, adapter):
-        self.adapter = adapter
-
-    def execute(self, *args, **kwargs):
-        """
-        calls the threadpool executor from tk_instance to run AirportAdapter.
-        :param args: arguments
-        :param kwargs: keyword arguments
-        :return: n/a
-        """
-        try:
-            self.adapter.tk_instance.executor.submit(self.adapter.run, *args, **kwargs)
-        except DalException:
-            raise
-
-
 class AirportAdapter:
-    def __init__(self, tk_instance, callback, show_all=False):
-        self.tk_instance = tk_instance
+    def __init__(self, callback, refresh=False, cache=None, loader=None):
         self.callback = callback
-        self.show_all = show_all
+        self.refresh = refresh
+        self.cache = cache if cache is not None else DatasetCache()
+        self.loader = loader
 
     def run(self, url):
         """
-        attempts to retrieve data from the provided url
+        attempts to retrieve data from the provided url (or the cached copy of it)
         :param url: url to find the data
-        :return: the results of the url request
+        :return: whatever the callback returns for the data
         """
+        import requests
         try:
             logger.info("Getting airport data")
-            response = requests.get(url, stream=True)
-            self.callback(response, self.tk_instance, self.show_all)
-        except requests.Timeout as time_out:
-            logger.error(f"Request timed out: {time_out}")
+            if self.loader is not None:
+                data = self.loader.fetch_sync(url, self.refresh)
+            else:
+                data = self.cache.fetch(url, self.refresh)
+            return self.callback(data)
+        except requests.Timeout as e:
+            logger.error(f"Request timed out: {e}")
             raise DalException
-        except requests.ConnectionError as connection_error:
-            logger.error(f"Connection failed: {connection_error}")
+        except requests.ConnectionError as e:
+            logger.error(f"Connection failed: {e}")
             raise DalException
         except requests.RequestException as e:
             logger.error(f"Request failed: {e}")
             raise DalException
 
 
-def write_results_to_txt(results):
+def write_results_to_txt(results, path='results_export.dat'):
     """
-    writes results from the gui to a text file called results_export.dat
-    :param results: results from the results field in the gui
+    writes results from the gui to a text file (results_export.dat unless told otherwise)
+    :param results: lines of the results from the results view in the gui
+    :param path: path of the file to write
     :return: nothing, writes to file
     """
     try:
-        with open('results_export.dat', 'w', newline='', encoding='UTF 8') as file:
+        with open(path, 'w', newline='', encoding='UTF 8') as file:
             for line in results:
                 file.write(line)
-        logger.info('exported results to results_export.dat')
+        logger.info(f'exported results to {path}')
     except Exception:
-        logger.error('unable to export results to results_export.dat')
+        logger.error(f'unable to export results to {path}')
         raise DalException
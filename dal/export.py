@@ -0,0 +1,223 @@
+from array import array
+import csv
+import gzip
+import io
+import json
+import math
+import os
+import struct
+from exceptions import DalException
+from logging_config import get_logger
+import metrics
+
+"""
+This module contains the export subsystem. Records are written as they come from an iterable, through a large write
+buffer, so exporting the whole dataset takes no more memory than exporting a handful of rows. Any of the formats can be
+gzip compressed. The file is written next to its path and only moved into place once it is complete, so an export that
+fails part way through leaves nothing behind (and doesn't overwrite an earlier export).
+
+Formats:
+--------
+    csv:
+        a header row of field names, then one row per record (missing values are written as the null marker)
+    jsonl:
+        one json object per line, keyed by field name (missing values are null)
+    columnar:
+        a parquet-like binary format: the records are split into row groups, and each row group stores every field as
+        its own column (numbers as typed arrays with a null mask, text as offsets into a utf-8 blob). Each row group
+        starts with a json header giving its row count and the byte length of each column section.
+
+Methods:
+--------
+    export_records(records, path, fields, types, file_format=None, compress=None, null=''):
+        writes records to a file in one of the export formats
+    read_columnar(path):
+        reads the records back out of a columnar export, a row group at a time
+    export_format(path):
+        works out the export format and compression from a file name
+
+Constants:
+----------
+    EXPORT_FORMATS: the formats export_records can write
+    EXTENSIONS: the file extension for each format
+    WRITE_BUFFER_SIZE: size of the write buffer in bytes
+    ROW_GROUP_SIZE: how many records go in each row group of a columnar export
+    COLUMNAR_MAGIC: the bytes a columnar export starts with
+    COLUMN_TYPECODES: the array typecode that numeric field types are stored as in a columnar export
+"""
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'columnar')
+EXTENSIONS = {'csv': '.csv', 'jsonl': '.jsonl', 'columnar': '.col'}
+WRITE_BUFFER_SIZE = 1024 * 1024
+ROW_GROUP_SIZE = 16384
+COLUMNAR_MAGIC = b'APCOL001'
+COLUMN_TYPECODES = {'int': 'q', 'float': 'd'}
+_GROUP_HEADER = struct.Struct('<I')
+logger = get_logger(__name__)
+
+
+def export_format(path):
+    """
+    works out the export format and compression from a file name, e.g. 'results.jsonl.gz' is gzip compressed jsonl
+    :param path: the file name
+    :return: (format, compress), format is None if the extension isn't one of EXTENSIONS
+    """
+    lowered = path.lower()
+    compress = lowered.endswith('.gz')
+    if compress:
+        lowered = lowered[:-len('.gz')]
+    for file_format, extension in EXTENSIONS.items():
+        if lowered.endswith(extension):
+            return file_format, compress
+    return None, compress
+
+
+def export_records(records, path, fields, types, file_format=None, compress=None, null=''):
+    """
+    writes records to a file in one of the export formats
+    :param records: iterable of tuples, one value per field (None where a value is missing)
+    :param path: path of the file to write
+    :param fields: the names of the fields
+    :param types: the type of each field, 'int', 'float' or 'str'
+    :param file_format: one of EXPORT_FORMATS, worked out from the path if None
+    :param compress: true to gzip the file, worked out from the path (a .gz extension) if None
+    :param null: what csv writes for a missing value
+    :return: the number of records written
+    """
+    guessed_format, guessed_compress = export_format(path)
+    file_format = file_format or guessed_format or 'csv'
+    compress = guessed_compress if compress is None else compress
+    if file_format not in EXPORT_FORMATS:
+        logger.error(f'Unknown export format: {file_format}')
+        raise DalException(f'Unknown export format: {file_format}')
+    temp_path = path + '.tmp'
+    finished = False
+    try:
+        with metrics.span('export', format=file_format), open(temp_path, 'wb', buffering=WRITE_BUFFER_SIZE) as raw:
+            with (gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) if compress else raw) as file:
+                if file_format == 'csv':
+                    count = _write_csv(records, file, fields, null)
+                elif file_format == 'jsonl':
+                    count = _write_jsonl(records, file, fields)
+                else:
+                    count = _write_columnar(records, file, fields, types)
+        os.replace(temp_path, path)
+        finished = True
+        metrics.increment('rows_exported_total', count, format=file_format)
+        logger.info(f'exported {count} records to {path} ({file_format}{", gzip" if compress else ""})')
+        return count
+    except (OSError, ValueError, TypeError) as e:
+        logger.error(f'unable to export records to {path}: {e}')
+        raise DalException(f'Unable to export to {path}: {e}')
+    finally:
+        if not finished:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+def read_columnar(path):
+    """
+    reads the records back out of a columnar export, a row group at a time
+    :param path: path of the file (gzip compressed if it ends in .gz)
+    :return: generator of tuples, one value per field
+    """
+    opener = gzip.open if path.lower().endswith('.gz') else open
+    try:
+        with opener(path, 'rb') as file:
+            if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+                raise DalException(f'{path} is not a columnar export')
+            while True:
+                length = file.read(_GROUP_HEADER.size)
+                if not length:
+                    return
+                header = json.loads(file.read(_GROUP_HEADER.unpack(length)[0]).decode('utf-8'))
+                columns = [_read_column(file, header['rows'], column) for column in header['columns']]
+                yield from zip(*columns)
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        logger.error(f'unable to read columnar export {path}: {e}')
+        raise DalException(f'Unable to read {path}: {e}')
+
+
+def _write_csv(records, file, fields, null):
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(fields)
+    count = 0
+    for record in records:
+        writer.writerow([null if value is None else value for value in record])
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+
+def _write_jsonl(records, file, fields):
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='\n')
+    dumps = json.dumps
+    count = 0
+    for record in records:
+        text.write(dumps(dict(zip(fields, record)), ensure_ascii=False))
+        text.write('\n')
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+
+def _write_columnar(records, file, fields, types):
+    file.write(COLUMNAR_MAGIC)
+    count = 0
+    group = []
+    for record in records:
+        group.append(record)
+        if len(group) == ROW_GROUP_SIZE:
+            _write_row_group(file, group, fields, types)
+            count += len(group)
+            group = []
+    if group:
+        _write_row_group(file, group, fields, types)
+        count += len(group)
+    return count
+
+
+def _write_row_group(file, group, fields, types):
+    columns = []
+    sections = []
+    for position, (field, field_type) in enumerate(zip(fields, types)):
+        values = [record[position] for record in group]
+        if field_type in COLUMN_TYPECODES:
+            mask = bytes(value is None for value in values)
+            filler = math.nan if field_type == 'float' else 0
+            data = array(COLUMN_TYPECODES[field_type], (filler if value is None else value for value in values))
+            parts = [mask, data.tobytes()]
+        else:
+            encoded = [value.encode('utf-8') for value in values]
+            offsets = array('I', [0])
+            total = 0
+            for item in encoded:
+                total += len(item)
+                offsets.append(total)
+            parts = [offsets.tobytes(), b''.join(encoded)]
+        columns.append([field, field_type, [len(part) for part in parts]])
+        sections.extend(parts)
+    header = json.dumps({'rows': len(group), 'columns': columns}).encode('utf-8')
+    file.write(_GROUP_HEADER.pack(len(header)))
+    file.write(header)
+    for section in sections:
+        file.write(section)
+
+
+def _read_column(file, rows, column):
+    _, field_type, lengths = column
+    parts = [file.read(length) for length in lengths]
+    if field_type in COLUMN_TYPECODES:
+        mask, data = parts
+        values = array(COLUMN_TYPECODES[field_type])
+        values.frombytes(data)
+        return [None if missing else value for missing, value in zip(mask, values)]
+    offsets = array('I')
+    offsets.frombytes(parts[0])
+    blob = parts[1]
+    return [blob[offsets[index]:offsets[index + 1]].decode('utf-8') for index in range(rows)]
@@ -0,0 +1,201 @@
+import random
+import threading
+from exceptions import DalException
+from logging_config import get_logger
+import metrics
+from .cache import DatasetCache, REQUEST_TIMEOUT
+
+"""
+This module contains an asyncio loader for the datasets we download. It keeps one pooled requests.Session, gives every
+request explicit connect/read timeouts, retries failed requests a bounded number of times with jittered exponential
+backoff, and can fetch several files (e.g. airports, airlines and routes) at once. Everything goes through the
+DatasetCache, so a fresh cached copy is used without touching the network and a stale one is revalidated.
+
+The loader runs its own event loop on a background thread. submit() hands back a concurrent.futures.Future, so callers
+that aren't asyncio code still see the result or the exception, and can cancel a load that is still running.
+
+asyncio and requests are only imported (and the event loop and the session only created) the first time something is
+loaded through the loader, they take longer to import than the rest of the application does to start.
+
+Classes:
+--------
+    AsyncLoader:
+        fetches one or more urls through the dataset cache with pooling, timeouts, retries and cancellation.
+
+Methods:
+--------
+    backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+        how long to wait before retrying, with full jitter
+
+Constants:
+----------
+    DEFAULT_RETRIES: how many times a failed request is retried
+    BACKOFF_BASE: the backoff (in seconds) before the first retry, before jitter
+    BACKOFF_CAP: the longest backoff (in seconds) between retries, before jitter
+    POOL_SIZE: how many connections the session keeps open per host
+    RETRY_STATUS_CODES: response codes that are worth retrying
+"""
+
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+POOL_SIZE = 8
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+logger = get_logger(__name__)
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """
+    how long to wait before retrying, with full jitter so that clients that failed together don't retry together
+    :param attempt: the number of the attempt that just failed, starting at 0
+    :param base: backoff before the first retry
+    :param cap: longest backoff
+    :return: delay in seconds
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class AsyncLoader:
+    def __init__(self, cache=None, timeout=REQUEST_TIMEOUT, retries=DEFAULT_RETRIES, backoff_base=BACKOFF_BASE,
+                 backoff_cap=BACKOFF_CAP, pool_size=POOL_SIZE):
+        self.cache = cache if cache is not None else DatasetCache()
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.pool_size = pool_size
+        self._session = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """
+        the pooled requests.Session, created the first time the network is used (requests is slow to import)
+        :return: the session
+        """
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    async def fetch(self, url, refresh=False):
+        """
+        returns the body of the given url through the dataset cache, retrying the request if it fails
+        :param url: url of the dataset
+        :param refresh: true to revalidate even if the cached copy is still fresh
+        :return: the body as bytes
+        """
+        import asyncio
+        cache = self.cache
+        if not refresh and not cache.is_expired(url):
+            logger.info(f"Using cached copy of {url}")
+            metrics.increment('dataset_cache_hits_total')
+            return await asyncio.to_thread(cache.read, url)
+        import requests
+        headers = cache.validators(url)
+        reason = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = backoff_delay(attempt - 1, self.backoff_base, self.backoff_cap)
+                logger.warning(f"{reason}, retrying {url} in {delay:.2f}s ({attempt}/{self.retries})")
+                metrics.increment('download_retries_total')
+                await asyncio.sleep(delay)
+            try:
+                logger.info(f"Revalidating {url}" if headers else f"Downloading {url}")
+                with metrics.span('download'):
+                    response = await asyncio.to_thread(self.session.get, url, headers=headers, timeout=self.timeout)
+            except requests.Timeout as e:
+                reason = f"Request timed out: {e}"
+                continue
+            except requests.ConnectionError as e:
+                reason = f"Connection failed: {e}"
+                continue
+            except requests.RequestException as e:
+                # not something that trying again will fix
+                return cache.offline_copy(url, f"Request failed: {e}")
+            if response.status_code in RETRY_STATUS_CODES:
+                reason = f"Bad response ({response.status_code})"
+                continue
+            return await asyncio.to_thread(cache.handle_response, url, response)
+        return cache.offline_copy(url, f"{reason} after {self.retries} retries")
+
+    async def fetch_all(self, urls, refresh=False):
+        """
+        fetches several urls at once. If one of them fails the others are cancelled.
+        :param urls: iterable of urls
+        :param refresh: true to revalidate even if the cached copies are still fresh
+        :return: dict of url to body
+        """
+        import asyncio
+        urls = list(urls)
+        tasks = [asyncio.ensure_future(self.fetch(url, refresh)) for url in urls]
+        try:
+            bodies = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return dict(zip(urls, bodies))
+
+    def submit(self, urls, refresh=False):
+        """
+        fetches several urls at once on the loader's event loop
+        :param urls: iterable of urls
+        :param refresh: true to revalidate even if the cached copies are still fresh
+        :return: a concurrent.futures.Future for the dict of url to body. Cancelling it cancels the load, and it
+                 raises DalException if a url could not be fetched and there is no cached copy of it.
+        """
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(self.fetch_all(urls, refresh), self._event_loop())
+
+    def fetch_sync(self, url, refresh=False):
+        """
+        fetches a single url and waits for it
+        :param url: url of the dataset
+        :param refresh: true to revalidate even if the cached copy is still fresh
+        :return: the body as bytes
+        """
+        return self.submit([url], refresh).result()[url]
+
+    def _event_loop(self):
+        import asyncio
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='AsyncLoader', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    @staticmethod
+    async def _cancel_all():
+        import asyncio
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        """
+        cancels any loads that are still running, stops the event loop and closes the pooled connections
+        :return: n/a
+        """
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is not None:
+            import asyncio
+            asyncio.run_coroutine_threadsafe(self._cancel_all(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        if self._session is not None:
+            self._session.close()
@@ -0,0 +1,185 @@
+from array import array
+import json
+import mmap
+import os
+import struct
+import zlib
+from exceptions import DalException
+from logging_config import get_logger
+
+"""
+This module contains a compact binary file format for snapshots of parsed data. A snapshot is a set of named sections,
+each one the raw bytes of a typed array, laid out like this:
+
+    header:     magic, schema version, directory length, checksum (see HEADER)
+    directory:  json with the caller's metadata and the offset, length and typecode of every section
+    sections:   the raw bytes of each array, each one starting on an 8 byte boundary
+
+The checksum is a crc32 of everything after the header. Reading a snapshot memory-maps the file and hands back each
+section as a memoryview cast to its typecode, so nothing is copied until it is used. A column of strings is stored as
+one section of utf-8, the strings joined by SEPARATOR (see pack_strings), which is also how it is put in shared memory
+for the parallel scan.
+
+Methods:
+--------
+    write_snapshot(path, sections, version, meta=None):
+        writes a snapshot file, replacing any old one only once the new one is complete
+    read_snapshot(path, version):
+        memory-maps a snapshot file and checks its version and checksum
+    pack_strings(strings):
+        joins strings into the bytes of a single section
+    unpack_strings(data, count):
+        splits the bytes of a section back into its strings
+
+Classes:
+--------
+    Snapshot:
+        the metadata and sections of a snapshot file that has been read
+
+Constants:
+----------
+    MAGIC: the bytes every snapshot file starts with
+    HEADER: struct format of the header
+    ALIGNMENT: the boundary each section starts on
+    SEPARATOR: joins the strings of a packed section (it never appears in the data)
+"""
+
+MAGIC = b'APSNAP01'
+HEADER = struct.Struct('<8sIII')
+ALIGNMENT = 8
+SEPARATOR = '\0'
+logger = get_logger(__name__)
+
+
+class Snapshot:
+    def __init__(self, meta, sections, buffer):
+        self.meta = meta
+        self.sections = sections
+        self.buffer = buffer
+
+    def __getitem__(self, name):
+        return self.sections[name]
+
+    def __contains__(self, name):
+        return name in self.sections
+
+    def close(self):
+        """
+        releases the sections and unmaps the file, for a snapshot that isn't going to be used
+        :return: n/a
+        """
+        _release(self.sections.values(), self.buffer)
+
+
+def write_snapshot(path, sections, version, meta=None):
+    """
+    writes a snapshot file, replacing any old one only once the new one is complete
+    :param path: path of the snapshot file
+    :param sections: dict of section name to array.array (or a bytes-like object, stored as typecode 'B')
+    :param version: schema version of the data in the snapshot
+    :param meta: optional json-serializable dict stored with the snapshot
+    :return: n/a
+    """
+    layout = {}
+    offset = 0
+    blobs = []
+    for name, section in sections.items():
+        typecode = section.typecode if isinstance(section, array) else 'B'
+        blob = memoryview(section).cast('B')
+        padding = -offset % ALIGNMENT
+        offset += padding
+        blobs.append((padding, blob))
+        layout[name] = [offset, len(blob), typecode]
+        offset += len(blob)
+    directory = json.dumps({'meta': meta or {}, 'sections': layout}).encode('utf-8')
+    # sections start on an aligned boundary after the directory, so the offsets are relative to that
+    directory += b' ' * (-(HEADER.size + len(directory)) % ALIGNMENT)
+    checksum = zlib.crc32(directory)
+    for padding, blob in blobs:
+        checksum = zlib.crc32(blob, zlib.crc32(b'\0' * padding, checksum))
+    temp_path = path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(temp_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, version, len(directory), checksum))
+            file.write(directory)
+            for padding, blob in blobs:
+                file.write(b'\0' * padding)
+                file.write(blob)
+        os.replace(temp_path, path)
+        logger.info(f"Wrote {HEADER.size + len(directory) + offset} byte snapshot to {path}")
+    except OSError as e:
+        logger.error(f"Unable to write snapshot {path}: {e}")
+        raise DalException(f"Unable to write snapshot {path}: {e}")
+
+
+def read_snapshot(path, version):
+    """
+    memory-maps a snapshot file and checks its version and checksum
+    :param path: path of the snapshot file
+    :param version: the schema version the caller expects
+    :return: a Snapshot whose sections are memoryviews into the mapped file
+    """
+    try:
+        with open(path, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        # ValueError is an empty file, which can't be mapped
+        raise DalException(f"Unable to read snapshot {path}: {e}")
+    view = memoryview(buffer)
+    sections = {}
+    try:
+        if len(view) < HEADER.size:
+            raise DalException(f"Snapshot {path} is truncated")
+        magic, file_version, directory_length, checksum = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise DalException(f"{path} is not a snapshot")
+        if file_version != version:
+            raise DalException(f"Snapshot {path} is version {file_version}, expected {version}")
+        if zlib.crc32(view[HEADER.size:]) != checksum:
+            raise DalException(f"Snapshot {path} is corrupt (checksum mismatch)")
+        start = HEADER.size + directory_length
+        try:
+            directory = json.loads(bytes(view[HEADER.size:start]).decode('utf-8'))
+            for name, (offset, length, typecode) in directory['sections'].items():
+                sections[name] = view[start + offset:start + offset + length].cast(typecode)
+            meta = directory['meta']
+        except (ValueError, KeyError, TypeError) as e:
+            raise DalException(f"Snapshot {path} has a bad directory: {e}")
+    except DalException:
+        # unmap the file before raising, so it can be replaced (Windows won't replace a file that is mapped)
+        _release([*sections.values(), view], buffer)
+        raise
+    view.release()
+    return Snapshot(meta, sections, buffer)
+
+
+def pack_strings(strings):
+    """
+    joins strings into the bytes of a single section
+    :param strings: iterable of str, none of which contain SEPARATOR
+    :return: the utf-8 bytes
+    """
+    return SEPARATOR.join(strings).encode('utf-8')
+
+
+def unpack_strings(data, count):
+    """
+    splits the bytes of a section back into its strings
+    :param data: bytes (or a memoryview of them) from pack_strings()
+    :param count: how many strings were packed (an empty section is either no strings or one empty one)
+    :return: list of str
+    """
+    if not count:
+        return []
+    return bytes(data).decode('utf-8').split(SEPARATOR)
+
+
+def _release(views, buffer):
+    for view in views:
+        view.release()
+    try:
+        buffer.close()
+    except BufferError:
+        # something made from a section (e.g. a slice of it) is still alive, the file is unmapped once it is collected
+        pass
@@ -1,50 +1,82 @@
+import threading
 import tkinter as tk
-from concurrent.futures import ThreadPoolExecutor
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 import business as b
 import validation
 from exceptions import BusinessLogicException
+from .results_view import ResultsView
 
 
 """
 In this module we have a class, AirportForm, that creates a gui for the user to interact with in order to search 
-for airports based on various parameters.
+for airports based on various parameters. The data itself is loaded and searched by a business.AirportSearchService.
+
+Once the data is in memory, typing in the name, city and code entries searches as you type: a search runs once the user
+has stopped typing for LIVE_SEARCH_DELAY_MS, in the background, and every search is numbered so only the results of the
+newest one are shown (one that hasn't started yet when a newer one comes along is cancelled). A search the user started
+with the search button isn't interrupted by typing, the search-as-you-type waits until it has finished. Deleting
+everything that was searched for clears the results.
 
 Methods:
 --------
     create_widgets(self):
         Creates the widgets in the GUI form AirportForm
+    start_warm_load(self):
+        starts loading the cached airport data in the background once the window has been drawn
+    fill_country_list(self):
+        puts the countries in the country list, the first time it is opened
     search_onclick(self):
-        handles the click event for the search button
+        handles the click event for the search button, streams the results in as they are found
+    cancel_onclick(self):
+        handles the click event for the cancel button, stops the search that is running
+    schedule_live_search(self, event=None):
+        handles a key press in one of the search-as-you-type entries, (re)starts the wait before searching
+    live_search(self):
+        searches the data in memory for what has been typed, in the background
+    show_live_results(self, generation, results):
+        shows the results of a search-as-you-type, if no newer search has started since
     clear_onclick(self):
         handles the click event for the clear button
+    routes_onclick(self):
+        handles the click event for the routes button, shows direct destinations, the route between two airports or
+        the airports within a number of flights
     export_onclick(self):
-        passes the contents of the results text to a method which will export them to results_export.txt
+        asks the user where to export the results in the results view, then exports them in the background
     show_all_onclick(self):
         handles click event for the 'show all' button
-    get_search_params(self):
+    refresh_onclick(self):
+        handles click event for the 'refresh' button
+    get_search_params(self, quiet=False):
         builds a dict of search parameters that the user selects/inputs
-    filter_airport_results(self):
-        filters a list of airport objects by checking for matches to the user's search parameters
-    update_results(self):
-        updates the GUI with results from a search
+    add_results(self, search, batch):
+        adds a batch of streamed results to the GUI
+    finish_results(self, search):
+        updates the GUI once a streamed search has finished
+    show_routes(self, generation, results, description):
+        shows the airports a route query found, if no newer search has started since
+    show_route_error(self, generation, message):
+        tells the user a route query failed, if no newer search has started since
+    finish_export(self, path, count):
+        tells the user that an export has finished (and lets them export again)
+    cancel_search(self):
+        stops the search that is running, if there is one, and any search-as-you-type
+    cancel_live_search(self):
+        stops a search-as-you-type that is waiting or running, so its results are never shown
     update_all(self):
         updates the GUI with results if user selects "update all"
     display_error(self, message):
         displays an error message
-    update_text(self, message):
-        Updates results_text with a given message
     validation_error_message(self, entry):
         displays error message if there is a validation issue with the search parameters
     on_close(self):
-        shuts down the executor if the gui is closed
-    set_airport_list(cls, list_to_set):
-        used to update the airport list from outside of this class
+        shuts down the search service if the gui is closed
         
 Constants:
 ----------
     COUNTRY_LIST: list of countries to select from (pulled from website provided in assignment)
     DST_LIST: list of DST options pulled from website provided in assignment
+    EXPORT_FILE_TYPES: the file types the export dialog offers
+    LIVE_SEARCH_DELAY_MS: how long the user has to stop typing for before a search-as-you-type runs
 """
 
 
@@ -88,16 +120,30 @@ COUNTRY_LIST = ['ALL', 'Afghanistan', 'Albania', 'Algeria', 'American Samoa', 'A
                 'Vietnam', 'Wake Island', 'Wallis and Futuna Islands', 'Western Sahara', 'Yemen', 'Zambia', 'Zimbabwe']
 
 DST_LIST = ['Unknown', 'European', 'US/Canada', 'S. America', 'Australia', 'New Zealand', 'None']
+EXPORT_FILE_TYPES = [('CSV', '*.csv'), ('JSON Lines', '*.jsonl'), ('Columnar', '*.col'),
+                     ('Compressed', ('*.csv.gz', '*.jsonl.gz', '*.col.gz')), ('Summary', '*.dat')]
+LIVE_SEARCH_DELAY_MS = 250
 
 
 class AirportForm(tk.Tk):
-    airport_list = []
-
-    def __init__(self):
+    def __init__(self, search_service=None):
         super().__init__()
         self.title("Airport Search")
         self.create_widgets()
-        self.executor = ThreadPoolExecutor()
+        self.search_service = search_service if search_service is not None else b.AirportSearchService()
+        self.running_search = None
+        self.result_count = 0
+        # search-as-you-type: the pending after() job, the number of the newest search, its future and its parameters
+        self.live_search_job = None
+        self.live_generation = 0
+        self.live_future = None
+        self.live_params = None
+        # the future of the route query that is running, it is numbered with live_generation too
+        self.route_future = None
+        # the snapshot of the cached data loads in milliseconds, so the first search doesn't have to wait for it. It
+        # starts once the window has been drawn, so it doesn't hold up the first paint.
+        self.warm_load = None
+        self.after_idle(self.start_warm_load)
         self.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def create_widgets(self):
@@ -130,7 +176,8 @@ class AirportForm(tk.Tk):
         # fourth row entries
         self.city_name_entry = ttk.Entry(self)
         self.city_name_entry.grid(row=3, column=0, padx=5, pady=5)
-        self.country_name_combo = ttk.Combobox(self, values=COUNTRY_LIST, state='readonly')
+        # the countries are only put in the list the first time it is opened
+        self.country_name_combo = ttk.Combobox(self, state='readonly', postcommand=self.fill_country_list)
         self.country_name_combo.grid(row=3, column=1, padx=5, pady=5)
 
         # fifth row labels
@@ -158,6 +205,30 @@ class AirportForm(tk.Tk):
         self.dst_combo = ttk.Combobox(self, values=DST_LIST, state='readonly')
         self.dst_combo.grid(row=5, column=4, padx=5, pady=5)
 
+        # seventh row labels
+        self.radius_label = ttk.Label(self, text='Within (km): ')
+        self.radius_label.grid(row=6, column=0, padx=5, sticky='w')
+        self.nearest_label = ttk.Label(self, text='Nearest: ')
+        self.nearest_label.grid(row=6, column=1, padx=5)
+        self.route_from_label = ttk.Label(self, text='Route from: ')
+        self.route_from_label.grid(row=6, column=2, padx=5)
+        self.route_to_label = ttk.Label(self, text='Route to: ')
+        self.route_to_label.grid(row=6, column=3, padx=5)
+        self.hops_label = ttk.Label(self, text='Max flights: ')
+        self.hops_label.grid(row=6, column=4, padx=5)
+
+        # eighth row entries
+        self.radius_entry = ttk.Entry(self)
+        self.radius_entry.grid(row=7, column=0, padx=5, pady=5)
+        self.nearest_entry = ttk.Entry(self, width=5)
+        self.nearest_entry.grid(row=7, column=1, padx=5, pady=5)
+        self.route_from_entry = ttk.Entry(self, width=6)
+        self.route_from_entry.grid(row=7, column=2, padx=5, pady=5)
+        self.route_to_entry = ttk.Entry(self, width=6)
+        self.route_to_entry.grid(row=7, column=3, padx=5, pady=5)
+        self.hops_entry = ttk.Entry(self, width=5)
+        self.hops_entry.grid(row=7, column=4, padx=5, pady=5)
+
         # frame for buttons
         self.button_frame = ttk.Frame(self, width=25, borderwidth=5, relief='sunken')
         self.button_frame.grid(row=0, rowspan=4, column=3, columnspan=2, padx=5, pady=5, ipady=5)
@@ -171,29 +242,141 @@ class AirportForm(tk.Tk):
         self.export_button.grid(row=2, column=3, padx=5, pady=5)
         self.show_all_button = ttk.Button(self.button_frame, text="Show All", command=self.show_all_onclick)
         self.show_all_button.grid(row=2, column=4, padx=5, pady=5)
+        self.refresh_button = ttk.Button(self.button_frame, text="Refresh", command=self.refresh_onclick)
+        self.refresh_button.grid(row=3, column=3, padx=5, pady=5)
+        self.cancel_button = ttk.Button(self.button_frame, text="Cancel", command=self.cancel_onclick, state='disabled')
+        self.cancel_button.grid(row=3, column=4, padx=5, pady=5)
+        self.routes_button = ttk.Button(self.button_frame, text="Routes", command=self.routes_onclick)
+        self.routes_button.grid(row=4, column=3, padx=5, pady=5)
 
         # results
         self.number_of_results_label = ttk.Label(self, text="Number of Results: ")
-        self.number_of_results_label.grid(row=6, column=0, padx=5, pady=5)
-        self.results_text = tk.Text(self, width=80, height=15, state='disabled')
-        self.results_text.grid(row=7, column=0, columnspan=5, padx=5, pady=5)
+        self.number_of_results_label.grid(row=8, column=0, padx=5, pady=5)
+        self.results_view = ResultsView(self, height=15)
+        self.results_view.grid(row=9, column=0, columnspan=5, padx=5, pady=5, sticky='nsew')
+        self.rowconfigure(9, weight=1)
+
+        # search as you type in the text entries
+        for entry in (self.airport_name_entry, self.iata_entry, self.icao_entry, self.city_name_entry):
+            entry.bind('<KeyRelease>', self.schedule_live_search)
+
+    def start_warm_load(self):
+        """
+        starts loading the cached airport data in the background, so it is ready to search by the time the user has
+        typed something
+        :return: the future of the load
+        """
+        if self.warm_load is None:
+            self.warm_load = self.search_service.executor.submit(self.search_service.restore)
+        return self.warm_load
+
+    def fill_country_list(self):
+        """
+        puts the countries in the country list, the first time it is opened
+        :return: n/a
+        """
+        if not self.country_name_combo.cget('values'):
+            self.country_name_combo.config(values=COUNTRY_LIST)
 
     def search_onclick(self):
         """
-        handles the click event for the search button
+        handles the click event for the search button, streams the results in as they are found
         :return: n/a
         """
+        params = self.get_search_params()
+        if not params:  # validation failed, the user has already been told why
+            return
+        self.cancel_search()
+        # so typing only searches again once it changes what is searched for (or clears it)
+        self.live_params = dict(params)
+        search = threading.Event()
+        self.running_search = search
+        self.result_count = 0
+        self.results_view.clear()
+        self.number_of_results_label.config(text="Number of Results: 0 (searching...)")
+        self.cancel_button.config(state='normal')
         try:
-            b.retrieve_airport_data(self)
+            b.stream_airport_results(self, params, search)
             self.export_button.config(state='normal')
         except BusinessLogicException as e:
+            self.cancel_search()
             self.display_error(f"Some error occurred: {e}")
 
+    def cancel_onclick(self):
+        """
+        handles the click event for the cancel button, stops the search that is running
+        :return: n/a
+        """
+        if self.running_search is not None:
+            self.cancel_search()
+            self.number_of_results_label.config(text=f"Number of Results: {self.result_count} (cancelled)")
+
+    def schedule_live_search(self, event=None):
+        """
+        handles a key press in one of the search-as-you-type entries: the search waits until the user has stopped
+        typing for LIVE_SEARCH_DELAY_MS, so each key press starts the wait again
+        :param event: the tkinter key event
+        :return: n/a
+        """
+        if self.live_search_job is not None:
+            self.after_cancel(self.live_search_job)
+        self.live_search_job = self.after(LIVE_SEARCH_DELAY_MS, self.live_search)
+
+    def live_search(self):
+        """
+        searches the data in memory for what has been typed, in the background. Nothing happens until the data is
+        loaded (the search button loads it), or while what is typed isn't a valid search yet, e.g. half an IATA code.
+        While a search from the search button is streaming in, it waits for that to finish. If everything that was
+        searched for has been deleted, the results are cleared.
+        :return: n/a
+        """
+        self.live_search_job = None
+        if not self.search_service.is_loaded():
+            return
+        if self.running_search is not None:
+            self.schedule_live_search()
+            return
+        params = self.get_search_params(quiet=True)
+        if params is None or params == self.live_params:
+            # still typing, or a key that didn't change anything (e.g. an arrow key)
+            return
+        if not params and self.live_params is None:
+            # nothing has been typed, and the results aren't from something that was (e.g. show all)
+            return
+        self.cancel_live_search()
+        self.live_params = dict(params)
+        if not params:
+            self.results_view.clear()
+            self.export_button.config(state='disabled')
+            self.number_of_results_label.config(text="Number of Results: 0")
+            return
+        generation = self.live_generation
+        self.number_of_results_label.config(text=f"Number of Results: {len(self.results_view)} (searching...)")
+        try:
+            self.live_future = b.live_airport_results(self, params, generation)
+        except BusinessLogicException as e:
+            self.display_error(f"Some error occurred: {e}")
+
+    def show_live_results(self, generation, results):
+        """
+        shows the results of a search-as-you-type, unless another search has started since
+        :param generation: the number of the search the results are from
+        :param results: list of (distance in km or None, airport row)
+        :return: n/a
+        """
+        if generation != self.live_generation:
+            return
+        self.live_future = None
+        self.results_view.set_results(results)
+        self.export_button.config(state='normal')
+        self.number_of_results_label.config(text=f"Number of Results: {len(results)}")
+
     def clear_onclick(self):
         """
         handles the click event for the clear button
         :return: n/a
         """
+        self.cancel_search()
         self.airport_name_entry.delete(0, tk.END)
         self.iata_entry.delete(0, tk.END)
         self.icao_entry.delete(0, tk.END)
@@ -204,45 +387,137 @@ class AirportForm(tk.Tk):
         self.elevation_entry.delete(0, tk.END)
         self.utc_entry.delete(0, tk.END)
         self.dst_combo.set("")
-        self.results_text.config(state='normal')
-        self.results_text.delete('1.0', tk.END)
-        self.results_text.config(state='disabled')
+        self.radius_entry.delete(0, tk.END)
+        self.nearest_entry.delete(0, tk.END)
+        self.route_from_entry.delete(0, tk.END)
+        self.route_to_entry.delete(0, tk.END)
+        self.hops_entry.delete(0, tk.END)
+        self.results_view.clear()
         self.export_button.config(state='disabled')
         self.number_of_results_label.config(text="Number of Results: 0")
 
+    def routes_onclick(self):
+        """
+        handles the click event for the routes button. With just an airport in 'Route from' it shows the direct
+        destinations, with 'Route to' as well the way there with the fewest flights, and with 'Max flights' (and no
+        'Route to') every airport that can be reached in that many flights.
+        :return: n/a
+        """
+        source = self.route_from_entry.get().strip()
+        destination = self.route_to_entry.get().strip()
+        max_hops = self.hops_entry.get().strip()
+        if source == "":
+            self.display_error('A route query needs an airport to start from!')
+            return
+        for entry, value in (('Route from', source), ('Route to', destination)):
+            if value != "" and not (value.isdigit() or validation.validate_iata(value) or
+                                    validation.validate_icao(value)):
+                self.validation_error_message(entry)
+                return
+        if max_hops != "" and not (validation.is_positive_int(max_hops) and 0 < int(max_hops) <= b.MAX_HOPS):
+            self.validation_error_message('Max flights')
+            return
+        self.cancel_search()
+        self.number_of_results_label.config(text="Number of Results: 0 (searching...)")
+        try:
+            self.route_future = b.route_airport_results(self, self.live_generation, source, destination or None,
+                                                        int(max_hops) if max_hops else None)
+        except BusinessLogicException as e:
+            self.display_error(f"Some error occurred: {e}")
+
+    def show_routes(self, generation, results, description):
+        """
+        shows the airports a route query found, unless another search has started since
+        :param generation: the number of the route query
+        :param results: list of (None, airport row), in the order they should be shown (a route in the order it is
+                        flown)
+        :param description: what was found, shown next to the number of results
+        :return: n/a
+        """
+        if generation != self.live_generation:
+            return
+        self.route_future = None
+        # a route only makes sense in the order it is flown
+        self.results_view.set_results(results, keep_sort=False)
+        self.export_button.config(state='normal')
+        self.number_of_results_label.config(text=f"Number of Results: {len(results)} ({description})")
+
+    def show_route_error(self, generation, message):
+        """
+        tells the user that a route query failed, unless another search has started since
+        :param generation: the number of the route query
+        :param message: what went wrong
+        :return: n/a
+        """
+        if generation != self.live_generation:
+            return
+        self.route_future = None
+        self.display_error(message)
+
     def export_onclick(self):
         """
-        passes the contents of the results text to a method which will export them to results_export.txt
+        asks the user where to export the results in the results view, then exports them in the background. The file
+        type picks the format: csv, json lines or columnar get every field (gzip compressed if the name ends in .gz),
+        .dat gets the same summaries the view shows.
         :return: n/a
         """
-        results = self.results_text.get(0.0, tk.END)
-        if len(results) < 20:  # I chose 20 arbitrarily, for some reason if results == "" did not work here, even
-            # if the results text was cleared immediately before.
-            # I suspect a newline character or something, but I don't know...
+        if len(self.results_view) == 0:
             messagebox.showinfo('Error', 'Will not export with no results')
             return
+        path = filedialog.asksaveasfilename(parent=self, title='Export results', initialfile='results_export.csv',
+                                            filetypes=EXPORT_FILE_TYPES)
+        if not path:
+            return
         try:
-            b.write_results_to_txt(results)
-            messagebox.showinfo('Success', 'Data Exported to results_export.dat')
+            # a copy of the list of rows, so a new search can't change what is being exported
+            b.export_airport_results(self, list(self.results_view.results), path)
+            self.export_button.config(state='disabled')
         except BusinessLogicException:
             messagebox.showinfo('Error', 'Unable export data.')
 
+    def finish_export(self, path, count):
+        """
+        tells the user that an export has finished
+        :param path: the file that was written
+        :param count: how many airports were exported, None if the export failed
+        :return: n/a
+        """
+        self.export_button.config(state='normal')
+        if count is not None:
+            messagebox.showinfo('Success', f'Exported {count} airports to {path}')
+
     def show_all_onclick(self):
         """
         handles click event for the 'show all' button
         :return: n/a
         """
+        self.cancel_search()
+        try:
+            b.retrieve_airport_data(self)
+            self.export_button.config(state='normal')
+        except BusinessLogicException as e:
+            self.display_error(f"Some error occurred: {e}")
+
+    def refresh_onclick(self):
+        """
+        handles click event for the 'refresh' button, re-downloads the airport data (if it has changed) and shows it
+        :return: n/a
+        """
+        self.cancel_search()
         try:
-            b.retrieve_airport_data(self, True)
+            b.retrieve_airport_data(self, refresh=True)
             self.export_button.config(state='normal')
         except BusinessLogicException as e:
             self.display_error(f"Some error occurred: {e}")
 
-    def get_search_params(self):
+    def get_search_params(self, quiet=False):
         """
         builds a dict of search parameters that the user selects/inputs
+        :param quiet: true to return nothing on a validation error without telling the user, e.g. while they type
         :return: a dict of search parameters from the gui (or if there is some validation error, returns nothing)
         """
+        validation_error_message = (lambda entry: None) if quiet else self.validation_error_message
+        display_error = (lambda message: None) if quiet else self.display_error
         # build the search params with a builder...
         builder = b.AirportSearchBuilder()
         # go through each entry one by one and if there is anything in it, add it to the builder
@@ -254,14 +529,14 @@ class AirportForm(tk.Tk):
             if validation.validate_iata(iata_code):
                 builder.with_param('iata_code', iata_code)
             else:
-                self.validation_error_message('IATA')
+                validation_error_message('IATA')
                 return
         icao_code = self.icao_entry.get()
         if icao_code != "":
             if validation.validate_icao(icao_code):
                 builder.with_param('icao_code', icao_code)
             else:
-                self.validation_error_message('IACO')
+                validation_error_message('IACO')
                 return
         city_name = self.city_name_entry.get()
         if city_name != "":
@@ -276,70 +551,120 @@ class AirportForm(tk.Tk):
                 if validation.is_float(latitude):
                     builder.with_param('latitude', latitude)
                 else:
-                    self.validation_error_message('Latitude')
+                    validation_error_message('Latitude')
                     return
             else:
-                self.display_error('Must include a latitude AND longitude, or neither!')
+                display_error('Must include a latitude AND longitude, or neither!')
                 return
         if longitude != "":
             if latitude != "":
                 if validation.is_float(longitude):
                     builder.with_param('longitude', longitude)
                 else:
-                    self.validation_error_message('Longitude')
+                    validation_error_message('Longitude')
                     return
             else:
-                self.display_error('Must include a latitude AND longitude, or neither!')
+                display_error('Must include a latitude AND longitude, or neither!')
+                return
+        radius = self.radius_entry.get()
+        nearest = self.nearest_entry.get()
+        if (radius != "" or nearest != "") and (latitude == "" or longitude == ""):
+            display_error('A distance search needs a latitude and longitude!')
+            return
+        if radius != "":
+            if validation.is_positive_float(radius):
+                builder.with_param('radius_km', radius)
+            else:
+                validation_error_message('Within (km)')
+                return
+        if nearest != "":
+            if validation.is_positive_int(nearest) and int(nearest) > 0:
+                builder.with_param('nearest', nearest)
+            else:
+                validation_error_message('Nearest')
                 return
         elevation = self.elevation_entry.get()
         if elevation != "":
             if validation.is_positive_int(elevation):
                 builder.with_param('elevation', elevation)
             else:
-                self.validation_error_message('Elevation')
+                validation_error_message('Elevation')
                 return
         utc_offset = self.utc_entry.get()
         if utc_offset != "":
             if validation.validate_utc(utc_offset):
                 builder.with_param('utc_offset', utc_offset)
             else:
-                self.validation_error_message("UTC")
+                validation_error_message("UTC")
                 return
         dst_area = self.dst_combo.get()
         if dst_area != "":
             builder.with_param('dst_area', dst_area)
         if len(builder.build()) == 0:
-            self.display_error("You must use at least 1 parameter")
+            display_error("You must use at least 1 parameter")
         return builder.build()
 
-    def filter_airport_results(self):
+    def add_results(self, search, batch):
         """
-        filters a list of airport objects by checking for matches to the user's search parameters
-        :return: a list of airport objects that match
+        adds a batch of streamed results to the GUI
+        :param search: the threading.Event of the search the batch is from, batches from an older search are ignored
+        :param batch: list of (distance in km or None, airport row)
+        :return: n/a
         """
-        results = []  # blank list to store results
-        params = self.get_search_params()  # build search parameters into a dict
-        for item in self.airport_list:
-            if item.check_for_match(params):
-                results.append(item)
-        return results
+        if search is not self.running_search or search.is_set():
+            return
+        self.results_view.extend(batch)
+        self.result_count += len(batch)
+        self.number_of_results_label.config(text=f"Number of Results: {self.result_count} (searching...)")
 
-    def update_results(self):
+    def finish_results(self, search):
         """
-        updates the GUI with results from a search
+        updates the GUI once a streamed search has finished
+        :param search: the threading.Event of the search that finished
         :return: n/a
         """
-        results = self.filter_airport_results()
-        self.update_text(''.join(f"{airport}\n" for airport in results))
-        self.number_of_results_label.config(text=f"Number of Results: {len(results)}")
+        if search is not self.running_search:
+            return
+        self.running_search = None
+        self.cancel_button.config(state='disabled')
+        self.number_of_results_label.config(text=f"Number of Results: {self.result_count}")
+
+    def cancel_search(self):
+        """
+        stops the search that is running, if there is one, and any search-as-you-type
+        :return: n/a
+        """
+        if self.running_search is not None:
+            self.running_search.set()
+            self.running_search = None
+        if self.route_future is not None:
+            self.route_future.cancel()
+            self.route_future = None
+        # whatever the user does next supersedes a search-as-you-type that hasn't finished
+        self.cancel_live_search()
+        self.live_params = None
+        self.cancel_button.config(state='disabled')
+
+    def cancel_live_search(self):
+        """
+        stops a search-as-you-type that is waiting or running, so its results are never shown
+        :return: n/a
+        """
+        if self.live_search_job is not None:
+            self.after_cancel(self.live_search_job)
+            self.live_search_job = None
+        if self.live_future is not None:
+            self.live_future.cancel()
+            self.live_future = None
+        self.live_generation += 1
 
     def update_all(self):
         """
         updates the GUI with results if user selects "update all"
         :return:
         """
-        results = self.airport_list
-        self.update_text(''.join(f"{airport}\n" for airport in results))
+        results = self.search_service.all_rows()
+        self.results_view.set_results((None, airport) for airport in results)
         self.number_of_results_label.config(text=f"Number of Results: {len(results)}")
 
     def display_error(self, message):
@@ -350,17 +675,6 @@ class AirportForm(tk.Tk):
         """
         return messagebox.showinfo('Error', f"{message}")
 
-    def update_text(self, message):
-        """
-        Updates results_text with a given message
-        :param message: message to display to results_text
-        :return: n/a
-        """
-        self.results_text.config(state='normal')
-        self.results_text.delete('1.0', tk.END)
-        self.results_text.insert(tk.END, f"{message}")
-        self.results_text.config(state='disabled')
-
     def validation_error_message(self, entry):
         """
         displays error message if there is a validation issue with the search parameters
@@ -371,18 +685,10 @@ class AirportForm(tk.Tk):
 
     def on_close(self):
         """
-        shuts down the executor if the gui is closed
+        shuts down the search service if the gui is closed
         :return: n/a
         """
-        self.executor.shutdown(wait=False)
+        self.cancel_search()
+        self.search_service.shutdown(wait=False)
         self.destroy()
 
-    @classmethod
-    def set_airport_list(cls, list_to_set):
-        """
-        used to update the airport list from outside of this class
-        :param list_to_set: list of airport objects
-        :return: n/a
-        """
-        cls.airport_list = list_to_set
-
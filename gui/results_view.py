@@ -0,0 +1,166 @@
+import heapq
+import math
+from tkinter import ttk
+import metrics
+
+"""
+This module contains a virtualized view of search results. The results are kept as a list of (distance, airport row)
+and only the ones the user has scrolled to are turned into Treeview items: the first page is shown straight away, and
+the next page is added when the user scrolls near the bottom. Clicking a column heading sorts the results by that
+column (clicking it again reverses the order), and results streamed in after that are merged into the sorted order.
+
+Classes:
+--------
+    ResultsView:
+        a Treeview of search results with a scrollbar, paged in as the user scrolls
+
+Constants:
+----------
+    COLUMNS: the columns of the view, as (name, heading, width)
+    PAGE_SIZE: how many results are added to the Treeview at a time
+    PAGE_IN_AT: how far down the view (as a fraction) the user has to scroll before the next page is added
+"""
+
+COLUMNS = (('airport_name', 'Airport', 260), ('iata_code', 'IATA', 50), ('icao_code', 'ICAO', 50),
+           ('city_name', 'City', 140), ('country_name', 'Country', 140), ('distance', 'Distance (km)', 90))
+PAGE_SIZE = 100
+PAGE_IN_AT = 0.9
+
+
+class ResultsView(ttk.Frame):
+    def __init__(self, master, height=15, **kwargs):
+        super().__init__(master, **kwargs)
+        self.results = []
+        self.shown = 0
+        self.sort_column = None
+        self.sort_reverse = False
+        self._page_pending = False
+        self.tree = ttk.Treeview(self, columns=[name for name, _, _ in COLUMNS], show='headings', height=height)
+        for name, heading, width in COLUMNS:
+            self.tree.heading(name, text=heading, command=lambda column=name: self.sort_by(column))
+            self.tree.column(name, width=width, anchor='e' if name == 'distance' else 'w')
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+    def __len__(self):
+        return len(self.results)
+
+    def set_results(self, results, keep_sort=True):
+        """
+        replaces the results in the view and shows the first page of them
+        :param results: iterable of (distance in km or None, airport row)
+        :param keep_sort: true to sort them by the column the user sorted by, false to show them in the order given
+                          (and forget the sort)
+        :return: n/a
+        """
+        self.results = list(results)
+        if not keep_sort:
+            self.reset_sort()
+        elif self.sort_column is not None:
+            self.results.sort(key=self._sort_key(self.sort_column), reverse=self.sort_reverse)
+        self._reset()
+
+    def extend(self, results):
+        """
+        adds results to the view (e.g. a batch from a streamed search): at the end, or merged into the order the user
+        sorted by. They are only shown once the user scrolls to them, unless the view isn't full yet or they sort in
+        among the rows that are already shown.
+        :param results: iterable of (distance in km or None, airport row)
+        :return: n/a
+        """
+        if self.sort_column is None:
+            self.results.extend(results)
+        else:
+            key = self._sort_key(self.sort_column)
+            batch = sorted(results, key=key, reverse=self.sort_reverse)
+            if not batch:
+                return
+            shown = self.results[:self.shown]
+            self.results = list(heapq.merge(self.results, batch, key=key, reverse=self.sort_reverse))
+            if self.results[:self.shown] != shown:
+                self._redraw()
+        if self.shown < PAGE_SIZE:
+            self.show_more()
+
+    def clear(self):
+        """
+        removes every result from the view and forgets how they were sorted
+        :return: n/a
+        """
+        self.results = []
+        self.reset_sort()
+        self._reset()
+
+    def reset_sort(self):
+        """
+        forgets the column the user sorted by, so results are shown in the order they are given
+        :return: n/a
+        """
+        self.sort_column = None
+        self.sort_reverse = False
+
+    def sort_by(self, column):
+        """
+        sorts the results by a column, reversing the order if they are already sorted by it
+        :param column: name of the column
+        :return: n/a
+        """
+        self.sort_reverse = not self.sort_reverse if column == self.sort_column else False
+        self.sort_column = column
+        self.results.sort(key=self._sort_key(column), reverse=self.sort_reverse)
+        self._reset()
+
+    def on_scroll(self, first, last):
+        """
+        yscrollcommand for the Treeview, moves the scrollbar and adds the next page when the user nears the bottom
+        :param first: fraction of the view above the visible rows
+        :param last: fraction of the view up to the bottom of the visible rows
+        :return: n/a
+        """
+        self.scrollbar.set(first, last)
+        if float(last) >= PAGE_IN_AT and self.shown < len(self.results) and not self._page_pending:
+            # the Treeview calls this while it is redrawing, so the page is added once it has finished
+            self._page_pending = True
+            self.after_idle(self.show_more)
+
+    def show_more(self):
+        """
+        adds the next page of results to the Treeview
+        :return: n/a
+        """
+        self._page_pending = False
+        end = min(len(self.results), self.shown + PAGE_SIZE)
+        insert = self.tree.insert
+        with metrics.span('render', view='gui'):
+            for distance, airport in self.results[self.shown:end]:
+                insert('', 'end', values=(airport.airport_name, airport.iata_code, airport.icao_code,
+                                          airport.city_name, airport.country_name,
+                                          '' if distance is None else f"{distance:.1f}"))
+        metrics.increment('rows_rendered_total', end - self.shown, view='gui')
+        self.shown = end
+
+    def _redraw(self):
+        # shows the same number of rows again, from the top of the results, without scrolling
+        count = self.shown
+        first, _ = self.tree.yview()
+        self.tree.delete(*self.tree.get_children())
+        self.shown = 0
+        while self.shown < count:
+            self.show_more()
+        self.tree.yview_moveto(first)
+
+    def _reset(self):
+        self.tree.delete(*self.tree.get_children())
+        self.shown = 0
+        self.tree.yview_moveto(0)
+        self.show_more()
+
+    @staticmethod
+    def _sort_key(column):
+        if column == 'distance':
+            return lambda result: math.inf if result[0] is None else result[0]
+        return lambda result: getattr(result[1], column).casefold()
@@ -1,15 +1,194 @@
+import atexit
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+import json
 import logging as l
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import os
+import queue
+import threading
+import time
 
 """
-This module configures our logging options for the application.
+This module configures our logging options for the application. Nothing happens when it is imported, and asking for a
+logger only puts a handler on the root logger that queues records: the thread that writes the queue to the log file,
+the file and its directory are only created when the first record is logged. A thread that logs (the gui's and the
+search threads included) never waits on the disk. The file is rotated once it reaches LOG_MAX_BYTES.
+
+Each line of the log is a json object: the time, level, logger, thread and message, plus any fields passed to the
+logger in `extra` (e.g. duration_ms) and the id of the query the record was logged during, if any (see
+query_context()), so every record from one search or one http request can be picked out of the log. Where in the
+source a record was logged from isn't looked up, the logger's name says which module it was.
+
+Methods:
+--------
+    get_logger(module_name):
+        returns the logger for a module, setting up logging the first time it is called
+    configure_logging(path=LOG_FILE, level=LOG_LEVEL):
+        sets up the queue the loggers write to (only the first call does anything)
+    shutdown_logging():
+        writes out whatever is still queued and stops the thread, it is called when the program exits
+    query_context(query_id=None):
+        context manager that tags every record logged inside it with the id of a query
+    current_query_id():
+        the id of the query that is being answered, None outside of one
+
+Classes:
+--------
+    JsonFormatter:
+        formats a record as a single line json object
+
+Constants:
+----------
+    LOG_FILE: the file the log is written to (its directory is created if it is missing)
+    LOG_LEVEL: the lowest level that is logged
+    LOG_MAX_BYTES: how big the log file gets before it is rotated
+    LOG_BACKUPS: how many rotated log files are kept
+    DATE_FORMAT: the format of the time of a record
 """
 
-l.basicConfig(
-              filename='logs/app.log',
-              level=l.INFO,
-              format='[%(asctime)s - %(filename)s:%(lineno)d - %(funcName)s() -%(levelname)s - %(message)s',
-              datefmt='%Y-%m-%d %H:%M:%S')
+LOG_FILE = os.path.join('logs', 'app.log')
+LOG_LEVEL = l.INFO
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 3
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# the attributes every record has, anything else on a record was passed in `extra`
+_RECORD_ATTRIBUTES = frozenset(l.LogRecord('', l.INFO, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+_query_id = ContextVar('query_id', default=None)
+_query_ids = count(1)
+_listener = None
+_queue_handler = None
+_lock = threading.Lock()
 
 
 def get_logger(module_name: str):
+    configure_logging()
     return l.getLogger(module_name)
+
+
+def configure_logging(path=LOG_FILE, level=LOG_LEVEL):
+    """
+    sets up the queue the loggers write to. The thread that writes the queue to the log file is started when the first
+    record is queued. Only the first call does anything.
+    :param path: the log file
+    :param level: the lowest level that is logged
+    :return: n/a
+    """
+    global _queue_handler
+    if _queue_handler is not None:
+        return
+    with _lock:
+        if _queue_handler is not None:
+            return
+        handler = _DeferredQueueHandler(queue.SimpleQueue(), path)
+        # the query id is read on the thread that logs, before the record is queued
+        handler.addFilter(_tag_query)
+        # the json lines never include the process or the caller, so don't look them up for every record. There is a
+        # public switch for the process, but not for the caller: the logging HOWTO ("Optimization") documents setting
+        # the private logging._srcfile to None as the way to skip the stack walk that finds the file, line and
+        # function. It applies to every logger in the process, which is what we want here.
+        l.logProcesses = False
+        l.logMultiprocessing = False
+        l._srcfile = None
+        root = l.getLogger()
+        root.setLevel(level)
+        root.addHandler(handler)
+        _queue_handler = handler
+
+
+def shutdown_logging():
+    """
+    writes out whatever is still queued and stops the thread that writes the log file
+    :return: n/a
+    """
+    global _listener, _queue_handler
+    with _lock:
+        listener, _listener = _listener, None
+        if _queue_handler is not None:
+            l.getLogger().removeHandler(_queue_handler)
+            _queue_handler = None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+@contextmanager
+def query_context(query_id=None):
+    """
+    context manager that tags every record logged inside it (on this thread) with the id of a query. Inside another
+    query's context the outer id is kept, so a search made while answering an http request is logged as part of it.
+    :param query_id: the id to use, a new one (unique within the process) if None
+    :return: context manager that gives the query id
+    """
+    outer = _query_id.get()
+    if outer is not None:
+        yield outer
+        return
+    query_id = query_id or f'{os.getpid():x}-{next(_query_ids):x}'
+    token = _query_id.set(query_id)
+    try:
+        yield query_id
+    finally:
+        _query_id.reset(token)
+
+
+def current_query_id():
+    """
+    the id of the query that is being answered on this thread
+    :return: the id, None outside of a query_context()
+    """
+    return _query_id.get()
+
+
+class _DeferredQueueHandler(QueueHandler):
+    def __init__(self, records, path):
+        super().__init__(records)
+        self.path = path
+
+    def enqueue(self, record):
+        if _listener is None:
+            _start_listener(self.queue, self.path)
+        super().enqueue(record)
+
+
+def _start_listener(records, path):
+    # creates the log file's directory and starts the thread that writes the queue to it
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8',
+                                           delay=True)
+        file_handler.setFormatter(JsonFormatter())
+        _listener = QueueListener(records, file_handler)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+class JsonFormatter(l.Formatter):
+    def format(self, record):
+        """
+        formats a record as a single line json object
+        :param record: the LogRecord
+        :return: the json text
+        """
+        entry = {'time': time.strftime(DATE_FORMAT, time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+                 'level': record.levelname, 'logger': record.name, 'thread': record.threadName,
+                 'message': record.getMessage()}
+        for name, value in record.__dict__.items():
+            if name not in _RECORD_ATTRIBUTES and value is not None:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _tag_query(record):
+    record.query_id = _query_id.get()
+    return True
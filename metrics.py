@@ -0,0 +1,363 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+import logging
+import threading
+import time
+from logging_config import get_logger
+
+"""
+This module is the instrumentation layer for the application. The hot paths (download, parse, index build, filter,
+render) are wrapped in spans that record how long each call took into a histogram per stage, and the layers count
+what they do (rows scanned and matched per search, cache hits and misses, bytes downloaded). Everything goes into one
+registry, which can be read as a structured snapshot or as Prometheus text, so the numbers are available from a
+running process without attaching a debugger. A single call can also be run under cProfile.
+
+Recording a value is a dict lookup and a few additions under a lock, cheap enough to leave on all the time.
+
+Classes:
+--------
+    Histogram:
+        counts observations into fixed buckets and keeps their count, sum and max
+    MetricsRegistry:
+        holds the counters, gauges and histograms, and renders them as a snapshot or as Prometheus text
+
+Methods:
+--------
+    span(stage, **labels):
+        context manager that records how long the block took into the stage's histogram
+    timed(stage):
+        decorator that records how long each call of the function took, like span()
+    increment(name, value=1, **labels):
+        adds to a counter in the default registry
+    set_gauge(name, value, **labels):
+        sets a gauge in the default registry
+    observe(name, value, buckets=DURATION_BUCKETS, **labels):
+        records a value into a histogram in the default registry
+    snapshot():
+        returns everything in the default registry as plain data
+    prometheus_text():
+        returns everything in the default registry in the Prometheus text exposition format
+    profile_call(function, *args, sort='cumulative', limit=PROFILE_LIMIT, **kwargs):
+        runs a single call under cProfile
+
+Constants:
+----------
+    REGISTRY: the default registry that the application records into
+    STAGE_METRIC: the name of the histogram that spans record into
+    DURATION_BUCKETS: the default histogram buckets, in seconds
+    ROW_BUCKETS: histogram buckets for numbers of rows
+    PROFILE_LIMIT: how many functions profile_call lists
+"""
+
+STAGE_METRIC = 'stage_duration_seconds'
+DURATION_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                    10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+PROFILE_LIMIT = 30
+logger = get_logger(__name__)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        # one count per bucket, plus one for values above the last bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """
+        records a value
+        :param value: the value, e.g. a duration in seconds
+        :return: n/a
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction):
+        """
+        estimates a quantile from the buckets, as the upper bound of the bucket it falls in
+        :param fraction: e.g. 0.99 for p99
+        :return: the estimate (the max for the overflow bucket), or None if nothing has been recorded
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else None,
+                'max': self.max, 'p50': self.quantile(0.5), 'p99': self.quantile(0.99), 'buckets': buckets}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        """
+        adds to a counter
+        :param name: name of the counter, e.g. 'query_rows_scanned_total'
+        :param value: how much to add
+        :param labels: labels that tell this series apart from the others with the same name
+        :return: n/a
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """
+        sets a gauge to a value
+        :param name: name of the gauge, e.g. 'result_cache_entries'
+        :param value: the current value
+        :param labels: labels that tell this series apart from the others with the same name
+        :return: n/a
+        """
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        """
+        records a value into a histogram
+        :param name: name of the histogram
+        :param value: the value
+        :param buckets: the bucket bounds, only used when the histogram is first created
+        :param labels: labels that tell this series apart from the others with the same name
+        :return: n/a
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """
+        records how long the block took into the stage's histogram (and counts it as an error if it raised)
+        :param stage: name of the stage, e.g. 'parse'
+        :param labels: any other labels for the stage
+        :return: context manager
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.increment('stage_errors_total', stage=stage, **labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(STAGE_METRIC, elapsed, stage=stage, **labels)
+            # every search goes through here, the record isn't even built unless debug logging is on
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f'{stage} finished', extra={'stage': stage, 'duration_ms': round(elapsed * 1000, 3),
+                                                         **labels})
+
+    def counter(self, name, **labels):
+        """
+        returns the value of a counter
+        :param name: name of the counter
+        :param labels: labels of the series
+        :return: the value, 0 if it has never been incremented
+        """
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def reset(self):
+        """
+        forgets everything that has been recorded
+        :return: n/a
+        """
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """
+        returns everything in the registry as plain data, with the hit ratio of each cache worked out
+        :return: dict of 'counters', 'gauges' and 'histograms' (each a dict of name to a list of series, each series a
+                 dict with its labels) and 'ratios'
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: histogram.as_dict() for key, histogram in self._histograms.items()}
+        result = {'counters': _series(counters, 'value'), 'gauges': _series(gauges, 'value'), 'histograms': {},
+                  'ratios': {}}
+        for (name, labels), values in histograms.items():
+            result['histograms'].setdefault(name, []).append(dict(values, labels=dict(labels)))
+        for (name, labels), value in counters.items():
+            if not name.endswith('_hits_total'):
+                continue
+            misses = counters.get((name[:-len('_hits_total')] + '_misses_total', labels), 0)
+            if value + misses:
+                result['ratios'][name[:-len('_total')].replace('_hits', '_hit_ratio')] = value / (value + misses)
+        return result
+
+    def prometheus_text(self):
+        """
+        returns everything in the registry in the Prometheus text exposition format
+        :return: str
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((key, histogram.as_dict()) for key, histogram in self._histograms.items())
+        for kind, series in (('counter', counters), ('gauge', gauges)):
+            last = None
+            for (name, labels), value in series:
+                if name != last:
+                    lines.append(f'# TYPE {name} {kind}')
+                    last = name
+                lines.append(f'{name}{_labels(labels)} {value}')
+        last = None
+        for (name, labels), values in histograms:
+            if name != last:
+                lines.append(f'# TYPE {name} histogram')
+                last = name
+            for bound, count in values['buckets'].items():
+                lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {count}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {values["count"]}')
+            lines.append(f'{name}_sum{_labels(labels)} {values["sum"]}')
+            lines.append(f'{name}_count{_labels(labels)} {values["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def span(stage, **labels):
+    """
+    context manager that records how long the block took into the stage's histogram in the default registry
+    :param stage: name of the stage, e.g. 'parse'
+    :param labels: any other labels for the stage
+    :return: context manager
+    """
+    return REGISTRY.span(stage, **labels)
+
+
+def timed(stage):
+    """
+    decorator that records how long each call of the function took into the stage's histogram, like span()
+    :param stage: name of the stage
+    :return: the decorator
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with REGISTRY.span(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(name, value=1, **labels):
+    """
+    adds to a counter in the default registry
+    :param name: name of the counter
+    :param value: how much to add
+    :param labels: labels of the series
+    :return: n/a
+    """
+    REGISTRY.increment(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    """
+    sets a gauge in the default registry
+    :param name: name of the gauge
+    :param value: the current value
+    :param labels: labels of the series
+    :return: n/a
+    """
+    REGISTRY.set_gauge(name, value, **labels)
+
+
+def observe(name, value, buckets=DURATION_BUCKETS, **labels):
+    """
+    records a value into a histogram in the default registry
+    :param name: name of the histogram
+    :param value: the value
+    :param buckets: the bucket bounds, only used when the histogram is first created
+    :param labels: labels of the series
+    :return: n/a
+    """
+    REGISTRY.observe(name, value, buckets, **labels)
+
+
+def snapshot():
+    """
+    returns everything in the default registry as plain data (see MetricsRegistry.snapshot)
+    :return: dict
+    """
+    return REGISTRY.snapshot()
+
+
+def prometheus_text():
+    """
+    returns everything in the default registry in the Prometheus text exposition format
+    :return: str
+    """
+    return REGISTRY.prometheus_text()
+
+
+def profile_call(function, *args, sort='cumulative', limit=PROFILE_LIMIT, **kwargs):
+    """
+    runs a single call under cProfile, e.g. to see where a slow search spends its time
+    :param function: the function to call
+    :param args: its positional arguments
+    :param sort: the pstats sort key for the report
+    :param limit: how many functions to list
+    :param kwargs: its keyword arguments
+    :return: (what the function returned, the profile report as text)
+    """
+    # only imported when something is profiled, pstats is slow to import
+    import cProfile
+    import io
+    import pstats
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args, **kwargs)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).strip_dirs().sort_stats(sort).print_stats(limit)
+    return result, report.getvalue()
+
+
+def _series(values, field):
+    result = {}
+    for (name, labels), value in values.items():
+        result.setdefault(name, []).append({'labels': dict(labels), field: value})
+    return result
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -1 +1,2 @@
 from .airport import *
+from .airport_table import *
@@ -7,8 +7,22 @@ Methods:
         checks this current airport object for matches to the provided param_dict.
     convert_dst_value(self, value):
         converts the dst value from the gui (full words) to the single-letter values from the data
+
+Constants:
+----------
+    DST_CODES: maps the dst values from the gui (full words) to the single-letter values from the data
+    NULL_MARKER: the value the data uses for a missing field
+    FIELD_NAMES: the names of the fields of an airport, in the same order as the Airport constructor
+    FIELD_TYPES: the type of each field in FIELD_NAMES ('int', 'float' or 'str')
 """
 
+DST_CODES = {'European': 'E', 'US/Canada': 'A', 'S. America': 'S', 'Australia': 'O', 'New Zealand': 'Z', 'None': 'N',
+             'Unknown': 'U'}
+NULL_MARKER = '\\N'
+FIELD_NAMES = ('airport_id', 'airport_name', 'city_name', 'country_name', 'iata_code', 'icao_code', 'latitude',
+               'longitude', 'elevation', 'utc_offset', 'dst_area')
+FIELD_TYPES = ('int', 'str', 'str', 'str', 'str', 'str', 'float', 'float', 'int', 'float', 'str')
+
 
 class Airport:
     def __init__(self, airport_id, airport_name, city_name, country_name, iata_code, icao_code, latitude, longitude,
@@ -62,7 +76,7 @@ class Airport:
             elif param_dict['country_name'].upper() == 'ALL':
                 number_of_matches += 1
         if 'utc_offset' in param_dict.keys():
-            if self._utc_offset != "\\N":
+            if self._utc_offset is not None and self._utc_offset != "\\N":
                 if float(param_dict['utc_offset']) == float(self._utc_offset):
                     number_of_matches += 1
         if 'latitude' in param_dict.keys() and 'longitude' in param_dict.keys():
@@ -74,7 +88,7 @@ class Airport:
                 number_of_matches += 2
         if 'elevation' in param_dict.keys():
             # I had no idea what to do with elevation???
-            if int(param_dict['elevation']) <= int(self._elevation):
+            if self._elevation is not None and int(param_dict['elevation']) <= int(self._elevation):
                 number_of_matches += 1
         if "dst_area" in param_dict.keys():
             value = self.convert_dst_value(param_dict['dst_area'])
@@ -91,17 +105,4 @@ class Airport:
         :param value: dst value from the dropdown in the gui
         :return: the single-letter equivalent for the provided dst value.
         """
-        if value == 'European':
-            return 'E'
-        elif value == 'US/Canada':
-            return 'A'
-        elif value == 'S. America':
-            return 'S'
-        elif value == 'Australia':
-            return 'O'
-        elif value == 'New Zealand':
-            return 'Z'
-        elif value == 'None':
-            return 'N'
-        elif value == 'Unknown':
-            return 'U'
+        return DST_CODES.get(value)
@@ -0,0 +1,369 @@
+from array import array
+import math
+import sys
+from .airport import DST_CODES, FIELD_NAMES, NULL_MARKER
+
+"""
+This module contains a compact, column oriented store for airport data. Each field is kept in its own column instead of
+in an object per airport: the numeric fields in typed arrays, country and dst dictionary-encoded, and the rest of the
+text fields as interned strings. AirportRow is a light view onto one row of the table so that it can be displayed and
+searched the same way as an Airport.
+
+Classes:
+--------
+    AirportTable:
+        a column oriented store of airport data
+    AirportRow:
+        a view onto a single row of an AirportTable
+
+Constants:
+----------
+    NULL_ELEVATION: the value stored in the elevation column when the data has no elevation
+    NUMERIC_COLUMNS: the typed array columns of an AirportTable and their typecodes
+    TEXT_COLUMNS: the text columns of an AirportTable (including the values of the dictionary-encoded columns)
+"""
+
+NULL_ELEVATION = -2 ** 31
+NUMERIC_COLUMNS = {'airport_ids': 'q', 'latitudes': 'd', 'longitudes': 'd', 'elevations': 'i', 'utc_offsets': 'd',
+                   'country_codes': 'H', 'dst_codes': 'B'}
+TEXT_COLUMNS = ('airport_names', 'city_names', 'iata_codes', 'icao_codes', 'country_values', 'dst_values')
+
+
+class AirportTable:
+    def __init__(self):
+        self.airport_ids = array('q')
+        self.airport_names = []
+        self.city_names = []
+        self.iata_codes = []
+        self.icao_codes = []
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.elevations = array('i')
+        self.utc_offsets = array('d')
+        # dictionary-encoded columns, the codes index into the values list
+        self.country_codes = array('H')
+        self.country_values = []
+        self.dst_codes = array('B')
+        self.dst_values = []
+        self._country_lookup = {}
+        self._dst_lookup = {}
+        self._upper_columns = {}
+
+    def __len__(self):
+        return len(self.airport_ids)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('row index out of range')
+        return AirportRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield AirportRow(self, index)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        builds a table from rows of typed fields
+        :param rows: iterable of 11-item tuples in the same order as the Airport constructor
+        :return: a new AirportTable
+        """
+        table = cls()
+        table.extend(rows)
+        return table
+
+    @classmethod
+    def from_columns(cls, columns, upper_columns=None):
+        """
+        builds a table straight from its columns, e.g. from a snapshot. The numeric columns can be any sequence with
+        the right typecode (memoryviews of a mapped file are used as they are, and only copied if the table changes).
+        :param columns: dict with every name in NUMERIC_COLUMNS and TEXT_COLUMNS
+        :param upper_columns: optional dict of column name to its uppercased copy (see upper_column)
+        :return: a new AirportTable
+        """
+        table = cls()
+        for name in NUMERIC_COLUMNS:
+            setattr(table, name, columns[name])
+        for name in TEXT_COLUMNS:
+            setattr(table, name, list(columns[name]))
+        table._country_lookup = {value: code for code, value in enumerate(table.country_values)}
+        table._dst_lookup = {value: code for code, value in enumerate(table.dst_values)}
+        table._upper_columns.update(upper_columns or {})
+        return table
+
+    def extend(self, rows):
+        """
+        adds rows of typed fields to the end of the table
+        :param rows: iterable of 11-item tuples in the same order as the Airport constructor
+        :return: n/a
+        """
+        for row in rows:
+            self.append(row)
+
+    def append(self, row):
+        """
+        adds a row of typed fields to the end of the table
+        :param row: 11-item tuple in the same order as the Airport constructor (None where a number is missing)
+        :return: the index of the new row
+        """
+        airport_id, airport_name, city_name, country_name, iata_code, icao_code, latitude, longitude, elevation, \
+            utc_offset, dst_area = row
+        if not isinstance(self.airport_ids, array):
+            self._copy_columns()
+        self.airport_ids.append(int(airport_id))
+        self.airport_names.append(airport_name)
+        self.city_names.append(sys.intern(city_name))
+        self.iata_codes.append(sys.intern(iata_code))
+        self.icao_codes.append(sys.intern(icao_code))
+        self.latitudes.append(math.nan if latitude is None else latitude)
+        self.longitudes.append(math.nan if longitude is None else longitude)
+        self.elevations.append(NULL_ELEVATION if elevation is None else elevation)
+        self.utc_offsets.append(math.nan if utc_offset is None else utc_offset)
+        self.country_codes.append(self._encode(country_name, self.country_values, self._country_lookup))
+        self.dst_codes.append(self._encode(dst_area, self.dst_values, self._dst_lookup))
+        return len(self.airport_ids) - 1
+
+    def copy(self):
+        """
+        returns a copy of the table that can be changed without affecting this one (e.g. by an incremental refresh
+        while searches are still running against this one)
+        :return: a new AirportTable
+        """
+        table = AirportTable()
+        for name, typecode in NUMERIC_COLUMNS.items():
+            setattr(table, name, array(typecode, getattr(self, name)))
+        for name in TEXT_COLUMNS:
+            setattr(table, name, list(getattr(self, name)))
+        table._country_lookup = dict(self._country_lookup)
+        table._dst_lookup = dict(self._dst_lookup)
+        table._upper_columns = {name: list(self.upper_column(name)) for name in self._upper_columns}
+        return table
+
+    def replace(self, index, row):
+        """
+        overwrites a row with new typed fields
+        :param index: index of the row
+        :param row: 11-item tuple in the same order as the Airport constructor (None where a number is missing)
+        :return: n/a
+        """
+        airport_id, airport_name, city_name, country_name, iata_code, icao_code, latitude, longitude, elevation, \
+            utc_offset, dst_area = row
+        if not isinstance(self.airport_ids, array):
+            self._copy_columns()
+        upper_columns = {name: self.upper_column(name) for name in self._upper_columns}
+        self.airport_ids[index] = int(airport_id)
+        self.airport_names[index] = airport_name
+        self.city_names[index] = sys.intern(city_name)
+        self.iata_codes[index] = sys.intern(iata_code)
+        self.icao_codes[index] = sys.intern(icao_code)
+        self.latitudes[index] = math.nan if latitude is None else latitude
+        self.longitudes[index] = math.nan if longitude is None else longitude
+        self.elevations[index] = NULL_ELEVATION if elevation is None else elevation
+        self.utc_offsets[index] = math.nan if utc_offset is None else utc_offset
+        self.country_codes[index] = self._encode(country_name, self.country_values, self._country_lookup)
+        self.dst_codes[index] = self._encode(dst_area, self.dst_values, self._dst_lookup)
+        for name, column in upper_columns.items():
+            column[index] = getattr(self, name)[index].upper()
+
+    def remove(self, index):
+        """
+        removes a row by moving the last row into its place, so no other row changes index
+        :param index: index of the row
+        :return: the index the moved row used to have, or None if the removed row was the last one
+        """
+        last = len(self) - 1
+        if last != index:
+            self.replace(index, self.record(last))
+        if not isinstance(self.airport_ids, array):
+            self._copy_columns()
+        upper_columns = [self.upper_column(name) for name in self._upper_columns]
+        for name in NUMERIC_COLUMNS:
+            getattr(self, name).pop()
+        for name in ('airport_names', 'city_names', 'iata_codes', 'icao_codes'):
+            getattr(self, name).pop()
+        for column in upper_columns:
+            column.pop()
+        return None if last == index else last
+
+    def upper_column(self, column_name):
+        """
+        returns an uppercased copy of one of the text columns, built the first time it is asked for and kept as the
+        table grows (only rows added since the last call are uppercased)
+        :param column_name: name of the column, e.g. 'airport_names'
+        :return: list of uppercased strings
+        """
+        source = getattr(self, column_name)
+        column = self._upper_columns.get(column_name)
+        if column is None:
+            column = [value.upper() for value in source]
+            self._upper_columns[column_name] = column
+        elif len(column) < len(source):
+            column.extend(value.upper() for value in source[len(column):])
+        return column
+
+    def _copy_columns(self):
+        # the columns are read-only views (e.g. of a snapshot), they have to be copied before they can grow
+        for name, typecode in NUMERIC_COLUMNS.items():
+            setattr(self, name, array(typecode, getattr(self, name)))
+
+    @staticmethod
+    def _encode(value, values, lookup):
+        code = lookup.get(value)
+        if code is None:
+            code = len(values)
+            values.append(value)
+            lookup[value] = code
+        return code
+
+    def record(self, index):
+        """
+        returns a row of the table as typed fields
+        :param index: index of the row
+        :return: 11-item tuple in the same order as the Airport constructor (None where a number is missing)
+        """
+        latitude = self.latitudes[index]
+        longitude = self.longitudes[index]
+        elevation = self.elevations[index]
+        utc_offset = self.utc_offsets[index]
+        return (self.airport_ids[index], self.airport_names[index], self.city_names[index],
+                self.country_values[self.country_codes[index]], self.iata_codes[index], self.icao_codes[index],
+                None if math.isnan(latitude) else latitude, None if math.isnan(longitude) else longitude,
+                None if elevation == NULL_ELEVATION else elevation, None if math.isnan(utc_offset) else utc_offset,
+                self.dst_values[self.dst_codes[index]])
+
+
+class AirportRow:
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __str__(self):
+        # same summary as an Airport
+        table = self._table
+        index = self._index
+        code = table.iata_codes[index]
+        if code == NULL_MARKER:
+            code = table.icao_codes[index]
+        return f"{table.airport_names[index]} ({code}), {table.country_values[table.country_codes[index]]}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __eq__(self, other):
+        return isinstance(other, AirportRow) and self._table is other._table and self._index == other._index
+
+    def __hash__(self):
+        return hash((id(self._table), self._index))
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def airport_id(self):
+        return self._table.airport_ids[self._index]
+
+    @property
+    def airport_name(self):
+        return self._table.airport_names[self._index]
+
+    @property
+    def city_name(self):
+        return self._table.city_names[self._index]
+
+    @property
+    def country_name(self):
+        return self._table.country_values[self._table.country_codes[self._index]]
+
+    @property
+    def iata_code(self):
+        return self._table.iata_codes[self._index]
+
+    @property
+    def icao_code(self):
+        return self._table.icao_codes[self._index]
+
+    @property
+    def latitude(self):
+        return self._table.latitudes[self._index]
+
+    @property
+    def longitude(self):
+        return self._table.longitudes[self._index]
+
+    @property
+    def elevation(self):
+        elevation = self._table.elevations[self._index]
+        return None if elevation == NULL_ELEVATION else elevation
+
+    @property
+    def utc_offset(self):
+        utc_offset = self._table.utc_offsets[self._index]
+        return None if math.isnan(utc_offset) else utc_offset
+
+    @property
+    def dst_area(self):
+        return self._table.dst_values[self._table.dst_codes[self._index]]
+
+    def record(self):
+        """
+        returns this row as typed fields
+        :return: 11-item tuple in the same order as the Airport constructor
+        """
+        return self._table.record(self._index)
+
+    def as_dict(self):
+        """
+        returns this row as a dict of typed fields, keyed by field name
+        :return: dict with the keys in FIELD_NAMES
+        """
+        return dict(zip(FIELD_NAMES, self._table.record(self._index)))
+
+    def check_for_match(self, param_dict):
+        """
+        checks this row for matches to the provided param_dict, the same way Airport.check_for_match does, but against
+        the typed columns so nothing has to be parsed from a string.
+        :param param_dict: a dictionary of search parameters from the GUI
+        :return: returns True if all submitted fields are a match, false if not
+        """
+        table = self._table
+        index = self._index
+        if 'airport_name' in param_dict:
+            if param_dict['airport_name'].upper() not in table.airport_names[index].upper():
+                return False
+        if 'city_name' in param_dict:
+            if param_dict['city_name'].upper() not in table.city_names[index].upper():
+                return False
+        if 'iata_code' in param_dict:
+            if param_dict['iata_code'].upper() != table.iata_codes[index].upper():
+                return False
+        if 'icao_code' in param_dict:
+            if param_dict['icao_code'].upper() != table.icao_codes[index].upper():
+                return False
+        if 'country_name' in param_dict:
+            country = param_dict['country_name'].upper()
+            if country != 'ALL' and country != self.country_name.upper().strip('"'):
+                return False
+        if 'utc_offset' in param_dict:
+            # nan never compares equal, so rows without an offset never match
+            if float(param_dict['utc_offset']) != table.utc_offsets[index]:
+                return False
+        if 'latitude' in param_dict or 'longitude' in param_dict:
+            if 'latitude' not in param_dict or 'longitude' not in param_dict:
+                return False
+            if round(float(param_dict['latitude']), 2) != round(table.latitudes[index], 2):
+                return False
+            if round(float(param_dict['longitude']), 2) != round(table.longitudes[index], 2):
+                return False
+        if 'elevation' in param_dict:
+            elevation = table.elevations[index]
+            if elevation == NULL_ELEVATION or int(param_dict['elevation']) > elevation:
+                return False
+        if 'dst_area' in param_dict:
+            if DST_CODES.get(param_dict['dst_area']) != self.dst_area:
+                return False
+        return True
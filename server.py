@@ -0,0 +1,7 @@
+import sys
+from api import serve, DEFAULT_PORT
+from business import AirportSearchService
+
+
+if __name__ == "__main__":
+    serve(AirportSearchService(), port=int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT)
@@ -0,0 +1,27 @@
+import pytest
+from benchmarks.fixtures import synthetic_airports_dat
+from business import AirportDataset, parse_airport_data
+from models import AirportTable
+
+"""
+Fixtures shared by the tests: the rows of the synthetic airports.dat the benchmarks use (so the tests run offline), and
+datasets built from them.
+"""
+
+ROW_COUNT = 2000
+
+
+@pytest.fixture(scope='session')
+def airport_rows():
+    return parse_airport_data(synthetic_airports_dat(ROW_COUNT))
+
+
+@pytest.fixture
+def dataset(airport_rows):
+    dataset = build_dataset(airport_rows)
+    yield dataset
+    dataset.close()
+
+
+def build_dataset(rows, parallel=False):
+    return AirportDataset(AirportTable.from_rows(rows), parallel=parallel)
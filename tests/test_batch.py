@@ -0,0 +1,26 @@
+from business import run_batch, read_queries
+
+"""
+Tests of batch searches read from a query file.
+"""
+
+
+def test_bad_line_doesnt_end_the_batch(dataset, tmp_path):
+    codes = [code for code in dataset.table.iata_codes if len(code) == 3][:2]
+    path = tmp_path / 'queries.jsonl'
+    path.write_text(f'{{"iata_code": "{codes[0]}"}}\n{{bad json\n["x"]\n\n{{"iata_code": "{codes[1]}"}}\n',
+                    encoding='utf-8')
+    results = list(run_batch(dataset, read_queries(str(path))))
+    assert len(results) == 4
+    (first, found, error), (bad, none, message), (not_object, _, reason), (last, found_last, last_error) = results
+    assert first == {'iata_code': codes[0]} and found and error is None
+    assert bad is None and none == () and 'line 2' in message
+    assert not_object is None and 'line 3' in reason and 'not an object' in reason
+    assert last == {'iata_code': codes[1]} and found_last and last_error is None
+    assert all(dataset.table.iata_codes[row] == codes[1] for _, row in found_last)
+
+
+def test_invalid_search_is_reported_in_place(dataset):
+    results = list(run_batch(dataset, [{}, {'city_name': 'Zürich'}]))
+    assert results[0][2] == 'You must use at least 1 parameter'
+    assert results[1][2] is None and results[1][1]
@@ -0,0 +1,85 @@
+import random
+import pytest
+from business import fuzzy, fold, substring_distance, FuzzyIndex, MAX_CANDIDATES
+
+"""
+Tests of the fuzzy search: Myers' bit-parallel distance against the textbook dynamic programme (including needles longer
+than 64 characters, which take more than one machine word), how matches are ranked, and the cap on how many candidates
+a search scores.
+"""
+
+
+def naive_distance(needle, text):
+    # the fewest edits that turn the needle into some part of the text: row 0 is all zeros, a match may start anywhere
+    previous = [0] * (len(text) + 1)
+    for row, character in enumerate(needle, 1):
+        current = [row]
+        for column, other in enumerate(text, 1):
+            current.append(min(previous[column - 1] + (character != other), previous[column] + 1,
+                               current[column - 1] + 1))
+        previous = current
+    return min(previous)
+
+
+@pytest.mark.parametrize('needle, text', [
+    ('DUSSELDORF', fold('Düsseldorf International Airport')),
+    ('DUSELDORF', fold('Düsseldorf International Airport')),
+    ('FRANKFRT', fold('Frankfurt am Main')),
+    ('RFANKFURT', fold('Frankfurt am Main')),
+    ('SAO PAOLO', fold('São Paulo–Guarulhos')),
+    ('REYKJAVIK', fold('Reykjavík')),
+    ('ZURICH', fold('Zürich')),
+    ('MOUNTHAGEN', fold('Mount Hagen Kagamuga')),
+    ('PORT MORESBY JACKSONS INTERNATIONAL AIRPORT AND SEAPLANE BASE AT THE BAY', fold('Port Moresby Jacksons')),
+    ('', 'ANYTHING'),
+    ('ABC', ''),
+])
+def test_distance_of_names(needle, text):
+    assert substring_distance(needle, text) == naive_distance(needle, text)
+
+
+@pytest.mark.parametrize('needle_length', [1, 5, 20, 63, 64, 65, 100, 150])
+def test_distance_of_random_text(needle_length):
+    rand = random.Random(needle_length)
+    for _ in range(30):
+        needle = ''.join(rand.choice('ABCD ') for _ in range(needle_length))
+        text = ''.join(rand.choice('ABCD ') for _ in range(rand.randint(0, 2 * needle_length + 10)))
+        assert substring_distance(needle, text) == naive_distance(needle, text), (needle, text)
+        # the needle with a few typos, somewhere inside the text
+        typo = list(needle)
+        for _ in range(rand.randint(0, 3)):
+            typo[rand.randrange(len(typo))] = rand.choice('ABCDE')
+        text = text[:len(text) // 2] + ''.join(typo) + text[len(text) // 2:]
+        assert substring_distance(needle, text) == naive_distance(needle, text), (needle, text)
+
+
+def test_exact_match_beats_a_typo():
+    index = FuzzyIndex(['Frankfort Municipal', 'Frankfurt am Main', 'Hahn Frankfurt', 'Frankfirt Field', 'Madang'])
+    # fewest edits first, then where the text starts the name, then the shorter name
+    assert index.search('frankfurt') == [(0, 1), (0, 2), (1, 3), (1, 0)]
+    # accents don't count as edits
+    index = FuzzyIndex(['Dusseldorp Field', 'Düsseldorf', 'Düsseldorf Mönchengladbach'])
+    assert index.search('dusseldorf') == [(0, 1), (0, 2), (1, 0)]
+
+
+def test_search_by_first_letters():
+    index = FuzzyIndex(['Goroka', 'Madang', 'Mount Hagen', 'Nadzab'])
+    assert index.search('m') == [(0, 1), (0, 2)]
+    assert index.search('h') == [(0, 2)]
+    assert index.search('x') == []
+
+
+def test_candidates_are_capped(monkeypatch):
+    # far more rows share some of the trigrams than are scored, the one sharing all of them has to be kept
+    column = [f'Abcdef {number:04d}' for number in range(2 * MAX_CANDIDATES)] + ['Abcdefgh']
+    index = FuzzyIndex(column)
+    measured = []
+
+    def counted_distance(needle, text):
+        measured.append(text)
+        return substring_distance(needle, text)
+
+    monkeypatch.setattr(fuzzy, 'substring_distance', counted_distance)
+    assert index.search('abcdefgh', limit=1) == [(0, len(column) - 1)]
+    # the exact match is found without measuring it
+    assert len(measured) == MAX_CANDIDATES - 1
@@ -0,0 +1,68 @@
+import math
+import pytest
+from business import GeoGrid, EARTH_RADIUS_KM
+from models import AirportTable
+
+"""
+Tests of the GeoGrid near the date line and the poles, where the cells a circle overlaps wrap around in longitude or
+cover every longitude. Its answers are checked against measuring every airport, by the chord between the points.
+"""
+
+
+def point(index, lat, lon):
+    return (index, f'Airport {index}', 'City', 'Country', '\\N', '\\N', lat, lon, 0, 0.0, 'U')
+
+
+@pytest.fixture(scope='module')
+def grid():
+    coordinates = []
+    # across the date line, including both ends of the longitude range
+    for lat in range(-6, 7, 2):
+        for lon in (175, 177, 178.5, 179.5, 179.99, 180, -180, -179.99, -179.5, -178.5, -177, -175):
+            coordinates.append((lat * 0.5, lon))
+    # around both poles, at every longitude
+    for lat in (84, 86, 88, 89, 89.9, 90):
+        for lon in range(-180, 180, 30):
+            coordinates.append((lat, lon))
+            coordinates.append((-lat, lon + 15))
+    # and some that are nowhere near
+    coordinates += [(0, 0), (45, 90), (-45, -90)]
+    table = AirportTable.from_rows(point(index, lat, lon) for index, (lat, lon) in enumerate(coordinates))
+    return GeoGrid(table)
+
+
+def chord_km(lat1, lon1, lat2, lon2):
+    # distance along the surface from the straight line between the points
+    def unit(lat, lon):
+        lat, lon = math.radians(lat), math.radians(lon)
+        return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+    chord = math.dist(unit(lat1, lon1), unit(lat2, lon2))
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def measured(grid, lat, lon):
+    table = grid.table
+    return sorted((chord_km(lat, lon, table.latitudes[index], table.longitudes[index]), index)
+                  for index in range(len(table)))
+
+
+CENTERS = [(0, 179.9), (0, -179.9), (1, 180), (-1, -180), (89.95, 0), (90, 0), (89.5, 100), (-89.95, 45), (-90, 0),
+           (-88.5, -170)]
+
+
+@pytest.mark.parametrize('lat, lon', CENTERS)
+@pytest.mark.parametrize('radius_km', [50, 200, 500, 1500])
+def test_within(grid, lat, lon, radius_km):
+    expected = [(distance, index) for distance, index in measured(grid, lat, lon) if distance <= radius_km]
+    found = grid.within(lat, lon, radius_km)
+    # rows the same distance away may come in either order
+    assert {index for _, index in found} == {index for _, index in expected}
+    assert [distance for distance, _ in found] == pytest.approx([distance for distance, _ in expected], abs=1e-6)
+
+
+@pytest.mark.parametrize('lat, lon', CENTERS)
+@pytest.mark.parametrize('count', [1, 5, 25])
+def test_nearest(grid, lat, lon, count):
+    expected = [distance for distance, _ in measured(grid, lat, lon)[:count]]
+    found = grid.nearest(lat, lon, count)
+    assert [distance for distance, _ in found] == pytest.approx(expected, abs=1e-6)
@@ -0,0 +1,142 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+from concurrent.futures import CancelledError
+import pytest
+import dal
+from exceptions import DalException
+
+"""
+Tests of the AsyncLoader against a stub http server on localhost, which fails in the ways the real download does:
+bad responses before a good one, a response that is too slow to arrive, a connection that is reset, and a request that
+never finishes. The loader is given short timeouts and backoffs so the tests run in a second or two.
+"""
+
+BODY = b'1,"Goroka Airport","Goroka","Papua New Guinea","GKA","AYGA",-6.08,145.39,5282,10,"U"\n'
+RETRIES = 2
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # the path says how the request should go: /<behaviour>/<failures>/airports.dat
+    def do_GET(self):
+        _, behaviour, failures, _ = self.path.split('/', 3)
+        with self.server.lock:
+            self.server.hits[behaviour] += 1
+            attempt = self.server.hits[behaviour]
+        if attempt <= int(failures):
+            if behaviour == 'unavailable':
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if behaviour == 'slow':
+                self.server.release.wait(1)
+            elif behaviour == 'reset':
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                self.connection.close()
+                return
+            elif behaviour == 'hang':
+                self.server.release.wait(10)
+                return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # the reset connections are meant to fail
+        pass
+
+
+@pytest.fixture
+def server():
+    stub = StubServer(('127.0.0.1', 0), StubHandler)
+    stub.hits = Counter()
+    stub.lock = threading.Lock()
+    stub.release = threading.Event()
+    thread = threading.Thread(target=stub.serve_forever, daemon=True)
+    thread.start()
+    yield stub
+    stub.release.set()
+    stub.shutdown()
+    stub.server_close()
+
+
+@pytest.fixture
+def loader(tmp_path):
+    loader = dal.AsyncLoader(dal.DatasetCache(str(tmp_path)), timeout=(1, 0.2), retries=RETRIES, backoff_base=0.01,
+                             backoff_cap=0.05)
+    yield loader
+    loader.close()
+
+
+def url(server, behaviour, failures):
+    return f'http://127.0.0.1:{server.server_address[1]}/{behaviour}/{failures}/airports.dat'
+
+
+def test_retries_bad_responses_then_caches_the_body(server, loader):
+    assert loader.fetch_sync(url(server, 'unavailable', RETRIES)) == BODY
+    assert server.hits['unavailable'] == RETRIES + 1
+    assert loader.cache.read(url(server, 'unavailable', RETRIES)) == BODY
+
+
+def test_gives_up_after_the_last_retry(server, loader):
+    with pytest.raises(DalException):
+        loader.fetch_sync(url(server, 'unavailable', RETRIES + 1))
+    assert server.hits['unavailable'] == RETRIES + 1
+
+
+def test_read_timeout_is_retried_and_then_fails_the_future(server, loader):
+    future = loader.submit([url(server, 'slow', RETRIES + 1)])
+    with pytest.raises(DalException):
+        future.result(timeout=5)
+    assert server.hits['slow'] == RETRIES + 1
+
+
+def test_reset_connection_is_retried(server, loader):
+    assert loader.fetch_sync(url(server, 'reset', 1)) == BODY
+    assert server.hits['reset'] == 2
+
+
+def test_cancel_stops_a_request_that_never_finishes(server, loader):
+    future = loader.submit([url(server, 'hang', 1)])
+    while not server.hits['hang']:
+        time.sleep(0.01)
+    assert future.cancel()
+    with pytest.raises(CancelledError):
+        future.result(timeout=1)
+
+
+def test_cancel_stops_the_retries(server, tmp_path, monkeypatch):
+    # without the jitter, which could pick a backoff short enough to retry before the cancel
+    monkeypatch.setattr(dal.loader, 'backoff_delay', lambda attempt, base, cap: min(cap, base * 2 ** attempt))
+    loader = dal.AsyncLoader(dal.DatasetCache(str(tmp_path)), timeout=(1, 1), retries=5, backoff_base=10,
+                             backoff_cap=10)
+    try:
+        future = loader.submit([url(server, 'unavailable', 6)])
+        while not server.hits['unavailable']:
+            time.sleep(0.01)
+        # waiting for up to 10s before the first retry
+        time.sleep(0.1)
+        assert future.cancel()
+        time.sleep(0.2)
+        assert server.hits['unavailable'] == 1
+    finally:
+        loader.close()
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    delays = [dal.backoff_delay(attempt, base=0.5, cap=2.0) for attempt in range(6) for _ in range(200)]
+    assert all(0 <= delay <= 2.0 for delay in delays)
+    assert all(0 <= dal.backoff_delay(0, base=0.5, cap=2.0) <= 0.5 for _ in range(200))
+    assert len(set(delays)) > 1
@@ -0,0 +1,54 @@
+import pytest
+from benchmarks.fixtures import AWKWARD_AIRPORTS, synthetic_airports_dat
+import business
+from business import parse_airport_data, parse_line, to_float, to_int
+
+"""
+Tests of the bulk parser against the line by line csv parser it replaced: the awkward rows (quoted numbers, a null marker
+inside a quoted field) that force the field by field fallback, and names with embedded commas and quotes on both paths.
+"""
+
+
+def expected_rows(data):
+    # what parse_line makes of each line, typed the same way
+    rows = []
+    for line in data.splitlines():
+        tokens = parse_line(line)
+        rows.append((to_int(tokens[0]), tokens[1], tokens[2], tokens[3], tokens[4], tokens[5], to_float(tokens[6]),
+                     to_float(tokens[7]), to_int(tokens[8]), to_float(tokens[9]), tokens[10]))
+    return rows
+
+
+def test_awkward_rows():
+    rows = parse_airport_data('\n'.join(AWKWARD_AIRPORTS) + '\n')
+    assert rows == [(1000001, 'Null Island,\\N Field', 'Null Island', 'Nowhere', 'NUL', 'NULL', 0.5, -0.5, 12, 0.0, 'U'),
+                    (1000002, 'Quoted Numbers Airport', 'Springfield', 'United States', '\\N', 'KQNA', 44.5, -123.25,
+                     210, -8.0, 'A')]
+    assert rows == expected_rows('\n'.join(AWKWARD_AIRPORTS).encode('utf-8'))
+    assert [type(value) for value in rows[1][6:10]] == [float, float, int, float]
+
+
+@pytest.mark.parametrize('awkward', [False, True], ids=['bulk', 'fallback'])
+def test_matches_parse_line(caplog, awkward):
+    data = synthetic_airports_dat(500, awkward=awkward)
+    rows = parse_airport_data(data)
+    assert rows == expected_rows(data)
+    assert ('Falling back' in caplog.text) == awkward
+    names = [row[1] for row in rows]
+    assert any('"Kiwi"' in name for name in names) and any(', North Field' in name for name in names)
+    assert any(row[9] is None for row in rows)
+
+
+def test_quoted_number_forces_the_fallback(caplog):
+    data = synthetic_airports_dat(50) + (AWKWARD_AIRPORTS[1] + '\n').encode('utf-8')
+    rows = parse_airport_data(data)
+    assert 'Falling back' in caplog.text
+    assert rows[-1][6:10] == (44.5, -123.25, 210, -8.0)
+    assert rows == expected_rows(data)
+
+
+def test_streamed_rows_match():
+    data = synthetic_airports_dat(300, awkward=True)
+    # chunks that split lines, quoted fields and multi-byte characters
+    chunks = [data[start:start + 997] for start in range(0, len(data), 997)]
+    assert [row for rows in business.iter_airport_rows(chunks) for row in rows] == parse_airport_data(data)
@@ -0,0 +1,128 @@
+import pytest
+import business
+from .conftest import build_dataset
+
+"""
+Tests of the incremental refresh: a dataset patched with the inserts, updates and deletes of a new feed answers every
+search the same as a dataset built from scratch from that feed, including after deleting the last row and deleting a
+row that an earlier delete moved another row into.
+"""
+
+
+def changed(row, index):
+    # the same airport with a new name, city, country, codes and position
+    return (row[0], f'Refreshed Field {index}', 'Refreshville', 'Iceland', f'R{index:02d}', f'RF{index:02d}',
+            64.0 + index / 100, -21.5 - index / 100, 100 + index, 0.0, 'N')
+
+
+def new_airports(rows, count):
+    first = max(row[0] for row in rows) + 1
+    return [(first + i, f'Brand New Airport {i}', 'Newtown', 'Fiji', f'N{i:02d}', f'NW{i:02d}', -17.75 + i / 10,
+             177.45 - i / 10, i * 10, 12.0, 'Z') for i in range(count)]
+
+
+def queries(*row_lists):
+    # searches that go through every index and the grid, for the rows that changed (before and after)
+    found = [{'airport_name': 'A'}, {'min_elevation': 1000, 'max_elevation': 1200}, {'country_name': 'ALL'}]
+    for rows in row_lists:
+        for row in rows:
+            found += [{'iata_code': row[4]}, {'icao_code': row[5]}, {'country_name': row[3]},
+                      {'airport_name': row[1][:9]}, {'city_name': row[2]}, {'dst_area': row[10]},
+                      {'latitude': row[6], 'longitude': row[7], 'radius_km': 500},
+                      {'latitude': row[6], 'longitude': row[7], 'nearest': 5}]
+    return found
+
+
+def answers(dataset, params):
+    # rows may be in another order after a refresh, so results are compared as the records they match
+    table = dataset.table
+    return sorted((distance is not None and round(distance, 6), table.record(index))
+                  for distance, index in dataset.search_ranked(params))
+
+
+def assert_same_as_rebuilt(patched, rows, checks):
+    rebuilt = build_dataset(rows)
+    assert sorted(map(patched.table.record, range(len(patched)))) == sorted(rows)
+    for params in checks:
+        assert answers(patched, params) == answers(rebuilt, params), params
+    assert [index for _, index in patched.fuzzy_search('Refreshed Feld', limit=3)] == \
+        [patched.index_of(rebuilt.table.airport_ids[index]) for _, index in rebuilt.fuzzy_search('Refreshed Feld',
+                                                                                                   limit=3)]
+
+
+def refreshed(dataset, rows, checks):
+    # warms up the lazily built indexes first, so they are patched too
+    for params in checks:
+        dataset.search_ranked(params)
+    diff = business.diff_rows(dataset.table, rows)
+    assert diff is not None
+    return business.apply_diff(dataset, diff)
+
+
+def test_diff_rows(dataset, airport_rows):
+    rows = list(airport_rows)
+    del rows[5]
+    rows[10] = changed(rows[10], 10)
+    rows += new_airports(airport_rows, 1)
+    diff = business.diff_rows(dataset.table, rows)
+    assert diff.deletes == [5]
+    assert diff.updates == [(11, rows[10])]
+    assert diff.inserts == new_airports(airport_rows, 1)
+
+
+@pytest.mark.parametrize('edit', ['add', 'remove', 'change', 'remove last', 'all'])
+def test_patched_dataset_searches_like_a_rebuilt_one(dataset, airport_rows, edit):
+    before = list(map(dataset.table.record, range(len(dataset))))
+    rows = list(airport_rows)
+    touched = []
+    if edit in ('add', 'all'):
+        rows += new_airports(airport_rows, 5)
+        touched += rows[-5:]
+    if edit in ('change', 'all'):
+        touched += [airport_rows[index] for index in (0, 17, 1500)]
+        for index in (0, 17, 1500):
+            rows[index] = changed(rows[index], index)
+        touched += [rows[index] for index in (0, 17, 1500)]
+    if edit in ('remove last', 'all'):
+        touched.append(rows.pop(len(airport_rows) - 1))
+    if edit in ('remove', 'all'):
+        for index in (1200, 300, 3):
+            touched.append(rows.pop(index))
+    checks = queries(touched)
+    patched = refreshed(dataset, rows, checks)
+    try:
+        assert_same_as_rebuilt(patched, rows, checks)
+    finally:
+        patched.close()
+    # the loaded dataset isn't changed
+    assert list(map(dataset.table.record, range(len(dataset)))) == before
+
+
+def test_removing_a_row_that_was_moved(dataset, airport_rows):
+    # deleting row 3 moves the last row into its place, the next refresh deletes and changes moved rows
+    rows = list(airport_rows)
+    removed = [rows.pop(3)]
+    checks = queries(removed, airport_rows[-3:])
+    first = refreshed(dataset, rows, checks)
+    assert first.table.record(3) == airport_rows[-1]
+    moved = rows.pop()
+    rows[-1] = changed(rows[-1], 1)
+    second = refreshed(first, rows, checks + queries([moved, rows[-1]]))
+    try:
+        assert_same_as_rebuilt(second, rows, checks + queries([moved, rows[-1]]))
+    finally:
+        first.close()
+        second.close()
+
+
+def test_refresh_dataset(dataset, airport_rows):
+    assert business.refresh_dataset(dataset, airport_rows) is dataset
+    # too many changes to be worth patching
+    assert business.refresh_dataset(dataset, airport_rows[:len(airport_rows) // 2]) is None
+    # the airports can't be matched up
+    assert business.refresh_dataset(dataset, airport_rows + airport_rows[:1]) is None
+    patched = business.refresh_dataset(dataset, airport_rows[1:])
+    try:
+        assert patched is not dataset and len(patched) == len(airport_rows) - 1
+    finally:
+        patched.close()
@@ -0,0 +1,56 @@
+import threading
+import business
+from .conftest import build_dataset
+
+"""
+Tests of the AirportSearchService: a dataset that is replaced is closed, but only once the parallel scans still running
+on it have finished.
+"""
+
+
+class BlockingScanner:
+    # stands in for a ParallelScanner, select() waits until the test lets it finish
+    def __init__(self):
+        self.started = threading.Event()
+        self.finish = threading.Event()
+        self.closed = False
+
+    def select(self, params, answered):
+        self.started.set()
+        assert self.finish.wait(5)
+        assert not self.closed
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+def test_replaced_dataset_is_closed(airport_rows):
+    service = business.AirportSearchService()
+    try:
+        old = service.dataset = build_dataset(airport_rows)
+        old.scanner = scanner = BlockingScanner()
+        service.dataset = build_dataset(airport_rows)
+        assert scanner.closed
+    finally:
+        service.shutdown()
+
+
+def test_replaced_dataset_is_closed_after_its_running_scan(airport_rows):
+    service = business.AirportSearchService()
+    try:
+        old = service.dataset = build_dataset(airport_rows)
+        old.scanner = scanner = BlockingScanner()
+        search = service.executor.submit(old.search, {'airport_name': 'Z'})
+        assert scanner.started.wait(5)
+        service.dataset = build_dataset(airport_rows)
+        assert not scanner.closed
+        scanner.finish.set()
+        search.result(timeout=5)
+        assert scanner.closed
+        # a search that still holds the replaced dataset scans it serially
+        scanner.started.clear()
+        assert old.search({'airport_name': 'Z'}) == build_dataset(airport_rows).search({'airport_name': 'Z'})
+        assert not scanner.started.is_set()
+    finally:
+        service.shutdown()
@@ -0,0 +1,105 @@
+import mmap
+import zlib
+import pytest
+from benchmarks.fixtures import synthetic_airports_dat
+import business
+import dal
+from exceptions import DalException
+
+"""
+Tests of the dataset snapshot: a snapshot that is truncated, isn't a snapshot, has another version, fails its checksum
+or has a bad directory is rejected with the file unmapped, and the service rebuilds it from the cached airports.dat.
+"""
+
+URL = 'http://localhost/airports.dat'
+ROW_COUNT = 500
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = dal.DatasetCache(str(tmp_path))
+    cache.store(URL, synthetic_airports_dat(ROW_COUNT), {})
+    return cache
+
+
+@pytest.fixture
+def snapshot_path(cache):
+    service = business.AirportSearchService(URL, cache=cache)
+    try:
+        assert service.restore()
+    finally:
+        service.shutdown()
+    path = cache.snapshot_path(URL)
+    assert business.load_snapshot(path, cache.fingerprint(URL)) is not None
+    return path
+
+
+@pytest.fixture
+def mappings(monkeypatch):
+    opened = []
+    real_mmap = mmap.mmap
+
+    def recording_mmap(*args, **kwargs):
+        opened.append(real_mmap(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(mmap, 'mmap', recording_mmap)
+    return opened
+
+
+def truncate(data):
+    return data[:dal.snapshot.HEADER.size - 1]
+
+
+def bad_magic(data):
+    return b'NOTASNAP' + data[8:]
+
+
+def other_version(data):
+    _, version, directory_length, checksum = dal.snapshot.HEADER.unpack_from(data)
+    return dal.snapshot.HEADER.pack(dal.snapshot.MAGIC, version + 1, directory_length, checksum) + \
+        data[dal.snapshot.HEADER.size:]
+
+
+def flip_last_byte(data):
+    return data[:-1] + bytes([data[-1] ^ 0xff])
+
+
+def bad_directory(data):
+    # a directory that isn't json, with a checksum that matches it
+    body = b'{"sections": ' + data[dal.snapshot.HEADER.size:]
+    return dal.snapshot.HEADER.pack(dal.snapshot.MAGIC, business.SNAPSHOT_VERSION, 13, zlib.crc32(body)) + body
+
+
+@pytest.mark.parametrize('corrupt', [truncate, bad_magic, other_version, flip_last_byte, bad_directory])
+def test_corrupt_snapshot_is_rejected_and_unmapped(snapshot_path, mappings, corrupt):
+    with open(snapshot_path, 'rb') as file:
+        data = file.read()
+    with open(snapshot_path, 'wb') as file:
+        file.write(corrupt(data))
+    with pytest.raises(DalException):
+        dal.read_snapshot(snapshot_path, business.SNAPSHOT_VERSION)
+    assert all(mapping.closed for mapping in mappings)
+
+
+def test_snapshot_of_other_data_is_unmapped(cache, snapshot_path, mappings):
+    assert business.load_snapshot(snapshot_path, 'another source') is None
+    assert mappings and all(mapping.closed for mapping in mappings)
+
+
+def test_corrupt_snapshot_is_rebuilt(cache, snapshot_path):
+    with open(snapshot_path, 'r+b') as file:
+        file.seek(-1, 2)
+        last = file.read(1)
+        file.seek(-1, 2)
+        file.write(bytes([last[0] ^ 0xff]))
+    assert business.load_snapshot(snapshot_path, cache.fingerprint(URL)) is None
+    service = business.AirportSearchService(URL, cache=cache)
+    try:
+        assert service.restore()
+        assert len(service) == ROW_COUNT
+    finally:
+        service.shutdown()
+    rebuilt = business.load_snapshot(snapshot_path, cache.fingerprint(URL))
+    assert rebuilt is not None and len(rebuilt) == ROW_COUNT
+    rebuilt.close()
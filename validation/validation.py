@@ -13,6 +13,8 @@ Methods:
         determines if a user's input is a float
     is_positive_int(value):
         determines if a value is a positive integer
+    is_positive_float(value):
+        determines if a value is a positive number
     validate_utc(value):
         validates the UTC entry from the gui
 
@@ -99,6 +101,20 @@ def is_positive_int(value):
         return False
 
 
+def is_positive_float(value):
+    """
+    determines if a value is a positive number
+    :param value: value to test
+    :return: true if value is a positive number, false if not
+    """
+    if not is_float(value):
+        return False
+    if float(value) > 0:
+        return True
+    else:
+        return False
+
+
 def validate_utc(value):
     """
     validates the UTC entry from the gui